@@ -0,0 +1,110 @@
+"""Precomputed OpenAPI schema
+
+drf_yasg introspects every serializer and viewset to build the schema,
+so it is generated once per code version (lazily, on first request),
+stored in ``OPENAPI_SCHEMA_DIR`` and served from disk with an ETag. The
+schemas of other code versions are deleted once the current one is
+written; processes still running older code keep theirs in memory.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.generators import OpenAPISchemaGenerator
+
+API_INFO = openapi.Info(
+    title="Snippets API",
+    default_version="v1",
+    description="Test description",
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email="contact@snippets.local"),
+    license=openapi.License(name="BSD License"),
+)
+
+CODECS = {
+    ".json": (OpenAPICodecJson, "application/json"),
+    ".yaml": (OpenAPICodecYaml, "application/yaml"),
+}
+
+_lock = threading.Lock()
+_loaded = {}
+
+
+def get_code_version():
+    """Version of the deployed code, keying the stored schema"""
+    if settings.CODE_VERSION:
+        return settings.CODE_VERSION
+    try:
+        return version("dj_sinp_metadata")
+    except PackageNotFoundError:
+        return "dev"
+
+
+def get_schema_path(format):
+    directory = Path(settings.OPENAPI_SCHEMA_DIR)
+    return directory / f"schema-{get_code_version()}{format}"
+
+
+def prune_schemas(format):
+    """Delete the stored schemas of other code versions"""
+    current = get_schema_path(format)
+    for path in current.parent.glob(f"schema-*{format}"):
+        if path != current:
+            path.unlink(missing_ok=True)
+
+
+def write_schema(format):
+    """Generate the schema and store it atomically
+
+    Returns:
+        bytes: encoded schema
+    """
+    generator = OpenAPISchemaGenerator(API_INFO)
+    schema = generator.get_schema(request=None, public=True)
+    content = CODECS[format][0](validators=[]).encode(schema)
+    path = get_schema_path(format)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as tmp:
+        tmp.write(content)
+    os.replace(tmp.name, path)
+    prune_schemas(format)
+    return content
+
+
+def load_schema(format):
+    """Stored schema and its ETag, generating it when missing
+
+    Returns:
+        tuple: encoded schema and ETag
+    """
+    path = get_schema_path(format)
+    if path not in _loaded:
+        with _lock:
+            if path not in _loaded:
+                if path.exists():
+                    content = path.read_bytes()
+                else:
+                    content = write_schema(format)
+                etag = f'"{hashlib.sha256(content).hexdigest()}"'
+                _loaded[path] = (content, etag)
+    return _loaded[path]
+
+
+def schema_view(request, format):
+    content, etag = load_schema(format)
+    if etag in request.headers.get("If-None-Match", ""):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type=CODECS[format][1])
+    response["ETag"] = etag
+    patch_cache_control(response, public=True, max_age=3600)
+    return response
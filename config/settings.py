@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 
 from pathlib import Path
 
-from decouple import config
+from decouple import Csv, config
 from dj_database_url import parse as db_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -95,6 +95,14 @@ AUTHENTICATION_BACKENDS = (
     "guardian.backends.ObjectPermissionBackend",
 )
 
+REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "sinp_metadata.authentication.CachedTokenAuthentication",
+        "rest_framework.authentication.SessionAuthentication",
+        "rest_framework.authentication.BasicAuthentication",
+    ],
+}
+
 ROOT_URLCONF = "config.urls"
 
 TEMPLATES = [
@@ -132,6 +140,14 @@ DATABASES = {
     )
 }
 
+# Optional read replica, used for metadata reads (lists, exports, search)
+DATABASE_REPLICA_URL = config("DATABASE_REPLICA_URL", default="")
+if DATABASE_REPLICA_URL:
+    DATABASES["replica"] = db_url(DATABASE_REPLICA_URL)
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+    DATABASE_ROUTERS = ["sinp_metadata.routers.MetadataReplicaRouter"]
+    SINP_METADATA_REPLICA_DATABASE = "replica"
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -181,6 +197,9 @@ USE_TZ = True
 
 STATIC_URL = "/static/"
 
+MEDIA_URL = "/media/"
+MEDIA_ROOT = config("MEDIA_ROOT", default=str(BASE_DIR / "media"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -194,3 +213,28 @@ EMAIL_HOST_USER = config("EMAIL_HOST_USER", default="username@email.net")
 EMAIL_USE_TLS = config("EMAIL_USE_TLS", cast=bool, default=True)
 
 GEODATA_SRID = config("GEODATA_SRID", cast=int, default=4326)
+
+# Version of the deployed code, used to regenerate the stored API schema
+CODE_VERSION = config("CODE_VERSION", default="")
+OPENAPI_SCHEMA_DIR = config(
+    "OPENAPI_SCHEMA_DIR", default=str(BASE_DIR / "var" / "openapi")
+)
+# Nightly catalogue snapshots (see the create_snapshot command)
+SINP_METADATA_SNAPSHOT_DIR = config(
+    "SINP_METADATA_SNAPSHOT_DIR", default=str(BASE_DIR / "var" / "snapshots")
+)
+# Parquet/Arrow exports (see the export_columnar command)
+SINP_METADATA_COLUMNAR_DIR = config(
+    "SINP_METADATA_COLUMNAR_DIR", default=str(BASE_DIR / "var" / "columnar")
+)
+# Background job result files, served to their owner only
+SINP_METADATA_JOB_RESULT_DIR = config(
+    "SINP_METADATA_JOB_RESULT_DIR", default=str(BASE_DIR / "var" / "jobs")
+)
+# Change notifications pushed to partners (see the dispatch_outbox command)
+SINP_METADATA_OUTBOX_SINKS = config(
+    "SINP_METADATA_OUTBOX_SINKS", cast=Csv(), default=""
+)
+SINP_METADATA_OUTBOX_SECRET = config("SINP_METADATA_OUTBOX_SECRET", default="")
+SWAGGER_SETTINGS = {"SPEC_URL": ("schema-json", {"format": ".json"})}
+REDOC_SETTINGS = {"SPEC_URL": ("schema-json", {"format": ".json"})}
@@ -1,19 +1,41 @@
+from django import forms
+from django.contrib import messages
 from django.contrib.gis import admin
+from django.utils.translation import gettext_lazy as _
+
+from .cloning import clone_acquisition_framework
 
 # Register your models here.
 from .models import (
     AcquisitionFramework,
     ActorRole,
+    ApiToken,
     Dataset,
+    Job,
     Keyword,
     Project,
     Publication,
+    normalize_keyword,
 )
 
 # from guardian.admin import GuardedModelAdmin
 
 
-class AcquisitionFrameworkAdmin(admin.ModelAdmin):
+class ActorRoleChoicesMixin:
+    """Load actor role choices with the relations shown by their label"""
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.related_model is ActorRole:
+            kwargs.setdefault("queryset", ActorRole.objects.with_display())
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        if db_field.related_model is ActorRole:
+            kwargs.setdefault("queryset", ActorRole.objects.with_display())
+        return super().formfield_for_manytomany(db_field, request, **kwargs)
+
+
+class AcquisitionFrameworkAdmin(ActorRoleChoicesMixin, admin.ModelAdmin):
     list_display = (
         "id",
         "uuid",
@@ -27,6 +49,21 @@ class AcquisitionFrameworkAdmin(admin.ModelAdmin):
         "uuid",
         "label",
     )
+    actions = ["clone"]
+
+    @admin.action(description=_("Copy with datasets"))
+    def clone(self, request, queryset):
+        for acquisition_framework in queryset:
+            try:
+                clone = clone_acquisition_framework(
+                    acquisition_framework, user=request.user
+                )
+            except ValueError as e:
+                self.message_user(
+                    request, f"{acquisition_framework}: {e}", messages.ERROR
+                )
+            else:
+                self.message_user(request, f"{clone} created")
 
 
 class DatasetAdmin(admin.ModelAdmin):
@@ -39,6 +76,7 @@ class DatasetAdmin(admin.ModelAdmin):
         "timestamp_update",
     )
     list_filter = ("label", "acquisition_framework", "active")
+    list_select_related = ("acquisition_framework",)
     search_fields = ("uuid", "label")
 
 
@@ -56,10 +94,40 @@ class ActorRoleAdmin(admin.ModelAdmin):
         "timestamp_update",
     )
     list_filter = ("organism", "actor_role", "anonymization")
+    list_select_related = ("organism", "legal_person", "actor_role")
     search_fields = ("uuid", "legal_person", "organism")
 
 
-class ProjectAdmin(admin.ModelAdmin):
+class KeywordForm(forms.ModelForm):
+    """Reject keywords only differing by case, accents or spaces from an
+    existing one"""
+
+    class Meta:
+        model = Keyword
+        fields = ["keyword"]
+
+    def clean_keyword(self):
+        keyword = " ".join(self.cleaned_data["keyword"].split())
+        duplicate = (
+            Keyword.objects.filter(normalized=normalize_keyword(keyword))
+            .exclude(pk=self.instance.pk)
+            .first()
+        )
+        if duplicate is not None:
+            raise forms.ValidationError(
+                _("Same keyword as « %(keyword)s »."),
+                params={"keyword": duplicate.keyword},
+            )
+        return keyword
+
+
+class KeywordAdmin(admin.ModelAdmin):
+    form = KeywordForm
+    list_display = ("keyword", "normalized", "timestamp_update")
+    search_fields = ("keyword", "normalized")
+
+
+class ProjectAdmin(ActorRoleChoicesMixin, admin.ModelAdmin):
     list_display = (
         "id",
         "uuid",
@@ -68,13 +136,54 @@ class ProjectAdmin(admin.ModelAdmin):
         "timestamp_update",
     )
     list_filter = ("contact",)
+    list_select_related = (
+        "contact__organism",
+        "contact__legal_person",
+        "contact__actor_role",
+    )
     search_fields = ("uuid", "label")
 
 
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "kind",
+        "status",
+        "progress",
+        "created_by",
+        "timestamp_create",
+        "finished_at",
+    )
+    list_filter = ("kind", "status")
+    search_fields = ("uuid", "kind")
+
+
+class ApiTokenAdmin(admin.ModelAdmin):
+    """Tokens are created with the ``create_api_token`` command"""
+
+    list_display = (
+        "prefix",
+        "label",
+        "user",
+        "created_at",
+        "expires_at",
+        "revoked",
+    )
+    list_filter = ("revoked",)
+    list_select_related = ("user",)
+    search_fields = ("prefix", "label", "user__username")
+    readonly_fields = ("user", "prefix", "created_at")
+
+    def has_add_permission(self, request):
+        return False
+
+
 # Register your models here.
-admin.site.register(Project, admin.ModelAdmin)
+admin.site.register(Project, ProjectAdmin)
 admin.site.register(AcquisitionFramework, AcquisitionFrameworkAdmin)
 admin.site.register(Dataset, DatasetAdmin)
 admin.site.register(ActorRole, ActorRoleAdmin)
 admin.site.register(Publication)
-admin.site.register(Keyword)
+admin.site.register(Keyword, KeywordAdmin)
+admin.site.register(Job, JobAdmin)
+admin.site.register(ApiToken, ApiTokenAdmin)
@@ -0,0 +1,115 @@
+"""Actor roles display projection, honouring ``ActorRole.anonymization``
+
+Display values are cached per actor role until an actor role, an
+organism or a user changes. They are read with one cache request for a
+set of actor roles, and the missing ones are computed with one query, so
+serializers and exports never resolve actors row by row.
+"""
+
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import make_keys
+from .models import ActorRole
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAMESPACE = "actor_displays"
+
+ANONYMIZED_NAME = "Anonyme"
+LEGAL_ENTITY = "Personne morale"
+NATURAL_PERSON = "Personne physique"
+
+
+def get_cache_timeout():
+    """Lifetime of cached display values, in seconds (one day by default)"""
+    return getattr(
+        settings, "SINP_METADATA_ACTOR_DISPLAYS_CACHE_TIMEOUT", 86400
+    )
+
+
+def build_actor_displays(pks=None):
+    """Compute display values of actor roles
+
+    Args:
+        pks (iterable, optional): actor roles primary keys, all if None
+
+    Returns:
+        dict: display dicts (``name``, ``actor_type``, ``actor_role_label``)
+        by actor role primary key
+    """
+    qs = ActorRole.objects.all()
+    if pks is not None:
+        qs = qs.filter(pk__in=pks)
+    displays = {}
+    for row in qs.values(
+        "pk",
+        "anonymization",
+        "organism_id",
+        "organism__label",
+        "legal_person_id",
+        "legal_person__username",
+        "actor_role__label",
+    ):
+        if row["organism_id"]:
+            actor_type, name = LEGAL_ENTITY, row["organism__label"]
+        elif row["legal_person_id"]:
+            actor_type, name = NATURAL_PERSON, row["legal_person__username"]
+        else:
+            actor_type, name = None, None
+        displays[row["pk"]] = {
+            "name": ANONYMIZED_NAME if row["anonymization"] else name,
+            "actor_type": actor_type,
+            "actor_role_label": row["actor_role__label"],
+        }
+    return displays
+
+
+def get_actor_displays(pks):
+    """Cached display values of actor roles
+
+    Missing values are computed in one query and cached.
+
+    Args:
+        pks (iterable): actor roles primary keys
+
+    Returns:
+        dict: display dicts by actor role primary key, unknown actor roles
+        left out
+    """
+    keys = make_keys(CACHE_NAMESPACE, set(pks))
+    if not keys:
+        return {}
+    displays = {
+        keys[key]: value for key, value in cache.get_many(keys).items()
+    }
+    missing = set(keys.values()) - displays.keys()
+    if missing:
+        built = build_actor_displays(missing)
+        cache.set_many(
+            {key: built[pk] for key, pk in keys.items() if pk in built},
+            get_cache_timeout(),
+        )
+        displays.update(built)
+    return displays
+
+
+def get_actor_display(actor_role_id, displays=None):
+    """Display values of one actor role
+
+    Args:
+        actor_role_id (int): actor role primary key
+        displays (dict, optional): already loaded displays, completed
+            with the actor role
+
+    Returns:
+        dict: display dict, or None for an unknown actor role
+    """
+    if displays is not None and actor_role_id in displays:
+        return displays[actor_role_id]
+    display = get_actor_displays([actor_role_id]).get(actor_role_id)
+    if displays is not None and display is not None:
+        displays[actor_role_id] = display
+    return display
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class SinpMetadataConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "sinp_metadata"
+
+    def ready(self):
+        from . import (  # noqa: F401
+            columnar,
+            conformance,
+            signals,
+            snapshots,
+            statistics,
+        )
@@ -0,0 +1,154 @@
+"""Token authentication resolved from a cached principal
+
+``Authorization: Token <key>`` requests are authenticated without any
+query in the steady state: the token resolves to a cached principal
+holding the user fields and organism ids, from which the user instance
+is rebuilt. Principals are invalidated when users, organism memberships
+or tokens change (see :mod:`sinp_metadata.signals`).
+
+Enable it in the project settings::
+
+    REST_FRAMEWORK = {
+        "DEFAULT_AUTHENTICATION_CLASSES": [
+            "sinp_metadata.authentication.CachedTokenAuthentication",
+            "rest_framework.authentication.SessionAuthentication",
+        ],
+    }
+    SINP_METADATA_PRINCIPAL_CACHE_TIMEOUT = 300
+"""
+
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.cache import cache
+from django.db import router
+from django.utils.timezone import now
+from rest_framework.authentication import (
+    BaseAuthentication,
+    get_authorization_header,
+)
+from rest_framework.exceptions import AuthenticationFailed
+from sinp_organisms.models import OrganismMember
+
+from .cache import bump_generation, make_key
+from .models import ApiToken
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+CACHE_NAMESPACE = "principals"
+KEYWORD = b"token"
+
+
+def get_cache_timeout():
+    return getattr(settings, "SINP_METADATA_PRINCIPAL_CACHE_TIMEOUT", 300)
+
+
+def invalidate_principals():
+    """Drop every cached principal, once committed"""
+    bump_generation(CACHE_NAMESPACE)
+
+
+def load_principal(digest):
+    """Principal of a token, from the database
+
+    Returns:
+        dict: token id and expiration, user field values and organism
+        ids, None if the token is unknown, revoked or its user inactive
+    """
+    token = (
+        ApiToken.objects.select_related("user")
+        .filter(key_digest=digest, revoked=False, user__is_active=True)
+        .first()
+    )
+    if token is None:
+        return None
+    fields = [
+        field.attname
+        for field in User._meta.concrete_fields
+        if field.name != "password"
+    ]
+    return {
+        "token_id": token.pk,
+        "expires_at": token.expires_at,
+        "fields": {name: getattr(token.user, name) for name in fields},
+        "organism_ids": list(
+            OrganismMember.objects.filter(member=token.user).values_list(
+                "organism_id", flat=True
+            )
+        ),
+    }
+
+
+def get_principal(key):
+    """Cached principal of a token key (see :func:`load_principal`)"""
+    digest = ApiToken.digest(key)
+    cache_key = make_key(CACHE_NAMESPACE, digest)
+    principal = cache.get(cache_key)
+    if principal is None:
+        principal = load_principal(digest)
+        if principal is None:
+            return None
+        cache.set(cache_key, principal, get_cache_timeout())
+    return principal
+
+
+def build_user(principal):
+    """User instance rebuilt from a principal, without query
+
+    The password is deferred. ``organism_ids`` holds the ids of the
+    user's organisms.
+    """
+    fields = principal["fields"]
+    user = User.from_db(
+        router.db_for_read(User), list(fields), list(fields.values())
+    )
+    user.organism_ids = frozenset(principal["organism_ids"])
+    return user
+
+
+def has_token(request):
+    auth = get_authorization_header(request).split()
+    return bool(auth) and auth[0].lower() == KEYWORD
+
+
+class CachedTokenAuthentication(BaseAuthentication):
+    """``Authorization: Token <key>`` authentication"""
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != KEYWORD:
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed("Invalid token header.")
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed("Invalid token header.")
+        principal = get_principal(key)
+        if principal is None:
+            raise AuthenticationFailed("Invalid token.")
+        expires_at = principal["expires_at"]
+        if expires_at is not None and expires_at <= now():
+            raise AuthenticationFailed("Token has expired.")
+        return build_user(principal), principal["token_id"]
+
+    def authenticate_header(self, request):
+        return "Token"
+
+
+class LoginOrTokenRequiredMixin(LoginRequiredMixin):
+    """``LoginRequiredMixin`` letting token requests through
+
+    Token requests are authenticated by the API view itself.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if has_token(request):
+            return super(LoginRequiredMixin, self).dispatch(
+                request, *args, **kwargs
+            )
+        return super().dispatch(request, *args, **kwargs)
@@ -0,0 +1,420 @@
+"""Batch writes for frameworks and datasets
+
+A batch is validated in one pass (related objects are loaded once per
+field, uniqueness is checked once per field) and applied with
+``bulk_create``/``bulk_update`` and bulk through-table writes in a single
+transaction. Nothing is written if any item is invalid.
+"""
+
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import ProtectedError
+from django.utils.timezone import now
+from rest_framework import status
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.relations import ManyRelatedField, RelatedField
+from rest_framework.response import Response
+
+from .deletion import delete_records, preview_deletion
+from .permissions import filter_editable, get_editable_pks
+from .signals import bulk_changed
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def get_max_items():
+    return getattr(settings, "SINP_METADATA_BULK_MAX_ITEMS", 1000)
+
+
+class BulkWriter:
+    """Validate and apply a batch of items for one model
+
+    Args:
+        serializer_class: flat ModelSerializer used to validate each item
+        queryset (QuerySet): records the caller may update or delete
+        user (User, optional): author of the changes
+        context (dict, optional): serializer context
+    """
+
+    def __init__(self, serializer_class, queryset, user=None, context=None):
+        self.serializer_class = serializer_class
+        self.queryset = queryset
+        self.model = queryset.model
+        self.user = user if user and user.is_authenticated else None
+        self.context = dict(context or {})
+        self.m2m_names = [f.name for f in self.model._meta.many_to_many]
+
+    def get_instances(self, items):
+        """Load the records targeted by ``id`` keys in one query
+
+        Returns:
+            tuple: instances list and per item errors
+        """
+        errors = []
+        ids = []
+        seen = set()
+        for index, item in enumerate(items):
+            pk = item.get("id") if isinstance(item, dict) else item
+            try:
+                pk = self.model._meta.pk.to_python(pk)
+            except Exception:
+                pk = None
+            if pk is None:
+                errors.append({"index": index, "errors": {"id": ["Invalid."]}})
+            elif pk in seen:
+                errors.append(
+                    {
+                        "index": index,
+                        "errors": {"id": ["Duplicated in batch."]},
+                    }
+                )
+            seen.add(pk)
+            ids.append(pk)
+        found = self.queryset.in_bulk([pk for pk in ids if pk is not None])
+        instances = []
+        for index, pk in enumerate(ids):
+            instance = found.get(pk)
+            if instance is None and pk is not None:
+                errors.append(
+                    {"index": index, "errors": {"id": ["Not found."]}}
+                )
+            instances.append(instance)
+        return instances, errors
+
+    def preload_related(self, items):
+        """Load every object referenced by the batch, once per field
+
+        Returns:
+            dict: ``{field_name: {pk: object}}``
+        """
+        fields = self.serializer_class(context=self.context).fields
+        related = {}
+        for name, field in fields.items():
+            if field.read_only:
+                continue
+            if isinstance(field, ManyRelatedField):
+                queryset = field.child_relation.get_queryset()
+            elif isinstance(field, RelatedField):
+                queryset = field.get_queryset()
+            else:
+                continue
+            pks = set()
+            for item in items:
+                value = item.get(name) if isinstance(item, dict) else None
+                values = value if isinstance(value, list) else [value]
+                for pk in values:
+                    try:
+                        pk = queryset.model._meta.pk.to_python(pk)
+                    except Exception:
+                        continue
+                    if pk is not None:
+                        pks.add(pk)
+            related[name] = queryset.in_bulk(pks) if pks else {}
+        return related
+
+    def get_editable_related(self, related):
+        """Edit rights on the records referenced by checked relations,
+        one query per field (see
+        :class:`~sinp_metadata.serializers.EditableRelationsMixin`)
+
+        Returns:
+            dict: ``{field_name: editable primary keys}``
+        """
+        request = self.context.get("request")
+        if request is None:
+            return {}
+        return {
+            name: get_editable_pks(
+                request.user,
+                self.model._meta.get_field(name).related_model,
+                related.get(name, {}),
+            )
+            for name in getattr(
+                self.serializer_class, "editable_relations", ()
+            )
+        }
+
+    def validate(self, items, instances=None, partial=False):
+        """Validate every item of a batch
+
+        Returns:
+            tuple: validated data list and per item errors
+        """
+        related = self.preload_related(items)
+        context = {
+            **self.context,
+            "related_objects": related,
+            "editable_related": self.get_editable_related(related),
+        }
+        validated = []
+        errors = []
+        for index, item in enumerate(items):
+            instance = instances[index] if instances else None
+            serializer = self.serializer_class(
+                instance, data=item, partial=partial, context=context
+            )
+            if serializer.is_valid():
+                validated.append(serializer.validated_data)
+            else:
+                validated.append(None)
+                errors.append({"index": index, "errors": serializer.errors})
+        errors.extend(self.check_unique(validated, instances))
+        return validated, errors
+
+    def check_unique(self, validated, instances=None):
+        """Check unique fields for the whole batch, one query per field"""
+        errors = []
+        instances = instances or [None] * len(validated)
+        for field in self.model._meta.concrete_fields:
+            if not field.unique or field.primary_key or not field.editable:
+                continue
+            values = {}
+            for index, data in enumerate(validated):
+                if data is None or field.name not in data:
+                    continue
+                value = data[field.name]
+                if value in values:
+                    errors.append(
+                        {
+                            "index": index,
+                            "errors": {field.name: ["Duplicated in batch."]},
+                        }
+                    )
+                else:
+                    values[value] = index
+            if not values:
+                continue
+            taken = self.model._default_manager.filter(
+                **{f"{field.name}__in": list(values)}
+            ).values_list("pk", field.name)
+            for pk, value in taken:
+                index = values[value]
+                # A record may keep its value; values released by other
+                # batch records are still taken when rows are updated
+                if instances[index] is not None and instances[index].pk == pk:
+                    continue
+                errors.append(
+                    {
+                        "index": index,
+                        "errors": {field.name: ["Already exists."]},
+                    }
+                )
+        return errors
+
+    def split_m2m(self, data):
+        data = dict(data)
+        m2m = {name: data.pop(name) for name in self.m2m_names if name in data}
+        return data, m2m
+
+    def write_m2m(self, objects, m2m_data, replace=False):
+        """Write through-table rows, one bulk query per field"""
+        by_field = defaultdict(list)
+        for obj, data in zip(objects, m2m_data):
+            for name, targets in data.items():
+                by_field[name].append((obj, targets))
+        for name, pairs in by_field.items():
+            field = self.model._meta.get_field(name)
+            through = field.remote_field.through
+            source = through._meta.get_field(field.m2m_field_name()).attname
+            target = through._meta.get_field(
+                field.m2m_reverse_field_name()
+            ).attname
+            if replace:
+                through.objects.filter(
+                    **{f"{source}__in": [obj.pk for obj, _ in pairs]}
+                ).delete()
+            through.objects.bulk_create(
+                [
+                    through(**{source: obj.pk, target: related.pk})
+                    for obj, targets in pairs
+                    for related in dict.fromkeys(targets)
+                ],
+                batch_size=BATCH_SIZE,
+            )
+
+    def create(self, validated):
+        """Insert validated items
+
+        Returns:
+            list: created objects
+        """
+        objects = []
+        m2m_data = []
+        for data in validated:
+            data, m2m = self.split_m2m(data)
+            obj = self.model(**data)
+            obj.created_by = obj.updated_by = self.user
+            objects.append(obj)
+            m2m_data.append(m2m)
+        with transaction.atomic():
+            self.model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+            if any(obj.pk is None for obj in objects):
+                # Backend can't return primary keys from bulk inserts
+                pks = dict(
+                    self.model.objects.filter(
+                        uuid__in=[obj.uuid for obj in objects]
+                    ).values_list("uuid", "pk")
+                )
+                for obj in objects:
+                    obj.pk = pks[obj.uuid]
+            self.write_m2m(objects, m2m_data)
+            bulk_changed.send(
+                sender=self.model,
+                pks=[obj.pk for obj in objects],
+                action="create",
+                m2m_fields=self.m2m_names,
+            )
+        return objects
+
+    def update(self, instances, validated):
+        """Update instances with validated items
+
+        Returns:
+            list: updated objects
+        """
+        fields = {"updated_by", "timestamp_update"}
+        m2m_data = []
+        timestamp = now()
+        for obj, data in zip(instances, validated):
+            data, m2m = self.split_m2m(data)
+            for name, value in data.items():
+                setattr(obj, name, value)
+            fields.update(data)
+            obj.updated_by = self.user
+            obj.timestamp_update = timestamp
+            m2m_data.append(m2m)
+        with transaction.atomic():
+            self.model.objects.bulk_update(
+                instances, sorted(fields), batch_size=BATCH_SIZE
+            )
+            self.write_m2m(instances, m2m_data, replace=True)
+            bulk_changed.send(
+                sender=self.model,
+                pks=[obj.pk for obj in instances],
+                action="update",
+                m2m_fields=sorted({n for m2m in m2m_data for n in m2m}),
+            )
+        return instances
+
+    def delete(self, instances):
+        """Delete instances and their cascade with set-based statements
+
+        Raises:
+            ValidationError: protected rows reference the instances
+
+        Returns:
+            int: number of deleted records
+        """
+        try:
+            delete_records(
+                self.model, [obj.pk for obj in instances], user=self.user
+            )
+        except ProtectedError as e:
+            raise ValidationError({"errors": [e.args[0]]})
+        return len(instances)
+
+
+class BulkWriteMixin:
+    """Viewset mixin adding batch create/update/partial update/delete
+
+    Requests carry a JSON array; update and delete items are identified by
+    ``id`` (delete also accepts bare ids). Targeted records are those of
+    the viewset queryset, and must be editable by the user (see
+    :func:`~sinp_metadata.permissions.filter_editable`).
+    """
+
+    bulk_serializer_class = None
+
+    def get_bulk_writer(self):
+        return BulkWriter(
+            self.bulk_serializer_class,
+            self.get_queryset(),
+            user=self.request.user,
+            context=self.get_serializer_context(),
+        )
+
+    def get_bulk_items(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({"errors": ["Expected a list of items."]})
+        if len(items) > get_max_items():
+            raise ValidationError(
+                {"errors": [f"At most {get_max_items()} items allowed."]}
+            )
+        return items
+
+    @staticmethod
+    def bulk_results(objects):
+        return {
+            "results": [
+                {"index": index, "id": obj.pk, "uuid": obj.uuid}
+                for index, obj in enumerate(objects)
+            ]
+        }
+
+    def get_bulk_instances(self, writer, items):
+        instances, errors = writer.get_instances(items)
+        if errors:
+            raise ValidationError({"errors": errors})
+        editable = set(
+            filter_editable(writer.queryset, self.request.user)
+            .filter(pk__in=[obj.pk for obj in instances])
+            .values_list("pk", flat=True)
+        )
+        errors = [
+            {"index": index, "errors": {"id": ["Not allowed to edit."]}}
+            for index, obj in enumerate(instances)
+            if obj.pk not in editable
+        ]
+        if errors:
+            raise PermissionDenied({"errors": errors})
+        # Read by object permissions instead of one query per record
+        self.editable_pks = editable
+        for instance in instances:
+            self.check_object_permissions(self.request, instance)
+        return instances
+
+    def bulk_create(self, request, *args, **kwargs):
+        items = self.get_bulk_items(request)
+        writer = self.get_bulk_writer()
+        validated, errors = writer.validate(items)
+        if errors:
+            raise ValidationError({"errors": errors})
+        objects = writer.create(validated)
+        return Response(
+            self.bulk_results(objects), status=status.HTTP_201_CREATED
+        )
+
+    def bulk_update(self, request, *args, partial=False, **kwargs):
+        items = self.get_bulk_items(request)
+        writer = self.get_bulk_writer()
+        instances = self.get_bulk_instances(writer, items)
+        validated, errors = writer.validate(items, instances, partial=partial)
+        if errors:
+            raise ValidationError({"errors": errors})
+        objects = writer.update(instances, validated)
+        return Response(self.bulk_results(objects))
+
+    def bulk_partial_update(self, request, *args, **kwargs):
+        return self.bulk_update(request, *args, partial=True, **kwargs)
+
+    def bulk_destroy(self, request, *args, **kwargs):
+        items = self.get_bulk_items(request)
+        writer = self.get_bulk_writer()
+        instances = self.get_bulk_instances(writer, items)
+        deleted = writer.delete(instances)
+        return Response({"deleted": deleted})
+
+    def bulk_delete_preview(self, request, *args, **kwargs):
+        """Count what deleting a batch would remove, deleting nothing"""
+        items = self.get_bulk_items(request)
+        writer = self.get_bulk_writer()
+        instances = self.get_bulk_instances(writer, items)
+        return Response(
+            preview_deletion(writer.model, [obj.pk for obj in instances])
+        )
@@ -0,0 +1,92 @@
+"""Generation based cache helpers
+
+Cached values are stored under keys embedding a per-namespace generation
+number. Invalidating a namespace is a single counter increment: stale keys
+are never read again, and are evicted once their timeout elapses. Values
+must therefore always be cached with a finite timeout; only the generation
+counters are kept without one.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+
+KEY_PREFIX = "sinp_metadata"
+
+
+def _generation_key(namespace):
+    return f"{KEY_PREFIX}:{namespace}:generation"
+
+
+def get_generation(namespace):
+    """Current generation of a cache namespace
+
+    Args:
+        namespace (str): cache namespace
+
+    Returns:
+        int: generation number
+    """
+    key = _generation_key(namespace)
+    generation = cache.get(key)
+    if generation is None:
+        # Time based seed, so an evicted counter never reuses old keys
+        cache.add(key, int(time.time() * 1000), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(namespace):
+    """Invalidate every value cached in a namespace, once committed
+
+    Args:
+        namespace (str): cache namespace
+    """
+
+    def bump():
+        key = _generation_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(time.time() * 1000), None)
+
+    transaction.on_commit(bump)
+
+
+def make_key(namespace, *parts):
+    """Build a versioned cache key"""
+    suffix = ":".join(str(part) for part in parts)
+    return f"{KEY_PREFIX}:{namespace}:{get_generation(namespace)}:{suffix}"
+
+
+def make_keys(namespace, values):
+    """Versioned cache keys of several values of a namespace
+
+    Returns:
+        dict: values by key
+    """
+    generation = get_generation(namespace)
+    return {f"{KEY_PREFIX}:{namespace}:{generation}:{v}": v for v in values}
+
+
+def get_or_build(namespace, parts, builder, timeout=DEFAULT_TIMEOUT):
+    """Get a cached value, building and storing it on miss
+
+    Args:
+        namespace (str): cache namespace
+        parts (tuple): key parts identifying the value in the namespace
+        builder (callable): function computing the value
+        timeout (int, optional): cache timeout in seconds, the cache
+            default timeout if not given
+
+    Returns:
+        cached or built value
+    """
+    key = make_key(namespace, *parts)
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        cache.set(key, value, timeout)
+    return value
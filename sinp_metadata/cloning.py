@@ -0,0 +1,208 @@
+"""Deep copy of an acquisition framework with its datasets
+
+The copy is made in one transaction with a constant number of queries per
+table: datasets rows are inserted with ``bulk_create`` and every M2M link
+is copied with one read and one bulk insert per through table. Copies get
+fresh UUIDs and timestamps.
+"""
+
+import logging
+from copy import copy
+from uuid import uuid4
+
+from django.db import transaction
+
+from .models import AcquisitionFramework, Dataset
+from .signals import bulk_changed
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+DEFAULT_SUFFIX = " (copy)"
+# Default suffixes of the next copies of a same framework
+NUMBERED_SUFFIX = " (copy {})"
+MAX_COPIES = 100
+
+
+def _with_suffix(value, suffix, max_length):
+    return value[: max_length - len(suffix)] + suffix
+
+
+def _new_row(instance, user, **values):
+    row = copy(instance)
+    row.pk = None
+    row.uuid = uuid4()
+    row._state.adding = True
+    row.created_by = row.updated_by = user
+    for name, value in values.items():
+        setattr(row, name, value)
+    return row
+
+
+def _copy_datasets(datasets, user, suffix):
+    """Unsaved copies of datasets, with suffixed labels
+
+    Raises:
+        ValueError: copied labels are not unique, or already exist
+
+    Returns:
+        list: dataset copies
+    """
+    label_length = Dataset._meta.get_field("label").max_length
+    short_label_length = Dataset._meta.get_field("short_label").max_length
+    copies = [
+        _new_row(
+            dataset,
+            user,
+            label=_with_suffix(dataset.label, suffix, label_length),
+            short_label=_with_suffix(
+                dataset.short_label, suffix, short_label_length
+            ),
+        )
+        for dataset in datasets
+    ]
+    labels = [dataset.label for dataset in copies]
+    short_labels = [dataset.short_label for dataset in copies]
+    if len(set(labels)) < len(labels) or len(set(short_labels)) < len(
+        short_labels
+    ):
+        raise ValueError("Copied dataset labels would not be unique")
+    conflicts = Dataset.objects.filter(
+        label__in=labels
+    ) | Dataset.objects.filter(short_label__in=short_labels)
+    if conflicts.exists():
+        existing = ", ".join(sorted(conflicts.values_list("label", flat=True)))
+        raise ValueError(f"Datasets already exist: {existing}")
+    return copies
+
+
+def _copy_datasets_default_suffix(datasets, user):
+    """Copies of datasets, with the first default suffix still free
+
+    Returns:
+        tuple: dataset copies and their suffix
+    """
+    suffixes = [DEFAULT_SUFFIX] + [
+        NUMBERED_SUFFIX.format(number) for number in range(2, MAX_COPIES + 1)
+    ]
+    for suffix in suffixes[:-1]:
+        try:
+            return _copy_datasets(datasets, user, suffix), suffix
+        except ValueError:
+            continue
+    return _copy_datasets(datasets, user, suffixes[-1]), suffixes[-1]
+
+
+def copy_m2m(model, pk_map):
+    """Copy the M2M links of records to their copies
+
+    Args:
+        model: model of the copied records
+        pk_map (dict): copy pk by source pk
+
+    Returns:
+        list: names of the M2M fields having links
+    """
+    copied = []
+    for field in model._meta.many_to_many:
+        through = field.remote_field.through
+        source = field.m2m_field_name() + "_id"
+        target = field.m2m_reverse_field_name() + "_id"
+        rows = through.objects.filter(
+            **{f"{source}__in": list(pk_map)}
+        ).values_list(source, target)
+        links = [
+            through(**{source: pk_map[owner], target: value})
+            for owner, value in rows
+        ]
+        if links:
+            through.objects.bulk_create(links, batch_size=BATCH_SIZE)
+            copied.append(field.name)
+    return copied
+
+
+def clone_acquisition_framework(
+    acquisition_framework,
+    user=None,
+    label=None,
+    dataset_suffix=None,
+    **values,
+):
+    """Copy an acquisition framework, its datasets and their M2M links
+
+    Dataset labels and short labels are unique, so the copies get
+    ``dataset_suffix`` appended (truncating the original label if needed).
+    By default the suffix is ``" (copy)"``, or ``" (copy 2)"``,
+    ``" (copy 3)"``... for the next copies of the framework.
+
+    Args:
+        acquisition_framework (AcquisitionFramework): framework to copy
+        user (User, optional): author of the copy
+        label (str, optional): label of the copy, suffixed by default
+        dataset_suffix (str, optional): suffix of the datasets labels
+        **values: other field values of the framework copy (dates...)
+
+    Raises:
+        ValueError: copied datasets labels already exist
+
+    Returns:
+        AcquisitionFramework: the copy
+    """
+    datasets = list(
+        Dataset.objects.filter(acquisition_framework=acquisition_framework)
+    )
+    if dataset_suffix is None:
+        copies, suffix = _copy_datasets_default_suffix(datasets, user)
+    else:
+        copies = _copy_datasets(datasets, user, dataset_suffix)
+        suffix = DEFAULT_SUFFIX
+
+    if label is None:
+        label = _with_suffix(
+            acquisition_framework.label,
+            suffix,
+            AcquisitionFramework._meta.get_field("label").max_length,
+        )
+    with transaction.atomic():
+        clone = _new_row(acquisition_framework, user, label=label, **values)
+        clone.save()
+        af_fields = copy_m2m(
+            AcquisitionFramework, {acquisition_framework.pk: clone.pk}
+        )
+
+        for dataset in copies:
+            dataset.acquisition_framework = clone
+        Dataset.objects.bulk_create(copies, batch_size=BATCH_SIZE)
+        if any(dataset.pk is None for dataset in copies):
+            # Backends not returning inserted primary keys
+            pks = dict(
+                Dataset.objects.filter(
+                    uuid__in=[dataset.uuid for dataset in copies]
+                ).values_list("uuid", "pk")
+            )
+            for dataset in copies:
+                dataset.pk = pks[dataset.uuid]
+        pk_map = {
+            source.pk: dataset.pk for source, dataset in zip(datasets, copies)
+        }
+        ds_fields = copy_m2m(Dataset, pk_map)
+
+        if af_fields:
+            bulk_changed.send(
+                sender=AcquisitionFramework,
+                pks=[clone.pk],
+                action="update",
+                m2m_fields=af_fields,
+            )
+        if copies:
+            bulk_changed.send(
+                sender=Dataset,
+                pks=list(pk_map.values()),
+                action="create",
+                m2m_fields=ds_fields,
+            )
+    logger.info(
+        f"Acquisition framework {acquisition_framework.pk} cloned "
+        f"as {clone.pk} with {len(copies)} datasets"
+    )
+    return clone
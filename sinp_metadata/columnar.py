@@ -0,0 +1,389 @@
+"""Columnar (Parquet/Arrow IPC) export of the catalogue for analytics
+
+Frameworks and datasets are written as one table each, with a column per
+model field:
+
+* nomenclature foreign keys hold labels, dictionary encoded against the
+  nomenclatures actually referenced by the column;
+* other foreign keys hold the related primary key (``<field>_id``);
+* M2M fields are list typed (nomenclature labels or related primary keys);
+* ``bbox`` is WKB in WGS84, described by GeoParquet metadata.
+
+Rows are read from a server-side cursor and written one row group (record
+batch) at a time, so memory use is bounded by the batch size. Requires
+the optional ``pyarrow`` package.
+"""
+
+import json
+import logging
+import os
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import AsWKB, Transform
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+from sinp_nomenclatures.models import Nomenclature
+
+from .jobs import CATALOGUE_PERMISSION, register_job
+from .models import AcquisitionFramework, Dataset
+from .routers import use_replica
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10000
+WKB_SRID = 4326
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+TABLES = {
+    "acquisition_framework": AcquisitionFramework,
+    "dataset": Dataset,
+}
+INTEGER_TYPES = {
+    "AutoField",
+    "BigAutoField",
+    "SmallAutoField",
+    "IntegerField",
+    "BigIntegerField",
+    "SmallIntegerField",
+    "PositiveIntegerField",
+    "PositiveBigIntegerField",
+    "PositiveSmallIntegerField",
+}
+
+
+def get_export_dir():
+    return getattr(
+        settings,
+        "SINP_METADATA_COLUMNAR_DIR",
+        os.path.join(settings.MEDIA_ROOT, "metadata", "columnar"),
+    )
+
+
+def check_available():
+    if pa is None:
+        raise ImproperlyConfigured(
+            "The pyarrow package is required by columnar exports"
+        )
+
+
+def _value_type(field):
+    """Arrow type of a concrete, non relational field"""
+    internal_type = field.get_internal_type()
+    if internal_type in INTEGER_TYPES:
+        return pa.int64()
+    if internal_type == "BooleanField":
+        return pa.bool_()
+    if internal_type in ("FloatField", "DecimalField"):
+        return pa.float64()
+    if internal_type == "DateField":
+        return pa.date32()
+    if internal_type == "DateTimeField":
+        return pa.timestamp("us", tz="UTC")
+    return pa.string()
+
+
+def _converter(field):
+    internal_type = field.get_internal_type()
+    if internal_type in ("UUIDField", "JSONField"):
+        return lambda value: None if value is None else str(value)
+    if internal_type == "DecimalField":
+        return lambda value: None if value is None else float(value)
+    return None
+
+
+class Column:
+    """Exported column
+
+    Args:
+        name (str): column name
+        kind (str): ``value``, ``nomenclature``, ``list``,
+            ``nomenclature_list`` or ``geometry``
+        field: model field
+    """
+
+    def __init__(self, name, kind, field):
+        self.name = name
+        self.kind = kind
+        self.field = field
+        self.dictionary = None
+        self.indices = None
+
+    @property
+    def alias(self):
+        """Name of the column value in queried rows"""
+        return f"{self.name}_wkb" if self.kind == "geometry" else self.name
+
+    @property
+    def is_nomenclature(self):
+        return self.kind in ("nomenclature", "nomenclature_list")
+
+    def load_dictionary(self, model):
+        """Labels of the nomenclatures referenced by the column"""
+        if self.kind == "nomenclature":
+            referenced = model._base_manager.values(self.field.attname)
+        else:
+            through = self.field.remote_field.through
+            target = self.field.m2m_reverse_field_name() + "_id"
+            referenced = through.objects.values(target)
+        labels = {}
+        self.indices = {}
+        for pk, label in (
+            Nomenclature.objects.filter(pk__in=referenced)
+            .order_by("pk")
+            .values_list("pk", "label")
+        ):
+            self.indices[pk] = labels.setdefault(label, len(labels))
+        self.dictionary = pa.array(list(labels), pa.string())
+
+    def arrow_type(self):
+        if self.kind == "nomenclature":
+            return pa.dictionary(pa.int32(), pa.string())
+        if self.kind == "nomenclature_list":
+            return pa.list_(pa.dictionary(pa.int32(), pa.string()))
+        if self.kind == "list":
+            target = self.field.related_model._meta.pk
+            return pa.list_(_value_type(target))
+        if self.kind == "geometry":
+            return pa.binary()
+        if self.field.is_relation:
+            return _value_type(self.field.target_field)
+        return _value_type(self.field)
+
+    def arrow_field(self):
+        metadata = None
+        if self.kind == "geometry":
+            metadata = {"ARROW:extension:name": "geoarrow.wkb"}
+        return pa.field(self.name, self.arrow_type(), metadata=metadata)
+
+    def _encode(self, pks):
+        indices = pa.array([self.indices.get(pk) for pk in pks], pa.int32())
+        return pa.DictionaryArray.from_arrays(indices, self.dictionary)
+
+    def to_array(self, rows, links):
+        """Arrow array of the column for a batch
+
+        Args:
+            rows (list): batch rows (dicts of values)
+            links (dict): for M2M columns, related pks by row pk
+        """
+        if self.kind == "nomenclature":
+            return self._encode([row[self.field.attname] for row in rows])
+        if self.kind in ("list", "nomenclature_list"):
+            offsets, values = [0], []
+            for row in rows:
+                values.extend(links.get(row["pk"], ()))
+                offsets.append(len(values))
+            if self.kind == "nomenclature_list":
+                values = self._encode(values)
+            else:
+                values = pa.array(values, self.arrow_type().value_type)
+            return pa.ListArray.from_arrays(
+                pa.array(offsets, pa.int32()), values
+            )
+        if self.kind == "geometry":
+            return pa.array(
+                [
+                    None if row[self.alias] is None else bytes(row[self.alias])
+                    for row in rows
+                ],
+                pa.binary(),
+            )
+        values = [row[self.field.attname] for row in rows]
+        convert = None if self.field.is_relation else _converter(self.field)
+        if convert:
+            values = [convert(value) for value in values]
+        return pa.array(values, self.arrow_type())
+
+
+def get_columns(model):
+    columns = []
+    for field in model._meta.concrete_fields:
+        if isinstance(field, GeometryField):
+            columns.append(Column(field.name, "geometry", field))
+        elif field.is_relation and field.related_model is Nomenclature:
+            columns.append(Column(field.name, "nomenclature", field))
+        elif field.is_relation:
+            columns.append(Column(field.attname, "value", field))
+        else:
+            columns.append(Column(field.name, "value", field))
+    for field in model._meta.many_to_many:
+        kind = (
+            "nomenclature_list"
+            if field.related_model is Nomenclature
+            else "list"
+        )
+        columns.append(Column(field.name, kind, field))
+    return columns
+
+
+def get_schema(columns):
+    metadata = None
+    geometry_columns = [c.name for c in columns if c.kind == "geometry"]
+    if geometry_columns:
+        # GeoParquet 1.0, CRS defaults to OGC:CRS84 (WGS84 lon/lat)
+        metadata = {
+            "geo": json.dumps(
+                {
+                    "version": "1.0.0",
+                    "primary_column": geometry_columns[0],
+                    "columns": {
+                        name: {"encoding": "WKB", "geometry_types": []}
+                        for name in geometry_columns
+                    },
+                }
+            )
+        }
+    return pa.schema(
+        [column.arrow_field() for column in columns], metadata=metadata
+    )
+
+
+def _get_links(column, pks):
+    field = column.field
+    source = field.m2m_field_name() + "_id"
+    target = field.m2m_reverse_field_name() + "_id"
+    links = {}
+    for owner, value in (
+        field.remote_field.through.objects.filter(**{f"{source}__in": pks})
+        .order_by(source, target)
+        .values_list(source, target)
+    ):
+        links.setdefault(owner, []).append(value)
+    return links
+
+
+def _get_values(model, columns, batch_size):
+    names = ["pk"]
+    expressions = {}
+    for column in columns:
+        if column.kind == "geometry":
+            geometry = column.field.name
+            if column.field.srid != WKB_SRID:
+                geometry = Transform(geometry, WKB_SRID)
+            expressions[column.alias] = AsWKB(geometry)
+        elif column.kind in ("value", "nomenclature"):
+            names.append(column.field.attname)
+    return (
+        model._base_manager.order_by("pk")
+        .values(*names, **expressions)
+        .iterator(chunk_size=batch_size)
+    )
+
+
+def iter_batches(model, columns, batch_size=BATCH_SIZE):
+    """Record batches of a model table, read from a server-side cursor"""
+    schema = get_schema(columns)
+    m2m_columns = [c for c in columns if c.kind.endswith("list")]
+
+    def to_batch(batch):
+        pks = [row["pk"] for row in batch]
+        links = {c.name: _get_links(c, pks) for c in m2m_columns}
+        return pa.RecordBatch.from_arrays(
+            [c.to_array(batch, links.get(c.name, {})) for c in columns],
+            schema=schema,
+        )
+
+    batch = []
+    for row in _get_values(model, columns, batch_size):
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield to_batch(batch)
+            batch = []
+    if batch:
+        yield to_batch(batch)
+
+
+def export_table(model, path, format="parquet", batch_size=BATCH_SIZE):
+    """Write a model table as a Parquet or Arrow IPC file
+
+    Args:
+        model: exported model
+        path (Path): output file
+        format (str): ``parquet`` or ``arrow``
+        batch_size (int): rows per row group/record batch
+
+    Returns:
+        int: number of exported rows
+    """
+    check_available()
+    columns = get_columns(model)
+    for column in columns:
+        if column.is_nomenclature:
+            column.load_dictionary(model)
+    schema = get_schema(columns)
+    count = 0
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+    try:
+        if format == "parquet":
+            writer = pq.ParquetWriter(tmp_path, schema, compression="zstd")
+        else:
+            sink = pa.OSFile(str(tmp_path), "wb")
+            writer = pa.ipc.new_file(sink, schema)
+        try:
+            for batch in iter_batches(model, columns, batch_size):
+                writer.write_batch(batch)
+                count += batch.num_rows
+        finally:
+            writer.close()
+            if format != "parquet":
+                sink.close()
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return count
+
+
+def export_catalogue(directory=None, format="parquet", batch_size=BATCH_SIZE):
+    """Export frameworks and datasets tables in a directory
+
+    Args:
+        directory (str, optional): output directory, defaults to the
+            ``SINP_METADATA_COLUMNAR_DIR`` setting
+        format (str): ``parquet`` or ``arrow``
+        batch_size (int): rows per row group/record batch
+
+    Returns:
+        dict: exported rows count by table name
+    """
+    check_available()
+    if format not in FORMATS:
+        raise ValueError(f"Unknown columnar format {format!r}")
+    directory = Path(directory or get_export_dir())
+    directory.mkdir(parents=True, exist_ok=True)
+    counts = {}
+    with use_replica(pin_on_write=False):
+        for name, model in TABLES.items():
+            path = directory / f"{name}{FORMATS[format]}"
+            counts[name] = export_table(model, path, format, batch_size)
+    logger.info(f"Columnar {format} export to {directory}: {counts}")
+    return counts
+
+
+class ExportColumnarParams(serializers.Serializer):
+    format = serializers.ChoiceField(choices=list(FORMATS), default="parquet")
+    batch_size = serializers.IntegerField(
+        min_value=1, max_value=10 * BATCH_SIZE, default=BATCH_SIZE
+    )
+
+
+@register_job(
+    "export_columnar",
+    permission=CATALOGUE_PERMISSION,
+    params=ExportColumnarParams,
+)
+def export_columnar_job(job):
+    """Columnar export (``params``: format, batch_size)"""
+    counts = export_catalogue(
+        format=job.params.get("format", "parquet"),
+        batch_size=job.params.get("batch_size", BATCH_SIZE),
+    )
+    return ", ".join(f"{name}: {count} rows" for name, count in counts.items())
@@ -0,0 +1,328 @@
+"""SINP conformance checks of the whole catalogue
+
+Rules are expressed as querysets of failing records whenever possible
+(:class:`SetRule`), so each one is a single query over the catalogue.
+Rules needing Python (geometry checks) are :class:`RecordRule` and run in
+a process pool over id-range shards.
+
+Only records updated since their last check are checked again, unless a
+full run is requested. Results are stored per record in
+:class:`~sinp_metadata.models.ConformanceResult`.
+"""
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import connections, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils.timezone import now
+from rest_framework import serializers
+
+from .jobs import CATALOGUE_PERMISSION, WorkersField, register_job
+from .models import AcquisitionFramework, ConformanceResult, Dataset
+from .routers import use_replica
+
+logger = logging.getLogger(__name__)
+
+SHARD_SIZE = 2000
+BATCH_SIZE = 1000
+# "Contact principal" in the roleActeur nomenclature
+MAIN_CONTACT_ROLE_CODE = "1"
+
+
+class SetRule:
+    """Rule checked by a single query
+
+    Args:
+        code (str): rule code
+        message (str): error message
+        failing (callable): returns the failing records of a queryset
+    """
+
+    def __init__(self, code, message, failing):
+        self.code = code
+        self.message = message
+        self.failing = failing
+
+
+class RecordRule:
+    """Rule checked record by record, in worker processes
+
+    Args:
+        code (str): rule code
+        message (str): error message
+        fields (tuple): fields read by the check
+        check (callable): returns True if the record values conform
+    """
+
+    def __init__(self, code, message, fields, check):
+        self.code = code
+        self.message = message
+        self.fields = fields
+        self.check = check
+
+
+def valid_bbox(values):
+    bbox = values["bbox"]
+    if bbox is None:
+        return True  # See the bbox_required rule
+    if not bbox.valid or bbox.area == 0:
+        return False
+    lon_min, lat_min, lon_max, lat_max = bbox.transform(
+        4326, clone=True
+    ).extent
+    return (
+        -180 <= lon_min <= lon_max <= 180 and -90 <= lat_min <= lat_max <= 90
+    )
+
+
+RULES = {
+    ConformanceResult.ACQUISITION_FRAMEWORK: (
+        AcquisitionFramework,
+        [
+            SetRule(
+                "main_contact_required",
+                "A main contact actor is required",
+                lambda qs: qs.exclude(
+                    actors__actor_role__code=MAIN_CONTACT_ROLE_CODE
+                ),
+            ),
+            SetRule(
+                "territory_level_required",
+                "Territory level is required",
+                lambda qs: qs.filter(territory_level__isnull=True),
+            ),
+            SetRule(
+                "territory_required",
+                "At least one territory is required",
+                lambda qs: qs.filter(territory__isnull=True),
+            ),
+            SetRule(
+                "objective_required",
+                "At least one objective is required",
+                lambda qs: qs.filter(objective__isnull=True),
+            ),
+            SetRule(
+                "dates_consistency",
+                "Start date must not be after end date",
+                lambda qs: qs.filter(date_end__lt=F("date_start")),
+            ),
+        ],
+    ),
+    ConformanceResult.DATASET: (
+        Dataset,
+        [
+            SetRule(
+                "data_type_required",
+                "Data type is required",
+                lambda qs: qs.filter(data_type__isnull=True),
+            ),
+            SetRule(
+                "data_origin_status_required",
+                "Data origin status is required",
+                lambda qs: qs.filter(data_origin_status__isnull=True),
+            ),
+            SetRule(
+                "territory_required",
+                "At least one territory is required",
+                lambda qs: qs.filter(territory__isnull=True),
+            ),
+            SetRule(
+                "collecting_method_required",
+                "At least one collecting method is required",
+                lambda qs: qs.filter(
+                    Q(collecting_method__isnull=True)
+                    & Q(other_method__isnull=True)
+                ),
+            ),
+            SetRule(
+                "bbox_required",
+                "Bounding box is required",
+                lambda qs: qs.filter(bbox__isnull=True),
+            ),
+            RecordRule(
+                "bbox_valid",
+                "Bounding box must be a valid, non empty WGS84 extent",
+                ("bbox",),
+                valid_bbox,
+            ),
+        ],
+    ),
+}
+
+
+def stale_records(record_type, full=False):
+    """Records never checked or updated since their last check"""
+    model = RULES[record_type][0]
+    qs = model.objects.all()
+    if full:
+        return qs
+    checked = ConformanceResult.objects.filter(
+        record_type=record_type,
+        record_id=OuterRef("pk"),
+        record_updated_at__gte=OuterRef("timestamp_update"),
+    )
+    return qs.filter(~Exists(checked))
+
+
+def get_shards(pks, shard_size=SHARD_SIZE):
+    """Split sorted primary keys into ``(first, last)`` id ranges"""
+    return [
+        (pks[i], pks[min(i + shard_size, len(pks)) - 1])
+        for i in range(0, len(pks), shard_size)
+    ]
+
+
+def check_shard(record_type, first, last, full=False):
+    """Apply record rules to an id range
+
+    Returns:
+        dict: failed rule codes by record pk
+    """
+    rules = [r for r in RULES[record_type][1] if isinstance(r, RecordRule)]
+    fields = {field for rule in rules for field in rule.fields}
+    failures = {}
+    with use_replica(pin_on_write=False):
+        records = (
+            stale_records(record_type, full)
+            .filter(pk__range=(first, last))
+            .values("pk", *fields)
+        )
+        for values in records.iterator(chunk_size=BATCH_SIZE):
+            failed = [r.code for r in rules if not r.check(values)]
+            if failed:
+                failures[values["pk"]] = failed
+    return failures
+
+
+def _check_shard_in_worker(*args):
+    try:
+        return check_shard(*args)
+    finally:
+        connections.close_all()
+
+
+def run_record_rules(record_type, pks, full=False, workers=1):
+    if not any(isinstance(r, RecordRule) for r in RULES[record_type][1]):
+        return {}
+    shards = get_shards(pks)
+    failures = {}
+    if workers <= 1 or len(shards) <= 1:
+        for first, last in shards:
+            failures.update(check_shard(record_type, first, last, full))
+        return failures
+    # Workers must not inherit an open connection
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=django.setup
+    ) as pool:
+        futures = [
+            pool.submit(_check_shard_in_worker, record_type, first, last, full)
+            for first, last in shards
+        ]
+        for future in futures:
+            failures.update(future.result())
+    return failures
+
+
+def store_results(record_type, targets, errors):
+    checked_at = now()
+    pks = list(targets)
+    with transaction.atomic():
+        for i in range(0, len(pks), BATCH_SIZE):
+            ConformanceResult.objects.filter(
+                record_type=record_type, record_id__in=pks[i : i + BATCH_SIZE]
+            ).delete()
+        ConformanceResult.objects.bulk_create(
+            [
+                ConformanceResult(
+                    record_type=record_type,
+                    record_id=pk,
+                    conforming=not errors.get(pk),
+                    errors=errors.get(pk, []),
+                    record_updated_at=updated_at,
+                    checked_at=checked_at,
+                )
+                for pk, updated_at in targets.items()
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        # Results of deleted records
+        model = RULES[record_type][0]
+        ConformanceResult.objects.filter(record_type=record_type).exclude(
+            record_id__in=model.objects.values("pk")
+        ).delete()
+
+
+def check_conformance(record_types=None, full=False, workers=1):
+    """Check records against the SINP rules and store the results
+
+    Args:
+        record_types (list, optional): record types, all by default
+        full (bool): check every record, not only the updated ones
+        workers (int): number of processes for record rules
+
+    Returns:
+        dict: ``(checked, non conforming)`` counts by record type
+    """
+    summary = {}
+    for record_type in record_types or RULES:
+        rules = RULES[record_type][1]
+        with use_replica(pin_on_write=False):
+            stale = stale_records(record_type, full)
+            targets = dict(
+                stale.order_by("pk").values_list("pk", "timestamp_update")
+            )
+            errors = {}
+            for rule in rules:
+                if not isinstance(rule, SetRule):
+                    continue
+                failing = rule.failing(stale).values_list("pk", flat=True)
+                for pk in failing.distinct():
+                    if pk in targets:
+                        errors.setdefault(pk, []).append(rule.code)
+        failures = run_record_rules(record_type, list(targets), full, workers)
+        for pk, codes in failures.items():
+            if pk in targets:
+                errors.setdefault(pk, []).extend(codes)
+        messages = {rule.code: rule.message for rule in rules}
+        errors = {
+            pk: [{"rule": code, "message": messages[code]} for code in codes]
+            for pk, codes in errors.items()
+        }
+        store_results(record_type, targets, errors)
+        summary[record_type] = (len(targets), len(errors))
+        logger.info(
+            f"Conformance of {len(targets)} {record_type} records checked, "
+            f"{len(errors)} non conforming"
+        )
+    return summary
+
+
+class CheckConformanceParams(serializers.Serializer):
+    record_types = serializers.ListField(
+        child=serializers.ChoiceField(choices=list(RULES)),
+        allow_empty=False,
+        required=False,
+    )
+    full = serializers.BooleanField(default=False)
+    workers = WorkersField(default=1)
+
+
+@register_job(
+    "check_conformance",
+    permission=CATALOGUE_PERMISSION,
+    params=CheckConformanceParams,
+)
+def check_conformance_job(job):
+    """Check SINP conformance (``params``: full, workers, record_types)"""
+    summary = check_conformance(
+        job.params.get("record_types"),
+        full=job.params.get("full", False),
+        workers=job.params.get("workers", 1),
+    )
+    return ", ".join(
+        f"{record_type}: {checked} checked, {failed} non conforming"
+        for record_type, (checked, failed) in summary.items()
+    )
@@ -0,0 +1,270 @@
+"""Set-based deletion of frameworks and datasets
+
+Django's collector loads every cascaded object in memory and sends
+signals one by one. Here cascades are walked on primary keys only:
+:func:`preview_deletion` counts what would be removed with subqueries,
+:func:`delete_records` deletes it with batched ``DELETE`` statements,
+children first, and writes :class:`~sinp_metadata.models.DeletedRecord`
+tombstones for frameworks and datasets.
+
+``on_delete`` behaviours are honoured: ``PROTECT``/``RESTRICT`` relations
+block the deletion (:class:`~django.db.models.ProtectedError`),
+``SET_NULL``/``SET_DEFAULT`` relations are updated in bulk. Model
+signals are not sent; ``bulk_changed`` is sent with ``action="delete"``,
+and ``action="update"`` for the rows of ``SET_NULL``/``SET_DEFAULT``
+relations.
+"""
+
+import logging
+from collections import Counter
+
+from django.db import models, router, transaction
+from django.db.models import ProtectedError
+from django.utils.timezone import now
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .models import AcquisitionFramework, Dataset, DeletedRecord
+from .signals import bulk_changed
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+TOMBSTONE_TYPES = {
+    AcquisitionFramework: "acquisition_framework",
+    Dataset: "dataset",
+}
+
+
+def _chunks(values, size=BATCH_SIZE):
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+def get_relations(model):
+    """Classify the relations affected by deleting records of a model
+
+    Returns:
+        dict: ``cascade``, ``protect`` and ``update`` reverse relations, and
+        ``through`` (auto-created through model, FK name) pairs
+    """
+    relations = {"cascade": [], "protect": [], "update": [], "through": []}
+    for field in model._meta.many_to_many:
+        through = field.remote_field.through
+        if through._meta.auto_created:
+            relations["through"].append((through, field.m2m_field_name()))
+    for rel in model._meta.related_objects:
+        if rel.many_to_many:
+            through = rel.through
+            if through._meta.auto_created:
+                name = rel.field.m2m_reverse_field_name()
+                relations["through"].append((through, name))
+        elif rel.on_delete is models.CASCADE:
+            relations["cascade"].append(rel)
+        elif rel.on_delete in (models.PROTECT, models.RESTRICT):
+            relations["protect"].append(rel)
+        elif rel.on_delete in (models.SET_NULL, models.SET_DEFAULT):
+            relations["update"].append(rel)
+    return relations
+
+
+def _related(rel, pks):
+    return rel.related_model._base_manager.filter(
+        **{f"{rel.field.name}__in": pks}
+    )
+
+
+def preview_deletion(model, pks):
+    """Count what deleting records would remove, without loading them
+
+    Args:
+        model: model of the deleted records
+        pks: primary keys (list or values queryset)
+
+    Returns:
+        dict: ``deleted`` and ``updated`` row counts and ``protected``
+        blocking rows counts, by model label
+    """
+    preview = {"deleted": Counter(), "updated": Counter(), "protected": {}}
+
+    def walk(model, qs, path):
+        relations = get_relations(model)
+        preview["deleted"][model._meta.label] += qs.count()
+        subquery = qs.values("pk")
+        for through, name in relations["through"]:
+            count = through.objects.filter(**{f"{name}__in": subquery}).count()
+            preview["deleted"][through._meta.label] += count
+        for rel in relations["update"]:
+            count = _related(rel, subquery).count()
+            preview["updated"][rel.related_model._meta.label] += count
+        for rel in relations["protect"]:
+            count = _related(rel, subquery).count()
+            if count:
+                label = rel.related_model._meta.label
+                preview["protected"][label] = count
+        for rel in relations["cascade"]:
+            if rel.related_model not in path:
+                walk(
+                    rel.related_model,
+                    _related(rel, subquery),
+                    path | {rel.related_model},
+                )
+
+    walk(model, model._base_manager.filter(pk__in=pks), {model})
+    return {
+        "deleted": {k: v for k, v in preview["deleted"].items() if v},
+        "updated": {k: v for k, v in preview["updated"].items() if v},
+        "protected": preview["protected"],
+    }
+
+
+def _write_tombstones(model, pks, user):
+    record_type = TOMBSTONE_TYPES.get(model)
+    if record_type is None:
+        return
+    deleted_at = now()
+    DeletedRecord.objects.bulk_create(
+        [
+            DeletedRecord(
+                record_type=record_type,
+                record_id=pk,
+                uuid=uuid,
+                label=label[:255],
+                deleted_at=deleted_at,
+                deleted_by=user,
+            )
+            for pk, uuid, label in model._base_manager.filter(
+                pk__in=pks
+            ).values_list("pk", "uuid", "label")
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+def get_protected(model, pks):
+    """Rows blocking the deletion of records, through PROTECT/RESTRICT
+
+    Returns:
+        list: querysets of protected rows
+    """
+    protected = []
+
+    def walk(model, subquery, path):
+        relations = get_relations(model)
+        for rel in relations["protect"]:
+            qs = _related(rel, subquery)
+            if qs.exists():
+                protected.append(qs)
+        for rel in relations["cascade"]:
+            if rel.related_model not in path:
+                walk(
+                    rel.related_model,
+                    _related(rel, subquery).values("pk"),
+                    path | {rel.related_model},
+                )
+
+    walk(model, pks, {model})
+    return protected
+
+
+def _delete(model, pks, user, counts, deleted, updated):
+    using = router.db_for_write(model)
+    relations = get_relations(model)
+    for chunk in _chunks(pks):
+        for rel in relations["cascade"]:
+            children = list(_related(rel, chunk).values_list("pk", flat=True))
+            if children:
+                _delete(
+                    rel.related_model, children, user, counts, deleted, updated
+                )
+        for rel in relations["update"]:
+            value = (
+                None
+                if rel.on_delete is models.SET_NULL
+                else rel.field.get_default()
+            )
+            rows = list(_related(rel, chunk).values_list("pk", flat=True))
+            if rows:
+                rel.related_model._base_manager.filter(pk__in=rows).update(
+                    **{rel.field.name: value}
+                )
+                updated.setdefault(rel.related_model, []).extend(rows)
+        for through, name in relations["through"]:
+            qs = through.objects.filter(**{f"{name}__in": chunk})
+            counts[through._meta.label] += qs._raw_delete(using)
+        _write_tombstones(model, chunk, user)
+        qs = model._base_manager.filter(pk__in=chunk)
+        counts[model._meta.label] += qs._raw_delete(using)
+        deleted.setdefault(model, []).extend(chunk)
+
+
+def delete_records(model, pks, user=None):
+    """Delete records and their cascade with set-based statements
+
+    Args:
+        model: model of the deleted records
+        pks (list): primary keys of the deleted records
+        user (User, optional): author of the deletion, for tombstones
+
+    Raises:
+        ProtectedError: protected rows reference the deleted records
+
+    Returns:
+        dict: deleted rows count by model label
+    """
+    pks = list(pks)
+    counts = Counter()
+    deleted = {}
+    updated = {}
+    with transaction.atomic():
+        protected = get_protected(model, pks)
+        if protected:
+            raise ProtectedError(
+                f"Cannot delete some {model._meta.verbose_name_plural} "
+                "because they are referenced through protected foreign keys",
+                {obj for qs in protected for obj in qs[:10]},
+            )
+        _delete(model, pks, user, counts, deleted, updated)
+        for deleted_model, deleted_pks in deleted.items():
+            bulk_changed.send(
+                sender=deleted_model,
+                pks=deleted_pks,
+                action="delete",
+                m2m_fields=[],
+            )
+        # Rows of SET_NULL/SET_DEFAULT relations left in place
+        for updated_model, updated_pks in updated.items():
+            gone = set(deleted.get(updated_model, ()))
+            updated_pks = [pk for pk in updated_pks if pk not in gone]
+            if updated_pks:
+                bulk_changed.send(
+                    sender=updated_model,
+                    pks=updated_pks,
+                    action="update",
+                    m2m_fields=[],
+                )
+    counts = {label: count for label, count in counts.items() if count}
+    logger.info(f"{model._meta.label} bulk deletion: {counts}")
+    return counts
+
+
+class BulkDeleteMixin:
+    """Viewset mixin deleting records with :func:`delete_records`
+
+    Adds a ``delete_preview`` action counting what ``destroy`` would
+    remove.
+    """
+
+    def perform_destroy(self, instance):
+        try:
+            delete_records(type(instance), [instance.pk], self.request.user)
+        except ProtectedError as e:
+            raise ValidationError({"protected": [e.args[0]]})
+
+    def delete_preview(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return Response(
+            preview_deletion(type(instance), [instance.pk]),
+            status=status.HTTP_200_OK,
+        )
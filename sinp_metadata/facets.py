@@ -0,0 +1,175 @@
+"""Faceted search counts
+
+Every requested facet of a filtered queryset is counted in a single
+query: one grouped ``SELECT`` per facet, combined with ``UNION ALL``.
+Results are cached per filter signature (the SQL of the filtered
+queryset, which includes the user's visibility scope) and invalidated by
+signals whenever records, their relations or facet labels change.
+"""
+
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db.models import CharField, Count, F, Value
+from django.db.models.functions import Cast
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .cache import get_or_build
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAMESPACE = "facets"
+TOTAL = "_total"
+
+
+class Facet:
+    """Countable field
+
+    Args:
+        name (str): facet name
+        path (str): lookup path of the counted value, relations allowed
+        label_path (str, optional): lookup path of the value label
+        to_python (callable): converts values, grouped as text so every
+            facet fits in the same ``UNION``
+    """
+
+    def __init__(self, name, path=None, label_path=None, to_python=int):
+        self.name = name
+        self.path = path or name
+        self.label_path = label_path
+        self.to_python = to_python
+
+    def grouped(self, queryset):
+        label = (
+            Cast(F(self.label_path), CharField())
+            if self.label_path
+            else Value(None, output_field=CharField())
+        )
+        return (
+            queryset.order_by()
+            .annotate(
+                facet_name=Value(self.name, output_field=CharField()),
+                facet_value=Cast(F(self.path), CharField()),
+                facet_label=label,
+            )
+            .values("facet_name", "facet_value", "facet_label")
+            .annotate(facet_count=Count("pk", distinct=True))
+        )
+
+    def to_value(self, value):
+        return self.to_python(value)
+
+
+def to_boolean(value):
+    # Booleans cast as text are "1"/"0" or "true"/"false" depending on
+    # the database
+    return value.lower() in ("1", "t", "true")
+
+
+DATASET_FACETS = (
+    Facet("data_type", label_path="data_type__label"),
+    Facet("data_category", label_path="data_category__label"),
+    Facet("territory", label_path="territory__label"),
+    Facet("keywords", label_path="keywords__keyword", to_python=str),
+    Facet("project", label_path="project__label"),
+    Facet("active", to_python=to_boolean),
+)
+
+ACQUISITION_FRAMEWORK_FACETS = (
+    Facet("territory_level", label_path="territory_level__label"),
+    Facet("territory", label_path="territory__label"),
+    Facet("objective", label_path="objective__label"),
+    Facet("keywords", label_path="keywords__keyword", to_python=str),
+    Facet("is_metaframework", to_python=to_boolean),
+)
+
+
+def count_facets(queryset, facets):
+    """Count records by value of each facet, in one query
+
+    Args:
+        queryset: filtered records
+        facets (iterable): :class:`Facet` to count
+
+    Returns:
+        dict: ``count`` (number of records) and ``facets`` (value, label
+        and count lists by facet name, most frequent first)
+    """
+    facets = {facet.name: facet for facet in facets}
+    total = (
+        queryset.order_by()
+        .annotate(
+            facet_name=Value(TOTAL, output_field=CharField()),
+            facet_value=Value(None, output_field=CharField()),
+            facet_label=Value(None, output_field=CharField()),
+        )
+        .values("facet_name", "facet_value", "facet_label")
+        .annotate(facet_count=Count("pk", distinct=True))
+    )
+    parts = [facet.grouped(queryset) for facet in facets.values()]
+    result = {"count": 0, "facets": {name: [] for name in facets}}
+    for row in total.union(*parts, all=True):
+        if row["facet_name"] == TOTAL:
+            result["count"] = row["facet_count"]
+            continue
+        if row["facet_value"] is None:
+            continue
+        facet = facets[row["facet_name"]]
+        result["facets"][facet.name].append(
+            {
+                "value": facet.to_value(row["facet_value"]),
+                "label": row["facet_label"],
+                "count": row["facet_count"],
+            }
+        )
+    for values in result["facets"].values():
+        values.sort(key=lambda value: (-value["count"], str(value["label"])))
+    return result
+
+
+def get_signature(queryset, facets):
+    """Cache key part identifying a filtered queryset and facet names"""
+    sql, params = queryset.order_by().query.sql_with_params()
+    content = repr((sql, params, sorted(facet.name for facet in facets)))
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def get_facets(queryset, facets):
+    """Cached :func:`count_facets`"""
+    try:
+        signature = get_signature(queryset, facets)
+    except EmptyResultSet:
+        return {"count": 0, "facets": {facet.name: [] for facet in facets}}
+    return get_or_build(
+        CACHE_NAMESPACE,
+        (queryset.model._meta.model_name, signature),
+        lambda: count_facets(queryset, facets),
+        timeout=getattr(settings, "SINP_METADATA_FACETS_CACHE_TIMEOUT", 600),
+    )
+
+
+class FacetsMixin(object):
+    """Viewset ``facets`` action, counting ``facet_fields`` of the list
+
+    ``?facets=territory,keywords`` restricts the counted facets; other
+    query parameters filter records like the list action does.
+    """
+
+    facet_fields = ()
+
+    def facets(self, request, *args, **kwargs):
+        available = {facet.name: facet for facet in self.facet_fields}
+        names = [
+            name
+            for name in request.query_params.get("facets", "").split(",")
+            if name
+        ]
+        unknown = sorted(set(names) - set(available))
+        if unknown:
+            raise ValidationError({"facets": [f"Unknown facets: {unknown}"]})
+        facets = [available[name] for name in names] or list(self.facet_fields)
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(get_facets(queryset, facets))
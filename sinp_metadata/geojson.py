@@ -0,0 +1,129 @@
+"""Streaming GeoJSON export of dataset extents
+
+Geometries are reprojected, simplified and serialized by the database
+(``AsGeoJSON``); rows are read in chunks from a server-side cursor and
+features are emitted as they come, so memory use doesn't grow with the
+number of datasets.
+"""
+
+import json
+import logging
+
+from django.conf import settings
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import (
+    AsGeoJSON,
+    GeoFunc,
+    Transform,
+)
+
+from .routers import use_replica
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SRID = 4326
+DEFAULT_PRECISION = 6
+MAX_PRECISION = 15
+CHUNK_SIZE = 2000
+PROPERTIES = (
+    "uuid",
+    "label",
+    "short_label",
+    "acquisition_framework_id",
+    "active",
+    "timestamp_update",
+)
+
+
+class SimplifyPreserveTopology(GeoFunc):
+    """Simplified geometry, never collapsing polygons"""
+
+    function = "ST_SimplifyPreserveTopology"
+    output_field = GeometryField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler,
+            connection,
+            function="SimplifyPreserveTopology",
+            **extra_context,
+        )
+
+
+def geometry_expression(srid=DEFAULT_SRID, tolerance=None, precision=None):
+    """``bbox`` as GeoJSON, reprojected and simplified in the database
+
+    Args:
+        srid (int): output spatial reference
+        tolerance (float, optional): simplification tolerance, in ``srid``
+            units
+        precision (int, optional): number of decimals of coordinates
+
+    Returns:
+        expression
+    """
+    geometry = "bbox"
+    if srid != settings.GEODATA_SRID:
+        geometry = Transform(geometry, srid)
+    if tolerance:
+        geometry = SimplifyPreserveTopology(geometry, tolerance)
+    if precision is None:
+        precision = DEFAULT_PRECISION
+    return AsGeoJSON(geometry, precision=precision)
+
+
+def _default(value):
+    return str(value)
+
+
+def stream_feature_collection(
+    queryset,
+    srid=DEFAULT_SRID,
+    tolerance=None,
+    precision=None,
+    chunk_size=CHUNK_SIZE,
+):
+    """Encode dataset extents as a GeoJSON FeatureCollection, chunk by chunk
+
+    Args:
+        queryset: datasets to export
+        srid (int): output spatial reference
+        tolerance (float, optional): simplification tolerance
+        precision (int, optional): number of decimals of coordinates
+        chunk_size (int): rows fetched per round trip
+
+    Yields:
+        str: FeatureCollection parts
+    """
+    header = {"type": "FeatureCollection"}
+    if srid != DEFAULT_SRID:
+        # Not part of RFC 7946, but read by GDAL/QGIS
+        header["crs"] = {
+            "type": "name",
+            "properties": {"name": f"urn:ogc:def:crs:EPSG::{srid}"},
+        }
+    yield json.dumps(header)[:-1] + ', "features": ['
+    rows = (
+        queryset.filter(bbox__isnull=False)
+        .annotate(geojson=geometry_expression(srid, tolerance, precision))
+        .order_by("pk")
+        .values_list("pk", "geojson", *PROPERTIES)
+    )
+    count = 0
+    chunk = []
+    # Generators run after the view returned, so route here
+    with use_replica(pin_on_write=False):
+        for pk, geometry, *values in rows.iterator(chunk_size=chunk_size):
+            properties = json.dumps(
+                dict(zip(PROPERTIES, values)), default=_default
+            )
+            chunk.append(
+                f'{"," if count else ""}{{"type": "Feature", "id": {pk}, '
+                f'"geometry": {geometry}, "properties": {properties}}}'
+            )
+            count += 1
+            if len(chunk) >= chunk_size:
+                yield "".join(chunk)
+                chunk = []
+    yield "".join(chunk) + "]}"
+    logger.debug(f"{count} dataset extents exported as GeoJSON")
@@ -0,0 +1,452 @@
+"""OAI-PMH harvesting of the metadata catalogue
+
+Records are listed in ``(timestamp_update, id)`` order. Resumption tokens
+are signed, opaque encodings of the last position (keyset), so every page
+is an indexed range query whatever the harvest depth.
+
+Deletions are reported from the :class:`~sinp_metadata.models.DeletedRecord`
+tombstones, listed after the live records of each set with a ``deleted``
+header status. Tombstones carry no visibility, so they are only harvested
+by users reading every record, and records removed without a tombstone
+are not reported: deleted records support is ``transient``.
+"""
+
+import logging
+import xml.etree.ElementTree as ET
+from datetime import datetime, time, timedelta, timezone
+from uuid import UUID
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Min, Q
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import AcquisitionFramework, Dataset, DeletedRecord
+from .permissions import (
+    filter_visible_acquisition_frameworks,
+    filter_visible_datasets,
+    has_all_data_access,
+)
+from .serializers import AcquisitionFrameworkSerializer, DatasetSerializer
+
+logger = logging.getLogger(__name__)
+
+OAI_NAMESPACE = "http://www.openarchives.org/OAI/2.0/"
+OAI_SCHEMA = "http://www.openarchives.org/OAI/2.0/OAI-PMH.xsd"
+XSI_NAMESPACE = "http://www.w3.org/2001/XMLSchema-instance"
+METADATA_PREFIX = "sinp_metadata"
+METADATA_NAMESPACE = "https://github.com/dbchiro/DjangoSinpMetadata"
+TOKEN_SALT = "sinp_metadata.harvest"
+DATESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+VERB_ARGUMENTS = {
+    "Identify": set(),
+    "ListMetadataFormats": {"identifier"},
+    "ListSets": {"resumptionToken"},
+    "ListIdentifiers": {"metadataPrefix", "from", "until", "set"},
+    "ListRecords": {"metadataPrefix", "from", "until", "set"},
+    "GetRecord": {"identifier", "metadataPrefix"},
+}
+
+
+class HarvestError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class HarvestSet:
+    """Harvestable record type"""
+
+    def __init__(self, spec, name, model, serializer_class, filter_visible):
+        self.spec = spec
+        self.name = name
+        self.model = model
+        self.serializer_class = serializer_class
+        self.filter_visible = filter_visible
+
+    def get_queryset(self, user, with_metadata=False):
+        qs = self.filter_visible(self.model.objects.all(), user)
+        if with_metadata:
+            return qs.for_api()
+        return qs.only("pk", "uuid", "timestamp_update")
+
+    def get_deleted(self):
+        """Tombstones of the set records"""
+        return DeletedRecord.objects.filter(record_type=self.spec).only(
+            "pk", "uuid", "deleted_at"
+        )
+
+
+SETS = {
+    harvest_set.spec: harvest_set
+    for harvest_set in (
+        HarvestSet(
+            "acquisition_framework",
+            "Cadres d'acquisition",
+            AcquisitionFramework,
+            AcquisitionFrameworkSerializer,
+            filter_visible_acquisition_frameworks,
+        ),
+        HarvestSet(
+            "dataset",
+            "Jeux de données",
+            Dataset,
+            DatasetSerializer,
+            filter_visible_datasets,
+        ),
+    )
+}
+
+
+def get_page_size():
+    return getattr(settings, "SINP_METADATA_OAI_PAGE_SIZE", 100)
+
+
+def get_repository_id():
+    return getattr(
+        settings, "SINP_METADATA_OAI_REPOSITORY_ID", "sinp-metadata"
+    )
+
+
+def format_datestamp(value):
+    return value.astimezone(timezone.utc).strftime(DATESTAMP_FORMAT)
+
+
+def parse_datestamp(value, until=False):
+    """Parse an OAI ``from``/``until`` argument
+
+    Returns:
+        datetime: inclusive lower bound, or exclusive upper bound if
+        ``until``
+    """
+    try:
+        moment = parse_datetime(value) if "T" in value else None
+        day = parse_date(value) if moment is None else None
+    except ValueError:
+        moment = day = None
+    if moment is not None and value.endswith("Z"):
+        return moment + timedelta(seconds=1) if until else moment
+    if day is not None:
+        moment = datetime.combine(day, time.min, tzinfo=timezone.utc)
+        return moment + timedelta(days=1) if until else moment
+    raise HarvestError("badArgument", f"Invalid date {value!r}")
+
+
+def encode_token(state):
+    return signing.dumps(state, salt=TOKEN_SALT, compress=True)
+
+
+def decode_token(token):
+    try:
+        return signing.loads(token, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        raise HarvestError("badResumptionToken", "Invalid resumption token")
+
+
+def data_to_xml(parent, data):
+    """Append serialized data to an XML element
+
+    Dict keys become child elements and list items ``item`` elements.
+    """
+    if isinstance(data, dict):
+        for key, value in data.items():
+            data_to_xml(ET.SubElement(parent, key), value)
+    elif isinstance(data, (list, tuple)):
+        for value in data:
+            data_to_xml(ET.SubElement(parent, "item"), value)
+    elif isinstance(data, bool):
+        parent.text = "true" if data else "false"
+    elif data is not None:
+        parent.text = str(data)
+    return parent
+
+
+class OaiPmh:
+    """OAI-PMH request handler
+
+    Args:
+        params (dict): request arguments
+        user (User): harvesting user, whose visibility scope applies
+        base_url (str): endpoint absolute URL
+    """
+
+    def __init__(self, params, user, base_url):
+        self.params = {key: params[key] for key in params}
+        self.user = user
+        self.base_url = base_url
+        self.with_deleted = has_all_data_access(user)
+
+    def response(self):
+        """Build the OAI-PMH XML response
+
+        Returns:
+            bytes: XML document
+        """
+        root = ET.Element(
+            "OAI-PMH",
+            {
+                "xmlns": OAI_NAMESPACE,
+                "xmlns:xsi": XSI_NAMESPACE,
+                "xsi:schemaLocation": f"{OAI_NAMESPACE} {OAI_SCHEMA}",
+            },
+        )
+        ET.SubElement(root, "responseDate").text = format_datestamp(
+            datetime.now(timezone.utc)
+        )
+        request = ET.SubElement(root, "request")
+        request.text = self.base_url
+        try:
+            verb = self.params.pop("verb", None)
+            if verb not in VERB_ARGUMENTS:
+                raise HarvestError("badVerb", "Illegal OAI verb")
+            self.check_arguments(verb)
+            request.attrib.update({"verb": verb, **self.params})
+            root.append(getattr(self, verb.lower())(ET.Element(verb)))
+        except HarvestError as e:
+            ET.SubElement(root, "error", {"code": e.code}).text = e.message
+        return ET.tostring(root, encoding="utf-8", xml_declaration=True)
+
+    def check_arguments(self, verb):
+        allowed = VERB_ARGUMENTS[verb]
+        if "resumptionToken" in self.params and verb in (
+            "ListIdentifiers",
+            "ListRecords",
+        ):
+            allowed = {"resumptionToken"}
+        illegal = set(self.params) - allowed
+        if illegal:
+            raise HarvestError(
+                "badArgument", f"Illegal arguments: {', '.join(illegal)}"
+            )
+        if (
+            verb in ("ListIdentifiers", "ListRecords", "GetRecord")
+            and "resumptionToken" not in self.params
+        ):
+            prefix = self.params.get("metadataPrefix")
+            if prefix is None:
+                raise HarvestError("badArgument", "Missing metadataPrefix")
+            if prefix != METADATA_PREFIX:
+                raise HarvestError(
+                    "cannotDisseminateFormat", f"Unknown format {prefix!r}"
+                )
+
+    def identify(self, element):
+        earliest = [
+            harvest_set.get_queryset(self.user).aggregate(
+                earliest=Min("timestamp_update")
+            )["earliest"]
+            for harvest_set in SETS.values()
+        ]
+        if self.with_deleted:
+            earliest.append(
+                DeletedRecord.objects.filter(record_type__in=SETS).aggregate(
+                    earliest=Min("deleted_at")
+                )["earliest"]
+            )
+        earliest = min((e for e in earliest if e), default=None)
+        for tag, text in (
+            (
+                "repositoryName",
+                getattr(settings, "SINP_METADATA_OAI_REPOSITORY_NAME", "SINP"),
+            ),
+            ("baseURL", self.base_url),
+            ("protocolVersion", "2.0"),
+            ("adminEmail", settings.DEFAULT_FROM_EMAIL),
+            (
+                "earliestDatestamp",
+                format_datestamp(earliest)
+                if earliest
+                else "1970-01-01T00:00:00Z",
+            ),
+            ("deletedRecord", "transient"),
+            ("granularity", "YYYY-MM-DDThh:mm:ssZ"),
+        ):
+            ET.SubElement(element, tag).text = text
+        return element
+
+    def listmetadataformats(self, element):
+        if "identifier" in self.params:
+            self.get_object(self.params["identifier"])
+        metadata_format = ET.SubElement(element, "metadataFormat")
+        ET.SubElement(metadata_format, "metadataPrefix").text = METADATA_PREFIX
+        ET.SubElement(metadata_format, "schema").text = ""
+        ET.SubElement(
+            metadata_format, "metadataNamespace"
+        ).text = METADATA_NAMESPACE
+        return element
+
+    def listsets(self, element):
+        if "resumptionToken" in self.params:
+            raise HarvestError("badResumptionToken", "Sets are not paged")
+        for harvest_set in SETS.values():
+            node = ET.SubElement(element, "set")
+            ET.SubElement(node, "setSpec").text = harvest_set.spec
+            ET.SubElement(node, "setName").text = harvest_set.name
+        return element
+
+    def listidentifiers(self, element):
+        return self.list(element, with_metadata=False)
+
+    def listrecords(self, element):
+        return self.list(element, with_metadata=True)
+
+    def getrecord(self, element):
+        harvest_set, obj, deleted = self.get_object(
+            self.params.get("identifier"), with_deleted=True
+        )
+        self.append_record(
+            element, harvest_set, obj, with_metadata=True, deleted=deleted
+        )
+        return element
+
+    def get_object(self, identifier, with_deleted=False):
+        """Record of an OAI identifier
+
+        Args:
+            identifier (str): OAI identifier
+            with_deleted (bool): look for a tombstone if the record does
+                not exist, for users harvesting deletions
+
+        Returns:
+            tuple: harvest set, record or tombstone, and whether it is a
+            tombstone
+        """
+        parts = (identifier or "").split(":")
+        obj = None
+        deleted = False
+        if (
+            len(parts) == 4
+            and parts[:2] == ["oai", get_repository_id()]
+            and parts[2] in SETS
+        ):
+            harvest_set = SETS[parts[2]]
+            try:
+                uuid = UUID(parts[3])
+            except ValueError:
+                uuid = None
+            if uuid is not None:
+                obj = (
+                    harvest_set.get_queryset(self.user, with_metadata=True)
+                    .filter(uuid=uuid)
+                    .first()
+                )
+            if obj is None and uuid is not None and with_deleted:
+                deleted = self.with_deleted
+                if deleted:
+                    obj = harvest_set.get_deleted().filter(uuid=uuid).first()
+        if obj is None:
+            raise HarvestError("idDoesNotExist", f"Unknown {identifier!r}")
+        return harvest_set, obj, deleted
+
+    def get_state(self):
+        token = self.params.get("resumptionToken")
+        if token is not None:
+            return decode_token(token)
+        spec = self.params.get("set")
+        if spec is not None and spec not in SETS:
+            raise HarvestError("badArgument", f"Unknown set {spec!r}")
+        bounds = {
+            key: parse_datestamp(self.params[key], until=key == "until")
+            for key in ("from", "until")
+            if key in self.params
+        }
+        specs = [spec] if spec else list(SETS)
+        return {
+            # Live records of each set, then its tombstones
+            "sets": [[spec, False] for spec in specs]
+            + ([[spec, True] for spec in specs] if self.with_deleted else []),
+            "from": bounds["from"].isoformat() if "from" in bounds else None,
+            "until": bounds["until"].isoformat()
+            if "until" in bounds
+            else None,
+            "after": None,
+        }
+
+    def list(self, element, with_metadata):
+        state = self.get_state()
+        remaining = get_page_size()
+        sets = list(state["sets"])
+        after = state["after"]
+        records = []
+        while sets and remaining > 0:
+            spec, deleted = sets[0]
+            harvest_set = SETS[spec]
+            if deleted:
+                qs, field = harvest_set.get_deleted(), "deleted_at"
+            else:
+                qs = harvest_set.get_queryset(self.user, with_metadata)
+                field = "timestamp_update"
+            if state["from"]:
+                qs = qs.filter(**{f"{field}__gte": state["from"]})
+            if state["until"]:
+                qs = qs.filter(**{f"{field}__lt": state["until"]})
+            if after:
+                timestamp, pk = after
+                qs = qs.filter(
+                    Q(**{f"{field}__gt": timestamp})
+                    | Q(**{field: timestamp, "pk__gt": pk})
+                )
+            page = list(qs.order_by(field, "pk")[: remaining + 1])
+            has_more = len(page) > remaining
+            page = page[:remaining]
+            records.extend((harvest_set, obj, deleted) for obj in page)
+            remaining -= len(page)
+            if has_more:
+                after = (getattr(page[-1], field).isoformat(), page[-1].pk)
+                break
+            sets.pop(0)
+            after = None
+
+        if not records and "resumptionToken" not in self.params:
+            raise HarvestError("noRecordsMatch", "No matching records")
+        context = {}
+        for harvest_set, obj, deleted in records:
+            self.append_record(
+                element, harvest_set, obj, with_metadata, context, deleted
+            )
+        if sets or "resumptionToken" in self.params:
+            ET.SubElement(element, "resumptionToken").text = (
+                encode_token({**state, "sets": sets, "after": after})
+                if sets
+                else None
+            )
+        return element
+
+    def append_record(
+        self,
+        element,
+        harvest_set,
+        obj,
+        with_metadata,
+        context=None,
+        deleted=False,
+    ):
+        header = ET.Element("header", {"status": "deleted"} if deleted else {})
+        ET.SubElement(header, "identifier").text = ":".join(
+            ("oai", get_repository_id(), harvest_set.spec, str(obj.uuid))
+        )
+        ET.SubElement(header, "datestamp").text = format_datestamp(
+            obj.deleted_at if deleted else obj.timestamp_update
+        )
+        ET.SubElement(header, "setSpec").text = harvest_set.spec
+        if not with_metadata:
+            element.append(header)
+            return
+        record = ET.SubElement(element, "record")
+        record.append(header)
+        if deleted:
+            return
+        metadata = ET.SubElement(record, "metadata")
+        data = harvest_set.serializer_class(
+            obj, context=context if context is not None else {}
+        ).data
+        data_to_xml(
+            ET.SubElement(
+                metadata,
+                METADATA_PREFIX,
+                {"xmlns": METADATA_NAMESPACE, "type": harvest_set.spec},
+            ),
+            data,
+        )
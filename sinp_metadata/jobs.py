@@ -0,0 +1,230 @@
+"""Lightweight background jobs
+
+Jobs are stored in database (:class:`~sinp_metadata.models.Job`) and run
+by the ``metadata_worker`` management command in a process pool, so heavy
+operations (exports, imports, catalogue-wide checks) never block a request
+thread. Handlers are registered with :func:`register_job`, optionally
+with the permission required to submit them through the API and a
+serializer validating their parameters.
+"""
+
+import json
+import logging
+import os
+import socket
+import traceback
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connections
+from django.utils.timezone import now
+from rest_framework import serializers
+
+from .models import Job
+from .routers import use_replica
+
+logger = logging.getLogger(__name__)
+
+JOB_HANDLERS = {}
+JOB_PERMISSIONS = {}
+JOB_PARAMS = {}
+# Required by jobs reading or writing the whole catalogue
+CATALOGUE_PERMISSION = "sinp_metadata.run_catalogue_jobs"
+
+
+def register_job(kind, permission=None, params=None):
+    """Register a job handler
+
+    A handler receives the running :class:`Job` instance, may call
+    ``job.report_progress()`` and ``job.save_result()``, and returns an
+    optional final message.
+
+    Args:
+        kind (str): job kind, as submitted through the API
+        permission (str, optional): permission required to submit it
+        params (Serializer, optional): serializer class validating the job
+            parameters, which are stored unchecked if not given
+    """
+
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        JOB_PERMISSIONS[kind] = permission
+        JOB_PARAMS[kind] = params
+        return func
+
+    return decorator
+
+
+def get_max_workers():
+    """Maximum number of processes a single job may start"""
+    return getattr(settings, "SINP_METADATA_JOB_MAX_WORKERS", 4)
+
+
+class WorkersField(serializers.IntegerField):
+    """Number of processes of a job, clamped to
+    ``SINP_METADATA_JOB_MAX_WORKERS``"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("min_value", 1)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        return min(super().to_internal_value(data), get_max_workers())
+
+
+def validate_params(kind, params):
+    """Validate the parameters of a job kind
+
+    Args:
+        kind (str): registered job kind
+        params (dict): submitted parameters
+
+    Raises:
+        ValidationError: invalid parameters
+
+    Returns:
+        dict: validated parameters
+    """
+    serializer_class = JOB_PARAMS.get(kind)
+    if serializer_class is None:
+        return params
+    if not isinstance(params, dict):
+        raise serializers.ValidationError("Expected an object of parameters.")
+    serializer = serializer_class(data=params)
+    serializer.is_valid(raise_exception=True)
+    return dict(serializer.validated_data)
+
+
+def can_submit(user, kind):
+    """Whether a user may submit a job kind"""
+    permission = JOB_PERMISSIONS.get(kind)
+    return permission is None or user.has_perm(permission)
+
+
+def submit_job(kind, params=None, user=None):
+    """Queue a new job
+
+    Args:
+        kind (str): registered job kind
+        params (dict, optional): handler parameters
+        user (User, optional): job owner
+
+    Raises:
+        ValueError: unknown job kind
+        ValidationError: invalid parameters
+
+    Returns:
+        Job: created job
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind {kind!r}")
+    params = validate_params(kind, params or {})
+    return Job.objects.create(
+        kind=kind, params=params, created_by=user, updated_by=user
+    )
+
+
+def claim_job(job_id):
+    """Atomically move a pending job to running state
+
+    Returns:
+        bool: True if this worker owns the job
+    """
+    return bool(
+        Job.objects.filter(pk=job_id, status=Job.PENDING).update(
+            status=Job.RUNNING,
+            started_at=now(),
+            worker=f"{socket.gethostname()}:{os.getpid()}",
+        )
+    )
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def release_stale_jobs():
+    """Queue again the jobs left running by a dead worker of this host
+
+    Returns:
+        int: number of released jobs
+    """
+    host = socket.gethostname()
+    stale = []
+    for pk, worker in Job.objects.filter(
+        status=Job.RUNNING, worker__startswith=f"{host}:"
+    ).values_list("pk", "worker"):
+        pid = worker.rsplit(":", 1)[1]
+        if not pid.isdigit() or not _is_alive(int(pid)):
+            stale.append(pk)
+    if not stale:
+        return 0
+    logger.warning(f"Jobs {stale} interrupted, queued again")
+    return Job.objects.filter(pk__in=stale, status=Job.RUNNING).update(
+        status=Job.PENDING, started_at=None, worker="", progress=0
+    )
+
+
+def run_job(job_id):
+    """Run a claimed job, storing its final status
+
+    Executed inside worker processes.
+
+    Args:
+        job_id (int): job primary key
+    """
+    close_old_connections()
+    job = Job.objects.get(pk=job_id)
+    try:
+        handler = JOB_HANDLERS[job.kind]
+        message = handler(job)
+    except Exception as e:
+        logger.exception(f"Job {job_id} failed")
+        Job.objects.filter(pk=job_id).update(
+            status=Job.FAILED,
+            message=f"{e}\n{traceback.format_exc()}",
+            finished_at=now(),
+        )
+    else:
+        fields = {"status": Job.SUCCESS, "progress": 100, "finished_at": now()}
+        if message:
+            fields["message"] = message
+        Job.objects.filter(pk=job_id).update(**fields)
+    finally:
+        connections.close_all()
+
+
+@register_job("export_acquisition_frameworks", params=serializers.Serializer)
+def export_acquisition_frameworks(job):
+    """Export the acquisition frameworks visible to the job owner as a
+    JSON file"""
+    from .models import AcquisitionFramework
+    from .permissions import filter_visible_acquisition_frameworks
+    from .serializers import AcquisitionFrameworkSerializer
+
+    qs = AcquisitionFramework.objects.for_api()
+    # Jobs queued outside the API have no owner
+    if job.created_by is not None:
+        qs = filter_visible_acquisition_frameworks(qs, job.created_by)
+    data = []
+    context = {}
+    with use_replica(pin_on_write=False):
+        total = qs.count() or 1
+        for i, af in enumerate(qs.iterator(chunk_size=500), start=1):
+            data.append(
+                AcquisitionFrameworkSerializer(af, context=context).data
+            )
+            if i % 500 == 0:
+                job.report_progress(i * 100 // total)
+    job.save_result(
+        f"acquisition_frameworks_{job.uuid}.json",
+        ContentFile(json.dumps(data, cls=DjangoJSONEncoder).encode()),
+    )
+    return f"{len(data)} acquisition frameworks exported"
@@ -0,0 +1,129 @@
+"""Keyword lookups and duplicates folding, based on ``Keyword.normalized``"""
+
+import logging
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import Length
+
+from .models import AcquisitionFramework, Dataset, Keyword, normalize_keyword
+from .signals import bulk_changed
+
+logger = logging.getLogger(__name__)
+
+KEYWORD_RELATIONS = (AcquisitionFramework, Dataset)
+
+
+def autocomplete(query, limit=10):
+    """Keywords starting with a query, ignoring case and accents
+
+    Uses the prefix index on ``normalized``.
+
+    Args:
+        query (str): typed text
+        limit (int): maximum number of keywords
+
+    Returns:
+        queryset
+    """
+    prefix = normalize_keyword(query)
+    if not prefix:
+        return Keyword.objects.none()
+    return Keyword.objects.filter(normalized__startswith=prefix).order_by(
+        Length("normalized"), "normalized", "keyword"
+    )[:limit]
+
+
+def _usages(keyword_pks):
+    usages = Counter()
+    for model in KEYWORD_RELATIONS:
+        through = model.keywords.through
+        rows = (
+            through.objects.filter(keyword__in=keyword_pks)
+            .values("keyword")
+            .annotate(count=Count("pk"))
+        )
+        usages.update({row["keyword"]: row["count"] for row in rows})
+    return usages
+
+
+def find_duplicates():
+    """Map duplicate keywords to the keyword they fold into
+
+    The most used keyword of each normalized group is kept (oldest first
+    on ties).
+
+    Returns:
+        dict: canonical keyword pk by duplicate keyword pk
+    """
+    groups = (
+        Keyword.objects.values("normalized")
+        .annotate(count=Count("pk"))
+        .filter(count__gt=1)
+        .values_list("normalized", flat=True)
+    )
+    keywords = defaultdict(list)
+    for pk, normalized in (
+        Keyword.objects.filter(normalized__in=groups)
+        .order_by("timestamp_create")
+        .values_list("pk", "normalized")
+    ):
+        keywords[normalized].append(pk)
+    usages = _usages([pk for pks in keywords.values() for pk in pks])
+    mapping = {}
+    for pks in keywords.values():
+        canonical = max(pks, key=lambda pk: (usages[pk], -pks.index(pk)))
+        mapping.update({pk: canonical for pk in pks if pk != canonical})
+    return mapping
+
+
+def merge_keywords(mapping):
+    """Fold duplicate keywords into their canonical keyword
+
+    Through-table rows are rewired in bulk, then duplicates are deleted.
+
+    Args:
+        mapping (dict): canonical keyword pk by duplicate keyword pk
+
+    Returns:
+        int: number of deleted keywords
+    """
+    if not mapping:
+        return 0
+    with transaction.atomic():
+        for model in KEYWORD_RELATIONS:
+            through = model.keywords.through
+            owner = model.keywords.field.m2m_field_name() + "_id"
+            rows = list(
+                through.objects.filter(
+                    keyword__in=[*mapping, *mapping.values()]
+                ).values_list(owner, "keyword")
+            )
+            existing = set(rows)
+            new_rows = {
+                (owner_pk, mapping[keyword])
+                for owner_pk, keyword in rows
+                if keyword in mapping
+            } - existing
+            through.objects.filter(keyword__in=list(mapping)).delete()
+            through.objects.bulk_create(
+                [
+                    through(**{owner: owner_pk, "keyword_id": keyword})
+                    for owner_pk, keyword in new_rows
+                ],
+                batch_size=500,
+            )
+            changed = sorted(
+                {owner_pk for owner_pk, kw in rows if kw in mapping}
+            )
+            if changed:
+                bulk_changed.send(
+                    sender=model,
+                    pks=changed,
+                    action="update",
+                    m2m_fields=["keywords"],
+                )
+        Keyword.objects.filter(pk__in=list(mapping)).delete()
+    logger.info(f"{len(mapping)} duplicate keywords merged")
+    return len(mapping)
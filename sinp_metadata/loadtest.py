@@ -0,0 +1,552 @@
+"""Load testing of the metadata API
+
+:func:`seed` fills the database with synthetic frameworks and datasets
+(labels prefixed with :data:`SEED_PREFIX`, removed by :func:`clear_seed`).
+:func:`run_load_test` then sends a weighted mix of scenarios (lists,
+details, filtered searches, creations, exports) to a running server from
+concurrent clients, and reports throughput and latency percentiles per
+scenario. Results are saved as JSON so runs can be compared.
+
+Every client logs in as the same user, so they all draw from that
+user's throttling buckets and the whole run is capped at the rate of a
+single client. To measure raw throughput, list the load test user in
+``SINP_METADATA_THROTTLE_EXEMPT_USERS`` on the server, or set the
+``SINP_METADATA_THROTTLE_RATES`` scopes to ``None``. Throttled requests
+are counted as errors, and separately as ``throttled``.
+"""
+
+import http.cookiejar
+import json
+import logging
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.gis.geos import Polygon
+from django.db import transaction
+from django.urls import reverse
+from django.utils.timezone import now
+from sinp_nomenclatures.models import Nomenclature
+
+from .deletion import delete_records
+from .models import AcquisitionFramework, Dataset, Keyword, normalize_keyword
+from .signals import bulk_changed
+
+logger = logging.getLogger(__name__)
+
+SEED_PREFIX = "[load test]"
+BATCH_SIZE = 500
+PERCENTILES = (50, 95, 99)
+
+
+def get_api_prefix():
+    """Path of the metadata API, as mounted by the project URLs"""
+    return reverse("metadata:dataset_list_api")[: -len("dataset/list")]
+
+
+def _nomenclature_choices(field):
+    return list(
+        Nomenclature.objects.complex_filter(
+            field.get_limit_choices_to()
+        ).values_list("pk", flat=True)
+    )
+
+
+def _random_bbox(rng):
+    lon, lat = rng.uniform(-5, 8), rng.uniform(42, 51)
+    size = rng.uniform(0.01, 0.5)
+    bbox = Polygon.from_bbox((lon, lat, lon + size, lat + size))
+    bbox.srid = 4326
+    if settings.GEODATA_SRID != 4326:
+        bbox.transform(settings.GEODATA_SRID)
+    return bbox
+
+
+def _random_values(model, rng, choices):
+    """Random nomenclature values of a model FK fields"""
+    return {
+        field.name: rng.choice(choices[field.name])
+        for field in model._meta.concrete_fields
+        if field.name in choices and choices[field.name]
+    }
+
+
+def _link_m2m(model, pks, rng, choices, keywords):
+    """Random M2M links, nomenclatures and keywords
+
+    Returns:
+        list: names of the linked M2M fields
+    """
+    linked = []
+    for field in model._meta.many_to_many:
+        values = (
+            keywords
+            if field.related_model is Keyword
+            else choices.get(field.name)
+        )
+        if not values:
+            continue
+        through = field.remote_field.through
+        source = field.m2m_field_name() + "_id"
+        target = field.m2m_reverse_field_name() + "_id"
+        links = [
+            through(**{source: pk, target: value})
+            for pk in pks
+            for value in rng.sample(values, min(len(values), 2))
+        ]
+        through.objects.bulk_create(
+            links, batch_size=BATCH_SIZE, ignore_conflicts=True
+        )
+        linked.append(field.name)
+    return linked
+
+
+def _get_choices(model):
+    return {
+        field.name: _nomenclature_choices(field)
+        for field in [*model._meta.concrete_fields, *model._meta.many_to_many]
+        if field.is_relation and field.related_model is Nomenclature
+    }
+
+
+def seed(frameworks=100, datasets_per_framework=10, keywords=50, seed=0):
+    """Create synthetic frameworks, datasets and keywords
+
+    Nomenclature values are picked among the existing nomenclatures
+    allowed by each field.
+
+    Returns:
+        dict: created records count by model
+    """
+    rng = random.Random(seed)
+    run = now().strftime("%y%m%d%H%M%S")
+    with transaction.atomic():
+        keyword_pks = [
+            keyword.pk
+            for keyword in Keyword.objects.bulk_create(
+                [
+                    Keyword(
+                        keyword=keyword, normalized=normalize_keyword(keyword)
+                    )
+                    for keyword in (
+                        f"{SEED_PREFIX} {run} {i}" for i in range(keywords)
+                    )
+                ],
+                batch_size=BATCH_SIZE,
+            )
+        ]
+        choices = _get_choices(AcquisitionFramework)
+        AcquisitionFramework.objects.bulk_create(
+            [
+                AcquisitionFramework(
+                    label=f"{SEED_PREFIX} {run} framework {i}",
+                    desc="Synthetic acquisition framework",
+                    **_random_values(AcquisitionFramework, rng, choices),
+                )
+                for i in range(frameworks)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        af_pks = list(
+            AcquisitionFramework.objects.filter(
+                label__startswith=f"{SEED_PREFIX} {run} "
+            ).values_list("pk", flat=True)
+        )
+        af_fields = _link_m2m(
+            AcquisitionFramework, af_pks, rng, choices, keyword_pks
+        )
+
+        choices = _get_choices(Dataset)
+        Dataset.objects.bulk_create(
+            [
+                Dataset(
+                    acquisition_framework_id=af_pk,
+                    label=f"{SEED_PREFIX} {run} dataset {af_pk}.{i}",
+                    short_label=f"lt{run}-{af_pk}-{i}",
+                    desc="Synthetic dataset",
+                    bbox=_random_bbox(rng),
+                    active=rng.random() > 0.1,
+                    validable=rng.random() > 0.5,
+                    **_random_values(Dataset, rng, choices),
+                )
+                for af_pk in af_pks
+                for i in range(datasets_per_framework)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        ds_pks = list(
+            Dataset.objects.filter(
+                label__startswith=f"{SEED_PREFIX} {run} "
+            ).values_list("pk", flat=True)
+        )
+        ds_fields = _link_m2m(Dataset, ds_pks, rng, choices, keyword_pks)
+
+        bulk_changed.send(
+            sender=AcquisitionFramework,
+            pks=af_pks,
+            action="create",
+            m2m_fields=af_fields,
+        )
+        bulk_changed.send(
+            sender=Dataset, pks=ds_pks, action="create", m2m_fields=ds_fields
+        )
+    return {
+        "keywords": len(keyword_pks),
+        "acquisition_frameworks": len(af_pks),
+        "datasets": len(ds_pks),
+    }
+
+
+def clear_seed():
+    """Delete the synthetic records, and frameworks created by load tests
+
+    Returns:
+        dict: deleted rows count by model label
+    """
+    counts = delete_records(
+        AcquisitionFramework,
+        AcquisitionFramework.objects.filter(
+            label__startswith=SEED_PREFIX
+        ).values_list("pk", flat=True),
+    )
+    keywords, _ = Keyword.objects.filter(
+        keyword__startswith=SEED_PREFIX
+    ).delete()
+    if keywords:
+        counts[Keyword._meta.label] = keywords
+    return counts
+
+
+class Client:
+    """HTTP client keeping a logged in session
+
+    Args:
+        base_url (str): server URL (``http://localhost:8000``)
+        timeout (float): request timeout, in seconds
+    """
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies)
+        )
+
+    def get_cookie(self, name):
+        for cookie in self.cookies:
+            if cookie.name == name:
+                return cookie.value
+        return None
+
+    def request(self, method, path, data=None, form=False):
+        """Send a request
+
+        Returns:
+            tuple: status code and body
+        """
+        url = self.base_url + path
+        headers = {"Referer": url}
+        body = None
+        if method == "GET" and data:
+            url += "?" + urllib.parse.urlencode(data, doseq=True)
+        elif data is not None:
+            if form:
+                body = urllib.parse.urlencode(data).encode()
+                headers["Content-Type"] = "application/x-www-form-urlencoded"
+            else:
+                body = json.dumps(data).encode()
+                headers["Content-Type"] = "application/json"
+            headers["X-CSRFToken"] = self.get_cookie("csrftoken") or ""
+        request = urllib.request.Request(
+            url, data=body, headers=headers, method=method
+        )
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def login(self, username, password):
+        path = reverse("rest_framework:login")
+        self.request("GET", path)
+        self.request(
+            "POST",
+            path,
+            {
+                "username": username,
+                "password": password,
+                "csrfmiddlewaretoken": self.get_cookie("csrftoken") or "",
+            },
+            form=True,
+        )
+        if self.get_cookie("sessionid") is None:
+            raise RuntimeError(f"Login failed for {username!r}")
+
+
+class Scenario:
+    """Weighted request kind
+
+    Args:
+        name (str): scenario name, reported in results
+        weight (int): relative frequency
+        build (callable): returns the method, path and data of a request
+            from the run context and a random generator
+        expected (tuple): status codes counted as successes
+    """
+
+    def __init__(self, name, weight, build, expected=(200,)):
+        self.name = name
+        self.weight = weight
+        self.build = build
+        self.expected = expected
+
+
+def _pick(rng, values):
+    return rng.choice(values) if values else 0
+
+
+SCENARIOS = [
+    Scenario(
+        "framework_list",
+        10,
+        lambda ctx, rng: ("GET", "acquisition_framework/list", None),
+    ),
+    Scenario(
+        "dataset_list",
+        10,
+        lambda ctx, rng: ("GET", "dataset/list", None),
+    ),
+    Scenario(
+        "dataset_detail",
+        30,
+        lambda ctx, rng: (
+            "GET",
+            f"dataset/{_pick(rng, ctx['datasets'])}",
+            None,
+        ),
+    ),
+    Scenario(
+        "dataset_search",
+        20,
+        lambda ctx, rng: (
+            "GET",
+            "dataset/list",
+            {"territory": _pick(rng, ctx["territories"])},
+        ),
+    ),
+    Scenario(
+        "dataset_facets",
+        10,
+        lambda ctx, rng: ("GET", "dataset/facets", None),
+    ),
+    Scenario(
+        "framework_create",
+        5,
+        lambda ctx, rng: (
+            "POST",
+            "acquisition_framework/",
+            {
+                "label": f"{SEED_PREFIX} created {rng.getrandbits(64):x}",
+                "desc": "Created by a load test",
+            },
+        ),
+        expected=(201,),
+    ),
+    Scenario(
+        "geojson_export",
+        5,
+        lambda ctx, rng: ("GET", "dataset/geojson", None),
+    ),
+    Scenario(
+        "oai_list_records",
+        10,
+        lambda ctx, rng: (
+            "GET",
+            "oai",
+            {"verb": "ListRecords", "metadataPrefix": "sinp_metadata"},
+        ),
+    ),
+]
+
+
+def percentile(values, rank):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    index = max(math.ceil(rank / 100 * len(values)) - 1, 0)
+    return values[index]
+
+
+def summarize(samples, elapsed):
+    """Throughput and latencies of samples
+
+    Args:
+        samples (list): ``(scenario, success, latency, status)`` tuples
+        elapsed (float): run duration, in seconds
+
+    Returns:
+        dict: statistics by scenario, and ``total``
+    """
+    groups = {}
+    for name, *sample in samples:
+        groups.setdefault(name, []).append(sample)
+    groups["total"] = [sample for _, *sample in samples]
+    summary = {}
+    for name, values in groups.items():
+        latencies = sorted(latency * 1000 for _, latency, _ in values)
+        stats = {
+            "requests": len(values),
+            "errors": sum(1 for success, _, _ in values if not success),
+            "throttled": sum(1 for _, _, status in values if status == 429),
+            "rps": round(len(values) / elapsed, 2) if elapsed else None,
+            "mean_ms": (
+                round(sum(latencies) / len(latencies), 2)
+                if latencies
+                else None
+            ),
+        }
+        for rank in PERCENTILES:
+            value = percentile(latencies, rank)
+            stats[f"p{rank}_ms"] = None if value is None else round(value, 2)
+        summary[name] = stats
+    return summary
+
+
+def get_context(client):
+    """Identifiers used to build requests, read from the API"""
+    status, body = client.request("GET", get_api_prefix() + "dataset/list")
+    if status != 200:
+        raise RuntimeError(f"Dataset list failed with status {status}")
+    datasets = json.loads(body)
+    if isinstance(datasets, dict):  # Paginated
+        datasets = datasets["results"]
+    return {
+        "datasets": [dataset["id"] for dataset in datasets],
+        "territories": sorted(
+            {
+                pk
+                for pk in Nomenclature.objects.filter(
+                    dataset_index__field="territory"
+                ).values_list("pk", flat=True)
+            }
+        ),
+    }
+
+
+def run_load_test(
+    base_url,
+    username,
+    password,
+    clients=10,
+    duration=60,
+    scenarios=None,
+    seed=0,
+):
+    """Send a mix of scenarios from concurrent clients
+
+    Args:
+        base_url (str): server URL
+        username (str): API user
+        password (str): API user password
+        clients (int): number of concurrent clients
+        duration (float): run duration, in seconds
+        scenarios (list, optional): scenario names, all by default
+        seed (int): random seed of the scenarios mix
+
+    Returns:
+        dict: run parameters and statistics by scenario
+    """
+    selected = [s for s in SCENARIOS if not scenarios or s.name in scenarios]
+    if not selected:
+        raise ValueError("No scenario selected")
+    sessions = []
+    for _ in range(clients):
+        client = Client(base_url)
+        client.login(username, password)
+        sessions.append(client)
+    context = get_context(sessions[0])
+    prefix = get_api_prefix()
+    samples = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(index):
+        client = sessions[index]
+        rng = random.Random(seed * 1000 + index)
+        local = []
+        while time.monotonic() < deadline:
+            scenario = rng.choices(
+                selected, weights=[s.weight for s in selected]
+            )[0]
+            method, path, data = scenario.build(context, rng)
+            start = time.perf_counter()
+            try:
+                status, _ = client.request(method, prefix + path, data)
+            except OSError as e:
+                logger.warning(f"{scenario.name} request failed: {e}")
+                status = None
+            latency = time.perf_counter() - start
+            local.append(
+                (scenario.name, status in scenario.expected, latency, status)
+            )
+        with lock:
+            samples.extend(local)
+
+    started_at = now()
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(worker, range(clients)))
+    elapsed = time.monotonic() - start
+    return {
+        "started_at": started_at.isoformat(),
+        "base_url": base_url,
+        "clients": clients,
+        "duration": round(elapsed, 2),
+        "seed": seed,
+        "scenarios": summarize(samples, elapsed),
+    }
+
+
+def save_results(results, directory):
+    """Write results as ``<directory>/loadtest-<timestamp>.json``
+
+    Returns:
+        Path: results file
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = results["started_at"][:19].replace(":", "").replace("-", "")
+    path = directory / f"loadtest-{stamp}.json"
+    path.write_text(json.dumps(results, indent=2))
+    return path
+
+
+def compare(previous, current):
+    """Relative changes of throughput and latencies between two runs
+
+    Returns:
+        dict: ``{metric: (previous, current, change %)}`` by scenario
+    """
+    changes = {}
+    for name, stats in current["scenarios"].items():
+        before = previous["scenarios"].get(name)
+        if before is None:
+            continue
+        changes[name] = {}
+        for metric in ("rps", *(f"p{rank}_ms" for rank in PERCENTILES)):
+            old, new = before.get(metric), stats.get(metric)
+            change = (
+                round((new - old) / old * 100, 1)
+                if old and new is not None
+                else None
+            )
+            changes[name][metric] = (old, new, change)
+    return changes
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from sinp_metadata.conformance import RULES, check_conformance
+
+
+class Command(BaseCommand):
+    help = "Check the catalogue against SINP conformance rules"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "record_types",
+            nargs="*",
+            choices=list(RULES),
+            help="Record types to check (all by default)",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Check every record, not only the updated ones",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=2,
+            help="Number of worker processes (default: 2)",
+        )
+
+    def handle(self, *args, **options):
+        summary = check_conformance(
+            options["record_types"],
+            full=options["full"],
+            workers=options["workers"],
+        )
+        for record_type, (checked, failed) in summary.items():
+            self.stdout.write(
+                f"{record_type}: {checked} checked, {failed} non conforming"
+            )
@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from sinp_metadata.models import ApiToken
+
+
+class Command(BaseCommand):
+    help = "Create an API token for a user and print its key"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--label", default="")
+        parser.add_argument(
+            "--days", type=int, help="Validity in days (no expiration)"
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(
+                **{User.USERNAME_FIELD: options["username"]}
+            )
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown user {options['username']!r}")
+        expires_at = (
+            now() + timedelta(days=options["days"])
+            if options["days"]
+            else None
+        )
+        token, key = ApiToken.objects.create_token(
+            user, label=options["label"], expires_at=expires_at
+        )
+        self.stdout.write(key)
+        self.stderr.write(
+            self.style.SUCCESS(
+                f"Token {token.prefix}… created, its key is shown only once"
+            )
+        )
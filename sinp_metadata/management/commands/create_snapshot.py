@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from sinp_metadata.snapshots import create_snapshot, get_encodings
+
+
+class Command(BaseCommand):
+    help = "Export the catalogue as a precompressed snapshot"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep",
+            type=int,
+            default=7,
+            help="Number of snapshots to keep (default: 7)",
+        )
+
+    def handle(self, *args, **options):
+        if "br" not in get_encodings():
+            self.stderr.write(
+                self.style.WARNING("brotli is not installed, gzip only")
+            )
+        manifest = create_snapshot(keep=options["keep"])
+        for spec, count in manifest["counts"].items():
+            self.stdout.write(f"{spec}: {count} records")
+        self.stdout.write(
+            self.style.SUCCESS(f"Snapshot {manifest['name']} created")
+        )
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from sinp_metadata.outbox import BATCH_SIZE, dispatch_batch, get_sinks
+
+
+class Command(BaseCommand):
+    help = "Deliver outbox events to the configured webhooks and sinks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help=f"Maximum events per delivery (default: {BATCH_SIZE})",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait between database polls (default: 5)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Deliver currently pending events, then exit",
+        )
+
+    def handle(self, *args, **options):
+        sinks = get_sinks()
+        if not sinks:
+            self.stderr.write("No outbox sink configured")
+            return
+        total = 0
+        while True:
+            delivered = dispatch_batch(sinks, max(1, options["batch_size"]))
+            total += delivered
+            if delivered:
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["poll_interval"])
+        self.stdout.write(f"{total} events delivered")
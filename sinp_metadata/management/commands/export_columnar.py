@@ -0,0 +1,35 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from sinp_metadata.columnar import BATCH_SIZE, FORMATS, export_catalogue
+
+
+class Command(BaseCommand):
+    help = "Export frameworks and datasets as Parquet or Arrow IPC files"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "directory",
+            nargs="?",
+            help="Output directory (default: SINP_METADATA_COLUMNAR_DIR)",
+        )
+        parser.add_argument(
+            "--format", choices=list(FORMATS), default="parquet"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help=f"Rows per row group (default: {BATCH_SIZE})",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            counts = export_catalogue(
+                options["directory"], options["format"], options["batch_size"]
+            )
+        except ImproperlyConfigured as e:
+            raise CommandError(e)
+        for name, count in counts.items():
+            self.stdout.write(f"{name}: {count} rows")
+        self.stdout.write(self.style.SUCCESS("Columnar export done"))
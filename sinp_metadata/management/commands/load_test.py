@@ -0,0 +1,93 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sinp_metadata.loadtest import (
+    PERCENTILES,
+    SCENARIOS,
+    compare,
+    run_load_test,
+    save_results,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test a running metadata API server. Every client logs in as "
+        "the same user: list it in SINP_METADATA_THROTTLE_EXEMPT_USERS on "
+        "the server to measure raw throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url", default="http://localhost:8000", help="Server URL"
+        )
+        parser.add_argument("--username", required=True)
+        parser.add_argument("--password", required=True)
+        parser.add_argument("--clients", type=int, default=10)
+        parser.add_argument(
+            "--duration", type=float, default=60, help="In seconds"
+        )
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            choices=[scenario.name for scenario in SCENARIOS],
+            help="Scenario to run, repeatable (all by default)",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--output",
+            default="loadtest-results",
+            help="Results directory",
+        )
+        parser.add_argument(
+            "--compare", help="Previous results file to compare with"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            results = run_load_test(
+                options["url"],
+                options["username"],
+                options["password"],
+                clients=options["clients"],
+                duration=options["duration"],
+                scenarios=options["scenario"],
+                seed=options["seed"],
+            )
+        except (RuntimeError, ValueError) as e:
+            raise CommandError(e)
+        columns = ["requests", "errors", "rps"] + [
+            f"p{rank}_ms" for rank in PERCENTILES
+        ]
+        self.stdout.write(
+            f"{'scenario':<20}" + "".join(f"{c:>10}" for c in columns)
+        )
+        for name, stats in results["scenarios"].items():
+            self.stdout.write(
+                f"{name:<20}"
+                + "".join(f"{str(stats[c]):>10}" for c in columns)
+            )
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                previous = json.load(f)
+            self.stdout.write("\nChanges since the previous run (%):")
+            for name, changes in compare(previous, results).items():
+                self.stdout.write(
+                    f"{name:<20}"
+                    + "".join(
+                        f"{metric}={change} "
+                        for metric, (_, _, change) in changes.items()
+                    )
+                )
+        throttled = results["scenarios"].get("total", {}).get("throttled")
+        if throttled:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{throttled} requests throttled: the clients share the "
+                    f"rate limits of {options['username']!r}, exempt it with "
+                    "SINP_METADATA_THROTTLE_EXEMPT_USERS on the server"
+                )
+            )
+        path = save_results(results, options["output"])
+        self.stdout.write(self.style.SUCCESS(f"Results saved to {path}"))
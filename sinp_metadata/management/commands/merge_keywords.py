@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from sinp_metadata.keywords import find_duplicates, merge_keywords
+
+
+class Command(BaseCommand):
+    help = "Fold keywords sharing the same normalized form"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list duplicates, without merging them",
+        )
+
+    def handle(self, *args, **options):
+        mapping = find_duplicates()
+        for duplicate, canonical in sorted(mapping.items()):
+            self.stdout.write(f"{duplicate!r} -> {canonical!r}")
+        if options["dry_run"]:
+            self.stdout.write(f"{len(mapping)} duplicate keywords found")
+            return
+        merged = merge_keywords(mapping)
+        self.stdout.write(
+            self.style.SUCCESS(f"{merged} duplicate keywords merged")
+        )
@@ -0,0 +1,106 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils.timezone import now
+
+from sinp_metadata.jobs import claim_job, release_stale_jobs, run_job
+from sinp_metadata.models import Job
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Run pending metadata background jobs in a process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=2,
+            help="Number of worker processes (default: 2)",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5.0,
+            help="Seconds to wait between database polls (default: 5)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run currently pending jobs, then exit",
+        )
+
+    def handle(self, *args, **options):
+        released = release_stale_jobs()
+        if released:
+            self.stdout.write(f"{released} interrupted jobs queued again")
+        workers = max(1, options["workers"])
+        while True:
+            try:
+                with ProcessPoolExecutor(
+                    max_workers=workers, initializer=django.setup
+                ) as pool:
+                    self.run(pool, workers, options)
+                return
+            except BrokenProcessPool:
+                # A worker process died abruptly: start a new pool
+                logger.exception("Job process pool broken, restarting it")
+
+    def run(self, pool, workers, options):
+        running = {}
+        try:
+            while True:
+                pending = list(
+                    Job.objects.filter(status=Job.PENDING)
+                    .order_by("timestamp_create")
+                    .values_list("pk", flat=True)[: workers - len(running)]
+                )
+                claimed = [pk for pk in pending if claim_job(pk)]
+                # Forked workers must not inherit an open connection
+                connections.close_all()
+                self.submit(pool, claimed, running)
+
+                if not running:
+                    if options["once"]:
+                        return
+                    time.sleep(options["poll_interval"])
+                    continue
+
+                done, _ = wait(
+                    running,
+                    timeout=options["poll_interval"],
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    pk = running.pop(future)
+                    if future.exception() is not None:
+                        # The worker process died before storing a status
+                        self.fail(pk, str(future.exception()))
+                    self.stdout.write(f"Job #{pk} done")
+        except BrokenProcessPool:
+            for pk in running.values():
+                self.fail(pk, "Worker process pool broken")
+            raise
+
+    def submit(self, pool, claimed, running):
+        for i, pk in enumerate(claimed):
+            try:
+                running[pool.submit(run_job, pk)] = pk
+            except BrokenProcessPool:
+                # Not started, run them with the next pool
+                Job.objects.filter(
+                    pk__in=claimed[i:], status=Job.RUNNING
+                ).update(status=Job.PENDING, started_at=None, worker="")
+                raise
+            self.stdout.write(f"Starting job #{pk}")
+
+    def fail(self, pk, message):
+        Job.objects.filter(pk=pk, status=Job.RUNNING).update(
+            status=Job.FAILED, message=message, finished_at=now()
+        )
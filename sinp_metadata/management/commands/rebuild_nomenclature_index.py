@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from sinp_metadata.nomenclature_index import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the inverted index of datasets by nomenclature"
+
+    def handle(self, *args, **options):
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"{count} index entries"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from sinp_metadata.statistics import BUILDERS, refresh_statistics
+
+
+class Command(BaseCommand):
+    help = "Refresh the catalogue statistics summaries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "dimensions",
+            nargs="*",
+            choices=list(BUILDERS),
+            help="Dimensions to refresh (all by default)",
+        )
+
+    def handle(self, *args, **options):
+        counts = refresh_statistics(options["dimensions"])
+        for dimension, count in counts.items():
+            self.stdout.write(f"{dimension}: {count} rows")
+        self.stdout.write(self.style.SUCCESS("Statistics refreshed"))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from sinp_metadata.loadtest import clear_seed, seed
+
+
+class Command(BaseCommand):
+    help = "Create synthetic frameworks and datasets for load tests"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--frameworks", type=int, default=100)
+        parser.add_argument("--datasets-per-framework", type=int, default=10)
+        parser.add_argument("--keywords", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete the synthetic records instead",
+        )
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            counts = clear_seed()
+            for label, count in counts.items():
+                self.stdout.write(f"{label}: {count} deleted")
+            self.stdout.write(self.style.SUCCESS("Synthetic records deleted"))
+            return
+        counts = seed(
+            options["frameworks"],
+            options["datasets_per_framework"],
+            options["keywords"],
+            options["seed"],
+        )
+        for name, count in counts.items():
+            self.stdout.write(f"{name}: {count} created")
+        self.stdout.write(self.style.SUCCESS("Synthetic records created"))
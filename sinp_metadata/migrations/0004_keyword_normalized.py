@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:09
+
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def normalize(keyword):
+    decomposed = unicodedata.normalize("NFKD", keyword)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def populate_normalized(apps, schema_editor):
+    Keyword = apps.get_model("sinp_metadata", "Keyword")
+    keywords = list(Keyword.objects.all())
+    for keyword in keywords:
+        keyword.normalized = normalize(keyword.keyword)
+    Keyword.objects.bulk_update(keywords, ["normalized"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sinp_metadata", "0003_job"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="keyword",
+            name="normalized",
+            field=models.CharField(
+                db_index=True,
+                default="",
+                editable=False,
+                max_length=255,
+                verbose_name="Normalized keyword",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="keyword",
+            index=models.Index(
+                fields=["normalized"],
+                name="sinp_metadata_kw_prefix_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+        migrations.RunPython(populate_normalized, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sinp_metadata", "0004_keyword_normalized"),
+        ("sinp_nomenclatures", "0004_alter_nomenclature_parents"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="acquisitionframework",
+            index=models.Index(
+                fields=["timestamp_update", "id"],
+                name="sinp_metadata_af_harvest_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="dataset",
+            index=models.Index(
+                fields=["timestamp_update", "id"],
+                name="sinp_metadata_ds_harvest_idx",
+            ),
+        ),
+    ]
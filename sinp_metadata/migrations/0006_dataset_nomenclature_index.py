@@ -0,0 +1,93 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FIELDS = ("territory", "features", "ebv_classes", "collecting_method")
+
+
+def populate_index(apps, schema_editor):
+    Dataset = apps.get_model("sinp_metadata", "Dataset")
+    DatasetNomenclature = apps.get_model(
+        "sinp_metadata", "DatasetNomenclature"
+    )
+    for field in FIELDS:
+        through = getattr(Dataset, field).through
+        DatasetNomenclature.objects.bulk_create(
+            [
+                DatasetNomenclature(
+                    field=field,
+                    dataset_id=dataset,
+                    nomenclature_id=nomenclature,
+                )
+                for dataset, nomenclature in through.objects.values_list(
+                    "dataset_id", "nomenclature_id"
+                )
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sinp_metadata", "0005_harvest_indexes"),
+        ("sinp_nomenclatures", "0004_alter_nomenclature_parents"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DatasetNomenclature",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "field",
+                    models.CharField(
+                        choices=[
+                            ("territory", "territory"),
+                            ("features", "features"),
+                            ("ebv_classes", "ebv_classes"),
+                            ("collecting_method", "collecting_method"),
+                        ],
+                        max_length=50,
+                        verbose_name="Field",
+                    ),
+                ),
+                (
+                    "dataset",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="nomenclature_index",
+                        to="sinp_metadata.dataset",
+                        verbose_name="Dataset",
+                    ),
+                ),
+                (
+                    "nomenclature",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="dataset_index",
+                        to="sinp_nomenclatures.nomenclature",
+                        verbose_name="Nomenclature",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "datasets nomenclature index",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("field", "nomenclature", "dataset"),
+                        name="sinp_metadata_ds_nomenclature_uniq",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_index, migrations.RunPython.noop),
+    ]
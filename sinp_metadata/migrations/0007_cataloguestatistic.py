@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sinp_metadata", "0006_dataset_nomenclature_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CatalogueStatistic",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "dimension",
+                    models.CharField(
+                        choices=[
+                            (
+                                "frameworks_per_year",
+                                "Acquisition frameworks per start year",
+                            ),
+                            (
+                                "datasets_per_framework",
+                                "Datasets per acquisition framework",
+                            ),
+                            (
+                                "datasets_per_organism",
+                                "Datasets per actor organism",
+                            ),
+                            (
+                                "datasets_per_territory",
+                                "Datasets per territory",
+                            ),
+                        ],
+                        max_length=50,
+                        verbose_name="Dimension",
+                    ),
+                ),
+                ("key", models.CharField(max_length=50, verbose_name="Key")),
+                (
+                    "label",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        max_length=255,
+                        verbose_name="Label",
+                    ),
+                ),
+                (
+                    "value",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Value"
+                    ),
+                ),
+                (
+                    "refreshed_at",
+                    models.DateTimeField(verbose_name="Refresh date"),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "catalogue statistics",
+                "ordering": ["dimension", "-value", "key"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("dimension", "key"),
+                        name="sinp_metadata_statistic_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sinp_metadata", "0007_cataloguestatistic"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConformanceResult",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "record_type",
+                    models.CharField(
+                        choices=[
+                            ("acquisition_framework", "Acquisition framework"),
+                            ("dataset", "Dataset"),
+                        ],
+                        max_length=50,
+                        verbose_name="Record type",
+                    ),
+                ),
+                (
+                    "record_id",
+                    models.BigIntegerField(verbose_name="Record id"),
+                ),
+                (
+                    "conforming",
+                    models.BooleanField(
+                        db_index=True, verbose_name="Conforming"
+                    ),
+                ),
+                (
+                    "errors",
+                    models.JSONField(
+                        blank=True, default=list, verbose_name="Errors"
+                    ),
+                ),
+                (
+                    "record_updated_at",
+                    models.DateTimeField(verbose_name="Record update date"),
+                ),
+                (
+                    "checked_at",
+                    models.DateTimeField(verbose_name="Check date"),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "conformance results",
+                "ordering": ["record_type", "record_id"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("record_type", "record_id"),
+                        name="sinp_metadata_conformance_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sinp_metadata", "0008_conformanceresult"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeletedRecord",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "record_type",
+                    models.CharField(
+                        max_length=50, verbose_name="Record type"
+                    ),
+                ),
+                (
+                    "record_id",
+                    models.BigIntegerField(verbose_name="Record id"),
+                ),
+                ("uuid", models.UUIDField(verbose_name="Unique ID (UUID)")),
+                (
+                    "label",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        max_length=255,
+                        verbose_name="Label",
+                    ),
+                ),
+                (
+                    "deleted_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="Deletion date",
+                    ),
+                ),
+                (
+                    "deleted_by",
+                    models.ForeignKey(
+                        blank=True,
+                        editable=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "deleted records",
+                "ordering": ["-deleted_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["deleted_at", "id"],
+                        name="sinp_metadata_deleted_idx",
+                    )
+                ],
+            },
+        ),
+    ]
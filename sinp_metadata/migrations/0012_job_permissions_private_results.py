@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:48
+
+import sinp_metadata.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sinp_metadata", "0011_outboxevent"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="job",
+            options={
+                "ordering": ["-timestamp_create"],
+                "permissions": (
+                    (
+                        "run_catalogue_jobs",
+                        "Can run catalogue-wide jobs (snapshots, exports, checks)",
+                    ),
+                ),
+                "verbose_name_plural": "jobs",
+            },
+        ),
+        migrations.AlterField(
+            model_name="job",
+            name="result",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=sinp_metadata.models.job_result_storage,
+                upload_to="jobs/",
+                verbose_name="Result file",
+            ),
+        ),
+    ]
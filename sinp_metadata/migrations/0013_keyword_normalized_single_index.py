@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sinp_metadata", "0012_job_permissions_private_results"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="keyword",
+            name="normalized",
+            field=models.CharField(
+                default="",
+                editable=False,
+                max_length=255,
+                verbose_name="Normalized keyword",
+            ),
+        ),
+    ]
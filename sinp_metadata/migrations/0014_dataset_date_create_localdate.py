@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sinp_metadata", "0013_keyword_normalized_single_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="dataset",
+            name="date_create",
+            field=models.DateField(
+                default=django.utils.timezone.localdate,
+                help_text="Date de création de la fiche de métadonnées du jeu de données.",
+                verbose_name="Create date",
+            ),
+        ),
+    ]
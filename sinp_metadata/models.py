@@ -1,13 +1,18 @@
+import hashlib
+import os
+import secrets
+import unicodedata
 from datetime import date
 from uuid import uuid4
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.gis.db import models as gismodels
+from django.core.files.storage import FileSystemStorage
 from django.core.validators import RegexValidator
 from django.db import models
 from django.urls import reverse
-from django.utils.timezone import now
+from django.utils.timezone import localdate, now
 from django.utils.translation import gettext_lazy as _
 from sinp_nomenclatures.models import Nomenclature
 from sinp_organisms.models import Organism
@@ -60,6 +65,12 @@ class BaseModel(
         abstract = True
 
 
+class ActorRoleQuerySet(models.QuerySet):
+    def with_display(self):
+        """Actor roles with the relations read by ``__str__``"""
+        return self.select_related("organism", "legal_person", "actor_role")
+
+
 class ActorRole(BaseModel):
     legal_person = models.ForeignKey(
         User,
@@ -86,6 +97,8 @@ class ActorRole(BaseModel):
         ),
     )
 
+    objects = ActorRoleQuerySet.as_manager()
+
     def __str__(self):
         actor = self.organism or self.legal_person
         return f"{actor} ({self.actor_role.label})"
@@ -109,14 +122,49 @@ class ActorRole(BaseModel):
         ]
 
 
+def normalize_keyword(keyword):
+    """Case-folded, accent-stripped and trimmed keyword
+
+    Args:
+        keyword (str): raw keyword
+
+    Returns:
+        str: normalized keyword
+    """
+    decomposed = unicodedata.normalize("NFKD", keyword)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
 class Keyword(BaseModel):
     keyword = models.CharField(max_length=255, unique=True, primary_key=True)
+    normalized = models.CharField(
+        max_length=255,
+        editable=False,
+        default="",
+        verbose_name=_("Normalized keyword"),
+    )
 
     def __str__(self):
         return self.keyword
 
+    def save(self, *args, **kwargs):
+        self.normalized = normalize_keyword(self.keyword)
+        if "update_fields" in kwargs and kwargs["update_fields"] is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "normalized"}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name_plural = _("key words")
+        indexes = [
+            # Prefix lookups (LIKE 'abc%') on PostgreSQL, the pattern
+            # operator class also serves exact matches
+            models.Index(
+                fields=["normalized"],
+                name="sinp_metadata_kw_prefix_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ]
 
 
 class Publication(BaseModel):
@@ -206,6 +254,21 @@ class Project(BaseModel):
         verbose_name_plural = _("projects")
 
 
+class DatasetQuerySet(models.QuerySet):
+    def for_api(self):
+        """Datasets with the relations read by the API serializers"""
+        return self.select_related(
+            "data_type", "data_category", "data_origin_status"
+        ).prefetch_related(
+            "features",
+            "ebv_classes",
+            "collecting_method",
+            "collecting_protocol",
+            "keywords",
+            "territory",
+        )
+
+
 class Dataset(BaseModel):
     acquisition_framework = models.ForeignKey(
         "AcquisitionFramework",
@@ -232,7 +295,7 @@ class Dataset(BaseModel):
     )
     desc = models.TextField(verbose_name=_("Description"))
     date_create = models.DateField(
-        default=now,
+        default=localdate,
         verbose_name=_("Create date"),
         help_text=_(
             "Date de création de la fiche de métadonnées du jeu de données."
@@ -353,11 +416,20 @@ class Dataset(BaseModel):
     active = models.BooleanField(default=True, verbose_name=_("Actif"))
     validable = models.BooleanField(blank=True, verbose_name=_("Validable"))
 
+    objects = DatasetQuerySet.as_manager()
+
     def __str__(self):
         return f"#{self.pk} {self.label}"
 
     class Meta:
         verbose_name_plural = _("jeux de données")
+        indexes = [
+            # Keyset pagination of harvests
+            models.Index(
+                fields=["timestamp_update", "id"],
+                name="sinp_metadata_ds_harvest_idx",
+            ),
+        ]
         permissions = (
             (
                 "can_edit_self_dataset_organism",
@@ -366,6 +438,14 @@ class Dataset(BaseModel):
         )
 
 
+class AcquisitionFrameworkQuerySet(models.QuerySet):
+    def for_api(self):
+        """Frameworks with the relations read by the API serializers"""
+        return self.select_related("territory_level").prefetch_related(
+            "objective", "territory", "keywords", "actors"
+        )
+
+
 class AcquisitionFramework(BaseModel):
     label = models.CharField(max_length=255, verbose_name=_("Libellé"))
     desc = models.TextField(verbose_name=_("Description"))
@@ -423,8 +503,17 @@ class AcquisitionFramework(BaseModel):
         blank=True, null=True, verbose_name=_("Date de fin")
     )
 
+    objects = AcquisitionFrameworkQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = _("cadres d'acquisition")
+        indexes = [
+            # Keyset pagination of harvests
+            models.Index(
+                fields=["timestamp_update", "id"],
+                name="sinp_metadata_af_harvest_idx",
+            ),
+        ]
         permissions = (
             (
                 "can_edit_self_acquisitionframework_organism",
@@ -442,6 +531,361 @@ class AcquisitionFramework(BaseModel):
         )
 
 
+def job_result_storage():
+    """Storage of job results, kept out of ``MEDIA_ROOT``
+
+    Results are only served by the ``jobs/<pk>/result`` endpoint, to the
+    job owner.
+    """
+    return FileSystemStorage(
+        location=getattr(
+            settings,
+            "SINP_METADATA_JOB_RESULT_DIR",
+            os.path.join(
+                os.path.dirname(os.path.abspath(settings.MEDIA_ROOT)),
+                "private",
+                "metadata",
+            ),
+        ),
+        base_url=None,
+    )
+
+
+class Job(BaseModel):
+    """Background job, run by the ``metadata_worker`` management command"""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCESS = "success"
+    FAILED = "failed"
+    STATUS = (
+        (PENDING, _("Pending")),
+        (RUNNING, _("Running")),
+        (SUCCESS, _("Success")),
+        (FAILED, _("Failed")),
+    )
+
+    kind = models.CharField(max_length=100, verbose_name=_("Kind"))
+    params = models.JSONField(
+        default=dict, blank=True, verbose_name=_("Parameters")
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS,
+        default=PENDING,
+        db_index=True,
+        verbose_name=_("Status"),
+    )
+    progress = models.PositiveSmallIntegerField(
+        default=0, verbose_name=_("Progress (%)")
+    )
+    message = models.TextField(
+        default="", blank=True, verbose_name=_("Message")
+    )
+    result = models.FileField(
+        blank=True,
+        null=True,
+        upload_to="jobs/",
+        storage=job_result_storage,
+        verbose_name=_("Result file"),
+    )
+    worker = models.CharField(
+        max_length=255, default="", blank=True, verbose_name=_("Worker")
+    )
+    started_at = models.DateTimeField(
+        blank=True, null=True, verbose_name=_("Start date")
+    )
+    finished_at = models.DateTimeField(
+        blank=True, null=True, verbose_name=_("End date")
+    )
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} ({self.status})"
+
+    class Meta:
+        verbose_name_plural = _("jobs")
+        ordering = ["-timestamp_create"]
+        permissions = (
+            (
+                "run_catalogue_jobs",
+                "Can run catalogue-wide jobs (snapshots, exports, checks)",
+            ),
+        )
+
+    def report_progress(self, progress, message=None):
+        """Store job progress without touching other columns
+
+        Args:
+            progress (int): progress percentage
+            message (str, optional): progress message
+        """
+        self.progress = max(0, min(int(progress), 100))
+        fields = {"progress": self.progress}
+        if message is not None:
+            self.message = fields["message"] = message
+        Job.objects.filter(pk=self.pk).update(**fields)
+
+    def save_result(self, name, content):
+        """Store job result file
+
+        Args:
+            name (str): result file name
+            content (File): result file content
+        """
+        self.result.save(name, content, save=False)
+        Job.objects.filter(pk=self.pk).update(result=self.result.name)
+
+
+class DatasetNomenclature(models.Model):
+    """Inverted index of datasets by nomenclature
+
+    One row per dataset and nomenclature of the indexed M2M fields, kept
+    up to date by :mod:`sinp_metadata.nomenclature_index`.
+    """
+
+    FIELDS = ("territory", "features", "ebv_classes", "collecting_method")
+
+    field = models.CharField(
+        max_length=50,
+        choices=[(name, name) for name in FIELDS],
+        verbose_name=_("Field"),
+    )
+    nomenclature = models.ForeignKey(
+        Nomenclature,
+        on_delete=models.CASCADE,
+        related_name="dataset_index",
+        verbose_name=_("Nomenclature"),
+    )
+    dataset = models.ForeignKey(
+        "Dataset",
+        on_delete=models.CASCADE,
+        related_name="nomenclature_index",
+        verbose_name=_("Dataset"),
+    )
+
+    def __str__(self):
+        return f"{self.field} #{self.nomenclature_id} > #{self.dataset_id}"
+
+    class Meta:
+        verbose_name_plural = _("datasets nomenclature index")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["field", "nomenclature", "dataset"],
+                name="sinp_metadata_ds_nomenclature_uniq",
+            ),
+        ]
+
+
+class CatalogueStatistic(models.Model):
+    """Precomputed catalogue count, refreshed by ``refresh_statistics``"""
+
+    FRAMEWORKS_PER_YEAR = "frameworks_per_year"
+    DATASETS_PER_FRAMEWORK = "datasets_per_framework"
+    DATASETS_PER_ORGANISM = "datasets_per_organism"
+    DATASETS_PER_TERRITORY = "datasets_per_territory"
+    DIMENSIONS = (
+        (FRAMEWORKS_PER_YEAR, _("Acquisition frameworks per start year")),
+        (DATASETS_PER_FRAMEWORK, _("Datasets per acquisition framework")),
+        (DATASETS_PER_ORGANISM, _("Datasets per actor organism")),
+        (DATASETS_PER_TERRITORY, _("Datasets per territory")),
+    )
+
+    dimension = models.CharField(
+        max_length=50, choices=DIMENSIONS, verbose_name=_("Dimension")
+    )
+    key = models.CharField(max_length=50, verbose_name=_("Key"))
+    label = models.CharField(
+        max_length=255, default="", blank=True, verbose_name=_("Label")
+    )
+    value = models.PositiveIntegerField(default=0, verbose_name=_("Value"))
+    refreshed_at = models.DateTimeField(verbose_name=_("Refresh date"))
+
+    def __str__(self):
+        return f"{self.dimension} {self.key}: {self.value}"
+
+    class Meta:
+        verbose_name_plural = _("catalogue statistics")
+        ordering = ["dimension", "-value", "key"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dimension", "key"],
+                name="sinp_metadata_statistic_uniq",
+            ),
+        ]
+
+
+class ConformanceResult(models.Model):
+    """SINP conformance of a record, stored by ``check_conformance``"""
+
+    ACQUISITION_FRAMEWORK = "acquisition_framework"
+    DATASET = "dataset"
+    RECORD_TYPES = (
+        (ACQUISITION_FRAMEWORK, _("Acquisition framework")),
+        (DATASET, _("Dataset")),
+    )
+
+    record_type = models.CharField(
+        max_length=50, choices=RECORD_TYPES, verbose_name=_("Record type")
+    )
+    record_id = models.BigIntegerField(verbose_name=_("Record id"))
+    conforming = models.BooleanField(
+        db_index=True, verbose_name=_("Conforming")
+    )
+    errors = models.JSONField(
+        default=list, blank=True, verbose_name=_("Errors")
+    )
+    record_updated_at = models.DateTimeField(
+        verbose_name=_("Record update date")
+    )
+    checked_at = models.DateTimeField(verbose_name=_("Check date"))
+
+    def __str__(self):
+        return f"{self.record_type} #{self.record_id}: {self.conforming}"
+
+    class Meta:
+        verbose_name_plural = _("conformance results")
+        ordering = ["record_type", "record_id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["record_type", "record_id"],
+                name="sinp_metadata_conformance_uniq",
+            ),
+        ]
+
+
+class DeletedRecord(models.Model):
+    """Tombstone of a record removed by a bulk deletion"""
+
+    record_type = models.CharField(
+        max_length=50, verbose_name=_("Record type")
+    )
+    record_id = models.BigIntegerField(verbose_name=_("Record id"))
+    uuid = models.UUIDField(verbose_name=_("Unique ID (UUID)"))
+    label = models.CharField(
+        max_length=255, default="", blank=True, verbose_name=_("Label")
+    )
+    deleted_at = models.DateTimeField(
+        default=now, verbose_name=_("Deletion date")
+    )
+    deleted_by = models.ForeignKey(
+        User,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="+",
+        on_delete=models.SET_NULL,
+    )
+
+    def __str__(self):
+        return f"{self.record_type} #{self.record_id} {self.label}"
+
+    class Meta:
+        verbose_name_plural = _("deleted records")
+        ordering = ["-deleted_at"]
+        indexes = [
+            models.Index(
+                fields=["deleted_at", "id"],
+                name="sinp_metadata_deleted_idx",
+            ),
+        ]
+
+
+class ApiTokenManager(models.Manager):
+    def create_token(self, user, label="", expires_at=None):
+        """Create a token for a user
+
+        Returns:
+            tuple: token and its key, which is not stored
+        """
+        key = secrets.token_urlsafe(32)
+        token = self.create(
+            user=user,
+            label=label,
+            prefix=key[:8],
+            key_digest=ApiToken.digest(key),
+            expires_at=expires_at,
+        )
+        return token, key
+
+
+class ApiToken(models.Model):
+    """API authentication token, stored as a SHA-256 digest"""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="api_tokens"
+    )
+    label = models.CharField(
+        max_length=255, default="", blank=True, verbose_name=_("Label")
+    )
+    prefix = models.CharField(
+        max_length=8, editable=False, verbose_name=_("Key prefix")
+    )
+    key_digest = models.CharField(max_length=64, unique=True, editable=False)
+    created_at = models.DateTimeField(
+        default=now, verbose_name=_("Creation date")
+    )
+    expires_at = models.DateTimeField(
+        null=True, blank=True, verbose_name=_("Expiration date")
+    )
+    revoked = models.BooleanField(default=False, verbose_name=_("Revoked"))
+
+    objects = ApiTokenManager()
+
+    @staticmethod
+    def digest(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def __str__(self):
+        return f"{self.prefix}… {self.label}"
+
+    class Meta:
+        verbose_name_plural = _("API tokens")
+
+
+class OutboxEvent(models.Model):
+    """Change of a record, waiting for delivery to partners
+
+    Written in the transaction of the change, delivered by the
+    ``dispatch_outbox`` management command.
+    """
+
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+    ACTIONS = (
+        (CREATE, _("Create")),
+        (UPDATE, _("Update")),
+        (DELETE, _("Delete")),
+    )
+
+    record_type = models.CharField(
+        max_length=50, verbose_name=_("Record type")
+    )
+    record_id = models.BigIntegerField(verbose_name=_("Record id"))
+    action = models.CharField(
+        max_length=10, choices=ACTIONS, verbose_name=_("Action")
+    )
+    created_at = models.DateTimeField(
+        default=now, verbose_name=_("Creation date")
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0, verbose_name=_("Delivery attempts")
+    )
+    next_attempt_at = models.DateTimeField(
+        null=True, blank=True, verbose_name=_("Next attempt date")
+    )
+    last_error = models.TextField(
+        default="", blank=True, verbose_name=_("Last error")
+    )
+
+    def __str__(self):
+        return f"{self.action} {self.record_type} #{self.record_id}"
+
+    class Meta:
+        verbose_name_plural = _("outbox events")
+        ordering = ["pk"]
+
+
 # @receiver(pre_save, sender=User)
 # def pre_save_user(sender, instance, **kwargs):
 #     if not instance._state.adding:
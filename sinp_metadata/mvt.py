@@ -0,0 +1,170 @@
+"""Minimal Mapbox Vector Tile (v2) encoder
+
+Only polygon layers are supported, which is all dataset footprints need.
+Used when the database can't build tiles itself (``ST_AsMVT``).
+"""
+
+import struct
+
+EXTENT = 4096
+
+# Geometry commands
+MOVE_TO = 1
+LINE_TO = 2
+CLOSE_PATH = 7
+POLYGON = 3
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field, payload):
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def _uint_field(field, value):
+    return _key(field, 0) + _varint(value)
+
+
+def _packed_field(field, values):
+    return _bytes_field(field, b"".join(_varint(v) for v in values))
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 31)
+
+
+def _command(command, count):
+    return (command & 0x7) | (count << 3)
+
+
+def _ring_area(ring):
+    return sum(
+        x0 * y1 - x1 * y0
+        for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1])
+    )
+
+
+def _encode_value(value):
+    if isinstance(value, bool):
+        return _uint_field(7, int(value))
+    if isinstance(value, int):
+        return _key(6, 0) + _varint((value << 1) ^ (value >> 63))
+    if isinstance(value, float):
+        return _key(3, 1) + struct.pack("<d", value)
+    return _bytes_field(1, str(value).encode())
+
+
+def to_tile_coords(coords, bounds, extent=EXTENT):
+    """Project coordinates to integer tile coordinates (y axis down)"""
+    minx, miny, maxx, maxy = bounds
+    sx = extent / (maxx - minx)
+    sy = extent / (maxy - miny)
+    ring = []
+    for x, y in coords:
+        point = (round((x - minx) * sx), round((maxy - y) * sy))
+        if not ring or ring[-1] != point:
+            ring.append(point)
+    if len(ring) > 1 and ring[0] == ring[-1]:
+        ring.pop()
+    return ring
+
+
+def encode_polygons(polygons):
+    """Encode polygon rings as MVT geometry commands
+
+    Args:
+        polygons (list): polygons, as lists of rings in tile coordinates
+            (exterior ring first)
+
+    Returns:
+        list: command integers
+    """
+    commands = []
+    cx = cy = 0
+    for rings in polygons:
+        for index, ring in enumerate(rings):
+            area = _ring_area(ring) if len(ring) >= 3 else 0
+            if area == 0:
+                # A degenerate exterior ring drops the whole polygon
+                if index == 0:
+                    break
+                continue
+            # Exterior rings have a positive area, interior rings negative
+            if (area > 0) != (index == 0):
+                ring = ring[::-1]
+            x, y = ring[0]
+            commands += [
+                _command(MOVE_TO, 1),
+                _zigzag(x - cx),
+                _zigzag(y - cy),
+            ]
+            cx, cy = x, y
+            commands.append(_command(LINE_TO, len(ring) - 1))
+            for x, y in ring[1:]:
+                commands += [_zigzag(x - cx), _zigzag(y - cy)]
+                cx, cy = x, y
+            commands.append(_command(CLOSE_PATH, 1))
+    return commands
+
+
+def encode_layer(name, features, extent=EXTENT):
+    """Encode a polygon layer as an MVT tile
+
+    Args:
+        name (str): layer name
+        features (list): ``(id, polygons, properties)`` tuples, polygons in
+            tile coordinates (see :func:`encode_polygons`)
+        extent (int): tile extent
+
+    Returns:
+        bytes: tile content, empty if there is no feature
+    """
+    keys = {}
+    values = {}
+    encoded = []
+    for feature_id, polygons, properties in features:
+        geometry = encode_polygons(polygons)
+        if not geometry:
+            continue
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        encoded.append(
+            _bytes_field(
+                2,
+                _uint_field(1, feature_id)
+                + (_packed_field(2, tags) if tags else b"")
+                + _uint_field(3, POLYGON)
+                + _packed_field(4, geometry),
+            )
+        )
+    if not encoded:
+        return b""
+    layer = (
+        _uint_field(15, 2)
+        + _bytes_field(1, name.encode())
+        + b"".join(encoded)
+        + b"".join(_bytes_field(3, key.encode()) for key in keys)
+        + b"".join(
+            _bytes_field(4, _encode_value(value)) for _, value in values
+        )
+        + _uint_field(5, extent)
+    )
+    return _bytes_field(3, layer)
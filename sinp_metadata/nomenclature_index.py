@@ -0,0 +1,165 @@
+"""Inverted index of datasets by nomenclature
+
+``DatasetNomenclature`` holds one row per dataset and nomenclature of the
+indexed M2M fields (territory, features, EBV classes, collecting method).
+Multi-criteria questions ("datasets on territory X with feature Y") are
+answered by intersecting posting lists in a single grouped query on that
+table, instead of joining every through table.
+
+The index is maintained incrementally from ``m2m_changed`` and
+``bulk_changed`` signals (see :mod:`sinp_metadata.signals`) and can be
+rebuilt with the ``rebuild_nomenclature_index`` management command.
+"""
+
+import logging
+
+from django.db import transaction
+from django.db.models import Count, Q
+from rest_framework.exceptions import ValidationError
+
+from .models import Dataset, DatasetNomenclature
+
+logger = logging.getLogger(__name__)
+
+FIELDS = DatasetNomenclature.FIELDS
+BATCH_SIZE = 1000
+
+
+def get_through(field):
+    return getattr(Dataset, field).through
+
+
+def _rows(field, dataset_pks=None):
+    through = get_through(field)
+    qs = through.objects.all()
+    if dataset_pks is not None:
+        qs = qs.filter(dataset__in=dataset_pks)
+    return qs.values_list("dataset_id", "nomenclature_id")
+
+
+def add_entries(field, pairs):
+    """Index ``(dataset pk, nomenclature pk)`` pairs of a field"""
+    DatasetNomenclature.objects.bulk_create(
+        [
+            DatasetNomenclature(
+                field=field, dataset_id=dataset, nomenclature_id=nomenclature
+            )
+            for dataset, nomenclature in pairs
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def remove_entries(field, pairs):
+    """Drop ``(dataset pk, nomenclature pk)`` pairs of a field"""
+    pairs = list(pairs)
+    if not pairs:
+        return
+    condition = Q()
+    for dataset, nomenclature in pairs:
+        condition |= Q(dataset=dataset, nomenclature=nomenclature)
+    DatasetNomenclature.objects.filter(condition, field=field).delete()
+
+
+def reindex_datasets(dataset_pks, fields=FIELDS):
+    """Rebuild the index entries of some datasets
+
+    Args:
+        dataset_pks (list): datasets to reindex
+        fields (iterable): indexed fields to rebuild
+    """
+    fields = [field for field in fields if field in FIELDS]
+    if not dataset_pks or not fields:
+        return
+    with transaction.atomic():
+        DatasetNomenclature.objects.filter(
+            dataset__in=dataset_pks, field__in=fields
+        ).delete()
+        for field in fields:
+            add_entries(field, _rows(field, dataset_pks))
+
+
+def rebuild_index():
+    """Rebuild the whole index from the through tables
+
+    Returns:
+        int: number of index entries
+    """
+    with transaction.atomic():
+        DatasetNomenclature.objects.all().delete()
+        for field in FIELDS:
+            add_entries(field, _rows(field).iterator(chunk_size=BATCH_SIZE))
+    count = DatasetNomenclature.objects.count()
+    logger.info(f"Nomenclature index rebuilt ({count} entries)")
+    return count
+
+
+def matching_datasets(criteria):
+    """Datasets matching every criterion
+
+    Nomenclatures of a same field are alternatives (OR), fields are
+    combined (AND).
+
+    Args:
+        criteria (dict): nomenclature pks by indexed field name
+
+    Returns:
+        queryset: dataset pks, usable as a subquery
+    """
+    criteria = {field: pks for field, pks in criteria.items() if pks}
+    condition = Q()
+    for field, pks in criteria.items():
+        if field not in FIELDS:
+            raise ValueError(f"{field} is not an indexed field")
+        condition |= Q(field=field, nomenclature__in=pks)
+    return (
+        DatasetNomenclature.objects.filter(condition)
+        .values("dataset")
+        .annotate(matches=Count("field", distinct=True))
+        .filter(matches=len(criteria))
+        .values("dataset")
+    )
+
+
+def parse_criteria(params):
+    """Read criteria from query parameters (``territory=1,2&features=3``)
+
+    Returns:
+        dict: nomenclature pks by indexed field name
+    """
+    criteria = {}
+    for field in FIELDS:
+        values = params.get(field)
+        if not values:
+            continue
+        try:
+            criteria[field] = [int(pk) for pk in values.split(",") if pk]
+        except ValueError:
+            raise ValueError(f"{field}: expected comma separated ids")
+    return criteria
+
+
+class NomenclatureIndexFilterMixin(object):
+    """Filter dataset lists on indexed nomenclatures
+
+    ``?territory=1,2&features=3`` keeps datasets on territory 1 or 2 and
+    with feature 3. Only ``nomenclature_filter_actions`` are filtered.
+    """
+
+    nomenclature_filter_actions = ("list", "facets")
+
+    def get_queryset(self, *args, **kwargs):
+        qs = super().get_queryset()
+        if (
+            getattr(self, "action", None)
+            not in self.nomenclature_filter_actions
+        ):
+            return qs
+        try:
+            criteria = parse_criteria(self.request.query_params)
+        except ValueError as error:
+            raise ValidationError(str(error))
+        if criteria:
+            qs = qs.filter(pk__in=matching_datasets(criteria))
+        return qs
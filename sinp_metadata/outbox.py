@@ -0,0 +1,302 @@
+"""Transactional outbox of record changes, pushed to partners
+
+Changes of frameworks, datasets and actor roles are written as
+:class:`~sinp_metadata.models.OutboxEvent` rows in the transaction of the
+change (see :mod:`sinp_metadata.signals`), so an event exists if and only
+if its change is committed. API writes run in a transaction with
+:class:`TransactionalWriteMixin`, batch writes and deletions in their
+own, and admin views are atomic.
+
+The ``dispatch_outbox`` command delivers events in batches, in order, to
+every configured sink. A batch is leased (its ``next_attempt_at`` is
+postponed) in a short transaction, so no lock is held while sinks are
+called; other dispatchers wait for the lease to expire. Repeated events
+on a record within a batch are coalesced into one. A failed batch is
+retried with an exponential backoff and blocks the following ones, so
+partners receive changes in order; delivery is at least once.
+
+Settings::
+
+    SINP_METADATA_OUTBOX_SINKS = [
+        # JSON ``{"events": [...]}`` POSTed to a webhook
+        "https://partner.example.org/hooks/metadata",
+        # events appended as NDJSON lines
+        "file:///var/lib/dbchiro/outbox.ndjson",
+        # one JSON file per batch in a spool directory
+        "queue:///var/spool/dbchiro/outbox",
+    ]
+    # optional, signs webhook bodies (X-Signature: sha256=<HMAC>)
+    SINP_METADATA_OUTBOX_SECRET = "..."
+    SINP_METADATA_OUTBOX_TIMEOUT = 10
+
+No event is written while no sink is configured.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import urllib.request
+from datetime import timedelta
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.timezone import now
+
+from .models import AcquisitionFramework, ActorRole, Dataset, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+BACKOFF_BASE = 10
+BACKOFF_MAX = 3600
+RECORD_TYPES = {
+    AcquisitionFramework: "acquisition_framework",
+    Dataset: "dataset",
+    ActorRole: "actor_role",
+}
+
+
+def get_sink_urls():
+    return getattr(settings, "SINP_METADATA_OUTBOX_SINKS", [])
+
+
+def is_enabled():
+    return bool(get_sink_urls())
+
+
+def record_events(model, pks, action, using=DEFAULT_DB_ALIAS):
+    """Write outbox events in the current transaction
+
+    Args:
+        model: changed model, ignored if it has no record type
+        pks (iterable): changed records primary keys
+        action (str): ``create``, ``update`` or ``delete``
+        using (str): database alias of the change
+    """
+    record_type = RECORD_TYPES.get(model)
+    if record_type is None or not is_enabled():
+        return
+    created_at = now()
+    OutboxEvent.objects.using(using).bulk_create(
+        [
+            OutboxEvent(
+                record_type=record_type,
+                record_id=pk,
+                action=action,
+                created_at=created_at,
+            )
+            for pk in pks
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+def coalesce(events):
+    """One change per record, in order of their last event
+
+    A record created then updated is created; created then deleted within
+    the batch, it is dropped.
+
+    Args:
+        events (list): outbox events, in order
+
+    Returns:
+        list: change dicts (``type``, ``id``, ``action``, ``changed_at``)
+    """
+    changes = {}
+    for event in events:
+        key = (event.record_type, event.record_id)
+        action = event.action
+        previous = changes.pop(key, None)
+        if previous is not None:
+            if previous["action"] == OutboxEvent.CREATE:
+                # The creation was never delivered
+                deleted = action == OutboxEvent.DELETE
+                action = None if deleted else OutboxEvent.CREATE
+            elif action != OutboxEvent.DELETE:
+                action = OutboxEvent.UPDATE
+        changes[key] = {
+            "type": event.record_type,
+            "id": event.record_id,
+            "action": action,
+            "changed_at": event.created_at.isoformat(),
+        }
+    return [change for change in changes.values() if change["action"]]
+
+
+class WebhookSink:
+    """POST batches as JSON to a URL"""
+
+    def __init__(self, url):
+        self.url = url
+
+    def deliver(self, changes):
+        body = json.dumps({"events": changes}).encode()
+        request = urllib.request.Request(
+            self.url,
+            data=body,
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        secret = getattr(settings, "SINP_METADATA_OUTBOX_SECRET", None)
+        if secret:
+            signature = hmac.new(
+                secret.encode(), body, hashlib.sha256
+            ).hexdigest()
+            request.add_header("X-Signature", f"sha256={signature}")
+        # Error statuses raise HTTPError
+        with urllib.request.urlopen(
+            request, timeout=get_timeout()
+        ) as response:
+            response.read()
+
+
+class FileSink:
+    """Append changes to a file, as NDJSON lines"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def deliver(self, changes):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            for change in changes:
+                f.write(json.dumps(change) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class QueueSink:
+    """Write each batch as a JSON file of a spool directory
+
+    Files are published atomically and named in delivery order.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def deliver(self, changes):
+        self.path.mkdir(parents=True, exist_ok=True)
+        name = f"{now().strftime('%Y%m%dT%H%M%S%fZ')}.json"
+        tmp_path = self.path / f".{name}.tmp"
+        tmp_path.write_text(json.dumps({"events": changes}))
+        os.replace(tmp_path, self.path / name)
+
+
+SINKS = {
+    "http": WebhookSink,
+    "https": WebhookSink,
+    "file": FileSink,
+    "queue": QueueSink,
+}
+
+
+def get_sinks():
+    """Sinks of the ``SINP_METADATA_OUTBOX_SINKS`` setting"""
+    sinks = []
+    for url in get_sink_urls():
+        parts = urlsplit(url)
+        if parts.scheme not in SINKS:
+            raise ImproperlyConfigured(f"Unknown outbox sink {url!r}")
+        target = url if parts.scheme.startswith("http") else parts.path
+        sinks.append(SINKS[parts.scheme](target))
+    return sinks
+
+
+def get_timeout():
+    return getattr(settings, "SINP_METADATA_OUTBOX_TIMEOUT", 10)
+
+
+def get_lease(sinks):
+    """How long a dispatcher may deliver a batch before it is retried"""
+    return timedelta(seconds=get_timeout() * len(sinks) + BACKOFF_BASE)
+
+
+def get_backoff(attempts):
+    """Delay before the next attempt, after ``attempts`` failures"""
+    return timedelta(
+        seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    )
+
+
+def claim_batch(batch_size, lease):
+    """Lease the oldest pending events, unless the head one waits
+
+    Returns:
+        list: leased events, in order
+    """
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update().order_by("pk")[:batch_size]
+        )
+        if not events:
+            return []
+        head = events[0]
+        if head.next_attempt_at is not None and head.next_attempt_at > now():
+            return []
+        OutboxEvent.objects.filter(
+            pk__in=[event.pk for event in events]
+        ).update(next_attempt_at=now() + lease)
+    return events
+
+
+def dispatch_batch(sinks=None, batch_size=BATCH_SIZE):
+    """Deliver the oldest pending events to every sink
+
+    Delivered events are deleted. On failure, the batch is postponed and
+    no later event is delivered before it.
+
+    Args:
+        sinks (list, optional): sinks, defaults to the configured ones
+        batch_size (int): maximum number of events
+
+    Returns:
+        int: number of delivered events, 0 when there is none or the
+        batch is postponed
+    """
+    if sinks is None:
+        sinks = get_sinks()
+    events = claim_batch(batch_size, get_lease(sinks))
+    if not events:
+        return 0
+    pks = [event.pk for event in events]
+    changes = coalesce(events)
+    try:
+        if changes:
+            for sink in sinks:
+                sink.deliver(changes)
+    except Exception as e:
+        attempts = events[0].attempts + 1
+        OutboxEvent.objects.filter(pk__in=pks).update(
+            attempts=attempts,
+            next_attempt_at=now() + get_backoff(attempts),
+            last_error=str(e),
+        )
+        logger.warning(
+            f"Outbox delivery of {len(events)} events failed "
+            f"(attempt {attempts}): {e}"
+        )
+        return 0
+    OutboxEvent.objects.filter(pk__in=pks).delete()
+    logger.info(
+        f"Outbox: {len(events)} events delivered as {len(changes)} changes"
+    )
+    return len(events)
+
+
+class TransactionalWriteMixin:
+    """Viewset mixin saving a record, its M2M links and their outbox
+    events in one transaction"""
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            super().perform_update(serializer)
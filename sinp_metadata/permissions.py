@@ -2,15 +2,116 @@ import logging
 
 # from django.contrib.auth import get_user_model
 from django.db.models import Q
-from rest_framework.permissions import BasePermission
-from sinp_nomenclatures.models import Nomenclature
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS, BasePermission
 from sinp_organisms.models import OrganismMember
 
-from .models import ActorRole
+from .models import AcquisitionFramework, ActorRole
+from .rules import editable_predicate
 
 logger = logging.getLogger(__name__)
 
 
+def has_all_data_access(user):
+    """Users allowed to read every metadata record"""
+    return (
+        getattr(user, "access_all_data", False)
+        or getattr(user, "edit_all_data", False)
+        or user.is_superuser
+    )
+
+
+def user_acquisition_frameworks(user):
+    """Acquisition frameworks involving the user or its organisms
+
+    Returns:
+        queryset
+    """
+    # Users authenticated by token carry their organism ids
+    user_organisms = getattr(user, "organism_ids", None)
+    if user_organisms is None:
+        user_organisms = user.organism_member.all()
+    actor_role = ActorRole.objects.filter(
+        Q(organism__in=user_organisms) | Q(legal_person=user)
+    )
+    return AcquisitionFramework.objects.filter(
+        Q(actors__in=actor_role) | Q(created_by=user)
+    ).values("pk")
+
+
+def filter_visible_acquisition_frameworks(qs, user):
+    """Restrict an acquisition frameworks queryset to the user's scope"""
+    if has_all_data_access(user):
+        return qs
+    return qs.filter(pk__in=user_acquisition_frameworks(user))
+
+
+def filter_visible_datasets(qs, user):
+    """Restrict a datasets queryset to the user's scope"""
+    if has_all_data_access(user):
+        return qs
+    return qs.filter(
+        Q(acquisition_framework__in=user_acquisition_frameworks(user))
+        | Q(created_by=user)
+    )
+
+
+def has_all_edit_access(user):
+    """Users allowed to edit every metadata record"""
+    return bool(
+        user.is_active
+        and (getattr(user, "edit_all_data", False) or user.is_superuser)
+    )
+
+
+def get_editable_pks(user, model, pks):
+    """Records of a page the user may edit, resolved in one query
+
+    Args:
+        user (User): checked user
+        model: ``AcquisitionFramework`` or ``Dataset``
+        pks (iterable): primary keys of the page
+
+    Returns:
+        set: editable primary keys
+    """
+    pks = set(pks)
+    if not pks or not user.is_authenticated:
+        return set()
+    if has_all_edit_access(user):
+        return pks
+    return set(
+        model._base_manager.filter(pk__in=pks)
+        .filter(editable_predicate(user, model))
+        .values_list("pk", flat=True)
+    )
+
+
+def filter_editable(qs, user, editable=True):
+    """Restrict a queryset to the records the user may (not) edit"""
+    if has_all_edit_access(user):
+        return qs if editable else qs.none()
+    if not user.is_authenticated:
+        return qs.none() if editable else qs
+    predicate = editable_predicate(user, qs.model)
+    return qs.filter(predicate) if editable else qs.exclude(predicate)
+
+
+class EditableFilterMixin(object):
+    """Filter lists on edit rights (``?can_edit=true/false``)"""
+
+    def get_queryset(self, *args, **kwargs):
+        qs = super().get_queryset()
+        if getattr(self, "swagger_fake_view", False) or self.action != "list":
+            return qs
+        value = self.request.query_params.get("can_edit")
+        if value is None:
+            return qs
+        if value not in ("true", "false"):
+            raise ValidationError({"can_edit": ["Expected true or false"]})
+        return filter_editable(qs, self.request.user, value == "true")
+
+
 class AcquisitionFrameworkListPermissionsMixin(object):
     """Mixin used for Sighting lists permissions"""
 
@@ -22,48 +123,76 @@ class AcquisitionFrameworkListPermissionsMixin(object):
         """
 
         qs = super().get_queryset()
-        user = self.request.user
+        if getattr(self, "swagger_fake_view", False):
+            return qs.none()
         # user = get_user_model().objects.get(id=logged_user.id)
+        return filter_visible_acquisition_frameworks(qs, self.request.user)
 
-        if user.access_all_data or user.edit_all_data or user.is_superuser:
-            return qs
-        else:
-            user_organisms = user.organism_member.all()
-            actor_role = ActorRole.objects.filter(
-                Q(organism__in=user_organisms) | Q(role=user)
-            )
-            qs = qs.filter(Q(actor__in=actor_role) | Q(created_by=user))
-            return qs
+
+class DatasetListPermissionsMixin(object):
+    """Mixin used for dataset lists permissions"""
+
+    def get_queryset(self, *args, **kwargs):
+        """QuerySet mixin
+
+        Returns:
+            queryset
+        """
+
+        qs = super().get_queryset()
+        if getattr(self, "swagger_fake_view", False):
+            return qs.none()
+        return filter_visible_datasets(qs, self.request.user)
+
+
+class HasAllDataAccess(BasePermission):
+    """Users allowed to read every metadata record"""
+
+    message = "Access to all data not allowed."
+
+    def has_permission(self, request, view):
+        return bool(
+            request.user
+            and request.user.is_authenticated
+            and has_all_data_access(request.user)
+        )
+
+
+class CanEditRecord(BasePermission):
+    """Write actions on frameworks and datasets, granted by the edit
+    rules (see :mod:`sinp_metadata.rules`)
+
+    Views checking a batch set ``editable_pks`` beforehand, so records
+    are not checked one query each.
+    """
+
+    message = "Edition of this record not allowed."
+
+    def has_object_permission(self, request, view, obj):
+        if request.method in SAFE_METHODS:
+            return True
+        editable = getattr(view, "editable_pks", None)
+        if editable is None:
+            editable = get_editable_pks(request.user, type(obj), [obj.pk])
+        return obj.pk in editable
 
 
 class IsOrganismManager(BasePermission):
+    """Organisms are read by any user, edited by their managers"""
+
     message = "Organism access not allowed."
 
     def has_object_permission(self, request, view, obj):
-        try:
-            user = request.user
-            # logger.debug(f"request.user {request.user}")
-            # logger.debug(
-            #     f"request.user.is_superuser {request.user.is_superuser}"
-            # )
-            # logger.debug(f"pk {obj.pk}")
-            manager_nomenclature = Nomenclature.objects.filter(
-                type__mnemonic="member_level", code="manager"
-            )
-            orgamember = OrganismMember.objects.filter(
-                organism=obj, member=user, code=manager_nomenclature
-            )
-            logger.debug(
-                f"orgamember.memberlevel.code {orgamember.member_level.code}"
-            )
-
-            perm = (
-                orgamember.exists()
-                or user == obj.created_by
-                or user.is_superuser
-            )
-            logger.debug(f"perm {perm}")
-            return perm
-        except Exception as e:
-            logger.debug(f"{e}")
-            return False
+        if request.method in SAFE_METHODS:
+            return True
+        user = request.user
+        return (
+            user.is_superuser
+            or user == obj.created_by
+            or OrganismMember.objects.filter(
+                organism=obj,
+                member=user,
+                member_level__type__mnemonic="member_level",
+                member_level__code="manager",
+            ).exists()
+        )
@@ -0,0 +1,140 @@
+"""Read replica database routing for metadata reads
+
+Reads go to the replica only inside an explicit replica block: read-only
+viewset actions (see :class:`ReplicaReadMixin`), exports and search. A
+write in the same block pins the following reads to the primary, and a
+write request pins its principal, the authenticated user whether it came
+with a session or a token, for ``SINP_METADATA_REPLICA_PIN_SECONDS``.
+Pins are kept in the default cache, which must be shared by the server
+processes.
+
+Settings::
+
+    DATABASES = {"default": {...}, "replica": {...}}
+    DATABASE_ROUTERS = ["sinp_metadata.routers.MetadataReplicaRouter"]
+    SINP_METADATA_REPLICA_DATABASE = "replica"
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+from .cache import KEY_PREFIX
+
+logger = logging.getLogger(__name__)
+
+APP_LABELS = {"sinp_metadata"}
+
+
+class RoutingState:
+    def __init__(self, replica, pin_on_write):
+        self.replica = replica
+        self.pin_on_write = pin_on_write
+
+
+_state = ContextVar("sinp_metadata_routing", default=None)
+
+
+def get_replica_alias():
+    alias = getattr(settings, "SINP_METADATA_REPLICA_DATABASE", None)
+    return alias if alias in settings.DATABASES else None
+
+
+def get_pin_seconds():
+    return getattr(settings, "SINP_METADATA_REPLICA_PIN_SECONDS", 10)
+
+
+def get_pin_key(request):
+    """Cache key pinning the principal of a request to the primary
+
+    Token clients have no session, so pins are stored per user.
+
+    Returns:
+        str: cache key, None for anonymous requests
+    """
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return None
+    return f"{KEY_PREFIX}:primary_until:{user.pk}"
+
+
+@contextmanager
+def use_replica(enabled=True, pin_on_write=True):
+    """Route metadata reads of the block to the replica
+
+    Args:
+        enabled (bool): use the replica at all
+        pin_on_write (bool): go back to the primary after a write
+    """
+    token = _state.set(RoutingState(enabled, pin_on_write))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+class MetadataReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (
+            state is not None
+            and state.replica
+            and model._meta.app_label in APP_LABELS
+        ):
+            return get_replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.pin_on_write:
+            state.replica = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, get_replica_alias()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == get_replica_alias():
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """Viewset mixin serving read-only actions from the replica
+
+    Users who just wrote, through a session or a token, are served from
+    the primary, so they always read their own writes.
+    """
+
+    replica_actions = ("list", "retrieve")
+
+    def dispatch(self, request, *args, **kwargs):
+        with use_replica(enabled=False):
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        key = get_pin_key(request)
+        pinned = key is not None and cache.get(key, 0) > time.time()
+        _state.get().replica = (
+            get_replica_alias() is not None
+            and request.method in SAFE_METHODS
+            and self.action in self.replica_actions
+            and not pinned
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        key = get_pin_key(request)
+        if request.method not in SAFE_METHODS and key is not None:
+            pin_seconds = get_pin_seconds()
+            cache.set(key, time.time() + pin_seconds, pin_seconds)
+        return super().finalize_response(request, response, *args, **kwargs)
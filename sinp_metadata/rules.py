@@ -0,0 +1,163 @@
+"""Edit rules of frameworks and datasets
+
+Edit rights are derived from rules instead of per object permission rows:
+a user may edit the frameworks linked by an actor role to one of the
+user's organisms, and the datasets of these frameworks. Records the user
+created and guardian object permissions granted explicitly are editable
+too.
+
+Each rule is a ``Q`` predicate built from subqueries, so edit rights are
+evaluated by the database, for one record or a whole list, whatever the
+catalogue size.
+
+Settings::
+
+    # roleActeur codes granting edit rights, None for any role
+    SINP_METADATA_EDIT_ACTOR_ROLES = ["1", "8"]
+    # member_level codes of the members granted edit rights, None for any
+    SINP_METADATA_EDIT_MEMBER_LEVELS = ["manager"]
+"""
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import BigIntegerField, Q
+from django.db.models.functions import Cast
+from guardian.utils import get_group_obj_perms_model, get_user_obj_perms_model
+from sinp_organisms.models import OrganismMember
+
+from .models import AcquisitionFramework, Dataset
+
+# Object permissions granting the edition of a record (guardian)
+EDIT_PERMISSIONS = {
+    AcquisitionFramework: ("can_edit_self_acquisitionframework_organism",),
+    Dataset: ("can_edit_self_dataset_organism",),
+}
+
+
+def get_edit_actor_roles():
+    return getattr(settings, "SINP_METADATA_EDIT_ACTOR_ROLES", None)
+
+
+def get_edit_member_levels():
+    return getattr(settings, "SINP_METADATA_EDIT_MEMBER_LEVELS", None)
+
+
+def object_permissions(user, model):
+    """Guardian user and group object permissions granting the edition
+    of a model's records to a user
+
+    Returns:
+        tuple: user and group object permissions querysets
+    """
+    content_type = ContentType.objects.get_for_model(model)
+    lookups = {
+        "content_type": content_type,
+        "permission__content_type": content_type,
+        "permission__codename__in": EDIT_PERMISSIONS[model],
+    }
+    return (
+        get_user_obj_perms_model().objects.filter(user=user, **lookups),
+        get_group_obj_perms_model().objects.filter(
+            group__user=user, **lookups
+        ),
+    )
+
+
+def editor_organisms(user):
+    """Organisms granting edit rights to their member
+
+    Returns:
+        iterable: organism ids or queryset
+    """
+    levels = get_edit_member_levels()
+    # Users authenticated by token carry their organism ids
+    organism_ids = getattr(user, "organism_ids", None)
+    if organism_ids is not None and levels is None:
+        return organism_ids
+    members = OrganismMember.objects.filter(member=user)
+    if levels is not None:
+        members = members.filter(member_level__code__in=levels)
+    return members.values("organism")
+
+
+def organism_frameworks(user):
+    """Frameworks linked by an actor role to the user's organisms
+
+    Returns:
+        queryset: framework primary keys
+    """
+    actors = {"actors__organism__in": editor_organisms(user)}
+    roles = get_edit_actor_roles()
+    if roles is not None:
+        actors["actors__actor_role__code__in"] = roles
+    return AcquisitionFramework.objects.filter(**actors).values("pk")
+
+
+class Rule:
+    """Edit rule, the predicate of the records a user may edit"""
+
+    def predicate(self, user, model):
+        raise NotImplementedError
+
+
+class CreatorRule(Rule):
+    """Records created by the user"""
+
+    def predicate(self, user, model):
+        return Q(created_by=user)
+
+
+class OrganismActorRule(Rule):
+    """Records of the frameworks linked to the user's organisms
+
+    Args:
+        lookup (str): lookup of the record framework primary key
+    """
+
+    def __init__(self, lookup):
+        self.lookup = lookup
+
+    def predicate(self, user, model):
+        return Q(**{f"{self.lookup}__in": organism_frameworks(user)})
+
+
+class ObjectPermissionRule(Rule):
+    """Records granted by guardian user or group object permissions"""
+
+    def predicate(self, user, model):
+        predicate = Q()
+        for perms in object_permissions(user, model):
+            # guardian stores object primary keys as text
+            object_pks = perms.values(pk=Cast("object_pk", BigIntegerField()))
+            predicate |= Q(pk__in=object_pks.values("pk"))
+        return predicate
+
+
+RULES = {
+    AcquisitionFramework: (
+        CreatorRule(),
+        OrganismActorRule("pk"),
+        ObjectPermissionRule(),
+    ),
+    Dataset: (
+        CreatorRule(),
+        OrganismActorRule("acquisition_framework"),
+        ObjectPermissionRule(),
+    ),
+}
+
+
+def editable_predicate(user, model):
+    """Predicate of the records of a model a user may edit
+
+    Args:
+        user (User): authenticated user
+        model: ``AcquisitionFramework`` or ``Dataset``
+
+    Returns:
+        Q: disjunction of the model rules
+    """
+    predicate = Q(pk__in=[])
+    for rule in RULES[model]:
+        predicate |= rule.predicate(user, model)
+    return predicate
@@ -1,15 +1,169 @@
+import json
 import logging
 
 from django.conf import settings
+from django.contrib.gis.geos import GEOSException, GEOSGeometry
+from django.urls import reverse
 from rest_framework import serializers
-from rest_framework.serializers import SerializerMethodField
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.relations import ManyRelatedField
 from sinp_nomenclatures.models import Nomenclature
 
-from .models import AcquisitionFramework, ActorRole, Keyword, Organism
+from .anonymization import get_actor_display, get_actor_displays
+from .jobs import JOB_HANDLERS, can_submit, validate_params
+from .models import (
+    AcquisitionFramework,
+    ActorRole,
+    ConformanceResult,
+    Dataset,
+    DeletedRecord,
+    Job,
+    Keyword,
+    Organism,
+)
+from .permissions import get_editable_pks
 
 logger = logging.getLogger(__name__)
 
 
+class GeometryField(serializers.Field):
+    """GeoJSON geometry, stored in ``GEODATA_SRID``"""
+
+    default_error_messages = {"invalid": "Invalid geometry: {error}."}
+
+    def to_internal_value(self, data):
+        if isinstance(data, dict):
+            data = json.dumps(data)
+        try:
+            geom = GEOSGeometry(data)
+        except (GEOSException, TypeError, ValueError) as e:
+            self.fail("invalid", error=e)
+        if geom.srid is None:
+            geom.srid = settings.GEODATA_SRID
+        elif geom.srid != settings.GEODATA_SRID:
+            geom.transform(settings.GEODATA_SRID)
+        return geom
+
+    def to_representation(self, value):
+        return json.loads(value.geojson)
+
+
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key related field resolved from preloaded objects
+
+    Batch writers load every referenced object once per field and pass
+    them as ``context["related_objects"][field_name]``, so validating a
+    batch costs no query per item. Falls back to the default lookup.
+    """
+
+    def to_internal_value(self, data):
+        field_name = (
+            self.parent.field_name
+            if isinstance(self.parent, ManyRelatedField)
+            else self.field_name
+        )
+        objects = self.context.get("related_objects", {}).get(field_name)
+        if objects is None:
+            return super().to_internal_value(data)
+        model = self.get_queryset().model
+        try:
+            pk = model._meta.pk.to_python(data)
+        except Exception:
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if pk not in objects:
+            self.fail("does_not_exist", pk_value=data)
+        return objects[pk]
+
+
+class CanEditField(serializers.ReadOnlyField):
+    """Whether the requesting user may edit the record
+
+    Read from ``context["editable_pks"]``, filled once per page by
+    :class:`EditableListSerializer`, or resolved for the single record.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["source"] = "*"
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        editable = self.context.setdefault("editable_pks", {})
+        model = type(obj)
+        if model not in editable or obj.pk not in editable[model]["pks"]:
+            editable[model] = {
+                "pks": {obj.pk},
+                "editable": get_editable_pks(
+                    self.context["request"].user, model, [obj.pk]
+                ),
+            }
+        return obj.pk in editable[model]["editable"]
+
+
+class EditableListSerializer(serializers.ListSerializer):
+    """Resolve the edit rights of a whole page in one query"""
+
+    def to_representation(self, data):
+        if "request" in self.context and "can_edit" in self.child.fields:
+            items = data.all() if hasattr(data, "all") else data
+            pks = {obj.pk for obj in items}
+            self.context.setdefault("editable_pks", {})[
+                self.child.Meta.model
+            ] = {
+                "pks": pks,
+                "editable": get_editable_pks(
+                    self.context["request"].user, self.child.Meta.model, pks
+                ),
+            }
+            data = items
+        return super().to_representation(data)
+
+
+class EditableSerializerMixin:
+    """``can_edit`` field, only serialized along a request"""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if "request" not in self.context:
+            fields.pop("can_edit", None)
+        return fields
+
+
+class EditableRelationsMixin:
+    """Frameworks referenced by ``editable_relations`` fields must be
+    editable by the user, unless the record keeps its current one
+
+    Batch writers resolve the edit rights of every referenced record at
+    once, as ``context["editable_related"][field_name]``.
+    """
+
+    editable_relations = ()
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        request = self.context.get("request")
+        if request is None:
+            return attrs
+        errors = {}
+        for name in self.editable_relations:
+            related = attrs.get(name)
+            if related is None:
+                continue
+            if self.instance is not None and related.pk == getattr(
+                self.instance, f"{name}_id"
+            ):
+                continue
+            editable = self.context.get("editable_related", {}).get(name)
+            if editable is None:
+                editable = get_editable_pks(
+                    request.user, type(related), [related.pk]
+                )
+            if related.pk not in editable:
+                errors[name] = ["Not allowed to edit."]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+
 class NomenclatureLabel(serializers.ModelSerializer):
     class Meta:
         model = Nomenclature
@@ -34,10 +188,39 @@ class Keywords(serializers.ModelSerializer):
         fields = ["keyword"]
 
 
+def load_actor_displays(context, actors):
+    """Complete the actor displays of a serializer context
+
+    Args:
+        context (dict): serializer context, holding ``actor_displays``
+        actors (iterable): actor roles or their primary keys
+    """
+    displays = context.setdefault("actor_displays", {})
+    pks = {ar if isinstance(ar, int) else ar.pk for ar in actors}
+    missing = pks - displays.keys()
+    if missing:
+        displays.update(get_actor_displays(missing))
+
+
+class ActorRoleListSerializer(serializers.ListSerializer):
+    """Load the displays of the listed actor roles at once"""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, "all") else data)
+        load_actor_displays(self.context, items)
+        return super().to_representation(items)
+
+
 class ActorRoleOrganism(serializers.ModelSerializer):
-    name = SerializerMethodField()
-    actor_type = SerializerMethodField()
-    actor_role_label = SerializerMethodField()
+    """Actor role display, blurred when ``anonymization`` is set
+
+    Values come from the cached projection of
+    :mod:`sinp_metadata.anonymization`, loaded once per list of actors.
+    """
+
+    name = serializers.CharField(read_only=True, allow_null=True)
+    actor_type = serializers.CharField(read_only=True, allow_null=True)
+    actor_role_label = serializers.CharField(read_only=True)
 
     class Meta:
         model = ActorRole
@@ -46,34 +229,37 @@ class ActorRoleOrganism(serializers.ModelSerializer):
             "actor_type",
             "actor_role_label",
         ]
+        list_serializer_class = ActorRoleListSerializer
+
+    def to_representation(self, ar):
+        pk = ar if isinstance(ar, int) else ar.pk
+        displays = self.context.setdefault("actor_displays", {})
+        display = get_actor_display(pk, displays)
+        if display is None:
+            return dict.fromkeys(self.Meta.fields)
+        return dict(display)
 
-    def get_actor_role_label(self, ar):
-        return ar.actor_role.label
-
-    def get_actor_type(self, ar):
-        if ar.organism:
-            type = "Personne morale"
-        elif ar.role:
-            type = "Personne physique"
-        else:
-            type = None
-        return type
-
-    def get_name(self, ar):
-        if ar.organism:
-            name = ar.organism.label
-        elif ar.role:
-            name = ar.role.username
-        else:
-            name = None
-        return name
-
-
-class AcquisitionFrameworkSerializer(serializers.ModelSerializer):
-    actor = ActorRoleOrganism(read_only=True, many=True)
-    financing_type = NomenclatureLabel(read_only=True)
+
+class AcquisitionFrameworkListSerializer(EditableListSerializer):
+    """Load the actor displays of a whole page at once"""
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, "all") else data)
+        load_actor_displays(
+            self.context, (ar for af in items for ar in af.actors.all())
+        )
+        return super().to_representation(items)
+
+
+class AcquisitionFrameworkSerializer(
+    EditableSerializerMixin,
+    EditableRelationsMixin,
+    serializers.ModelSerializer,
+):
+    editable_relations = ("parent_framework",)
+    can_edit = CanEditField()
+    actors = ActorRoleOrganism(read_only=True, many=True)
     objective = NomenclatureLabel(many=True, read_only=True)
-    context = NomenclatureLabel(many=True, read_only=True)
     territory_level = NomenclatureLabel(read_only=True)
     territory = NomenclatureLabel(many=True, read_only=True)
     keywords = Keywords(many=True, read_only=True)
@@ -81,18 +267,15 @@ class AcquisitionFrameworkSerializer(serializers.ModelSerializer):
     class Meta:
         model = AcquisitionFramework
         fields = [
-            "id_acquisition_framework",
+            "id",
             "uuid",
             "label",
             "desc",
-            "context",
             "objective",
             "territory_level",
             "territory",
-            "geo_accuracy",
             "keywords",
-            "financing_type",
-            "actor",
+            "actors",
             "target_description",
             "is_metaframework",
             "parent_framework",
@@ -102,6 +285,68 @@ class AcquisitionFrameworkSerializer(serializers.ModelSerializer):
             "timestamp_create",
             "timestamp_update",
             "created_by",
+            "can_edit",
+        ]
+        read_only_fields = [
+            "timestamp_create",
+            "timestamp_update",
+            "uuid",
+            "created_by",
+        ]
+        list_serializer_class = AcquisitionFrameworkListSerializer
+        depth = 0
+
+
+class DatasetSerializer(
+    EditableSerializerMixin,
+    EditableRelationsMixin,
+    serializers.ModelSerializer,
+):
+    editable_relations = ("acquisition_framework",)
+    can_edit = CanEditField()
+    data_type = NomenclatureLabel(read_only=True)
+    data_category = NomenclatureLabel(read_only=True)
+    data_origin_status = NomenclatureLabel(read_only=True)
+    features = NomenclatureLabel(many=True, read_only=True)
+    ebv_classes = NomenclatureLabel(many=True, read_only=True)
+    collecting_method = NomenclatureLabel(many=True, read_only=True)
+    collecting_protocol = NomenclatureLabel(many=True, read_only=True)
+    territory = NomenclatureLabel(many=True, read_only=True)
+    keywords = Keywords(many=True, read_only=True)
+    bbox = GeometryField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = Dataset
+        fields = [
+            "id",
+            "uuid",
+            "acquisition_framework",
+            "project",
+            "label",
+            "short_label",
+            "desc",
+            "date_create",
+            "data_type",
+            "data_category",
+            "data_category_prec",
+            "features",
+            "ebv_classes",
+            "data_origin_status",
+            "collecting_method",
+            "method_precision",
+            "other_method",
+            "collecting_protocol",
+            "protocol_precision",
+            "other_protocol",
+            "keywords",
+            "territory",
+            "bbox",
+            "active",
+            "validable",
+            "timestamp_create",
+            "timestamp_update",
+            "created_by",
+            "can_edit",
         ]
         read_only_fields = [
             "timestamp_create",
@@ -109,9 +354,92 @@ class AcquisitionFrameworkSerializer(serializers.ModelSerializer):
             "uuid",
             "created_by",
         ]
+        list_serializer_class = EditableListSerializer
         depth = 0
 
 
+class AcquisitionFrameworkWriteSerializer(
+    EditableRelationsMixin, serializers.ModelSerializer
+):
+    """Flat acquisition framework serializer, used by batch writes"""
+
+    editable_relations = ("parent_framework",)
+    serializer_related_field = CachedPrimaryKeyRelatedField
+
+    class Meta:
+        model = AcquisitionFramework
+        fields = [
+            "id",
+            "uuid",
+            "label",
+            "desc",
+            "objective",
+            "territory_level",
+            "territory",
+            "keywords",
+            "actors",
+            "target_description",
+            "is_metaframework",
+            "parent_framework",
+            "ecologic_or_geologic_target",
+            "date_create",
+            "date_start",
+            "date_end",
+        ]
+        read_only_fields = ["id", "uuid"]
+        extra_kwargs = {
+            "actors": {"queryset": ActorRole.objects.with_display()},
+        }
+
+
+class DatasetWriteSerializer(
+    EditableRelationsMixin, serializers.ModelSerializer
+):
+    """Flat dataset serializer, used by batch writes
+
+    Uniqueness is checked for the whole batch by the writer.
+    """
+
+    editable_relations = ("acquisition_framework",)
+    serializer_related_field = CachedPrimaryKeyRelatedField
+    bbox = GeometryField(required=False, allow_null=True)
+
+    class Meta:
+        model = Dataset
+        fields = [
+            "id",
+            "uuid",
+            "acquisition_framework",
+            "project",
+            "label",
+            "short_label",
+            "desc",
+            "date_create",
+            "data_type",
+            "data_category",
+            "data_category_prec",
+            "features",
+            "ebv_classes",
+            "data_origin_status",
+            "collecting_method",
+            "method_precision",
+            "other_method",
+            "collecting_protocol",
+            "protocol_precision",
+            "other_protocol",
+            "keywords",
+            "territory",
+            "bbox",
+            "active",
+            "validable",
+        ]
+        read_only_fields = ["id", "uuid"]
+        extra_kwargs = {
+            "label": {"validators": []},
+            "short_label": {"validators": []},
+        }
+
+
 class OrganismSerializer(serializers.ModelSerializer):
     class Meta:
         model = Organism
@@ -131,16 +459,111 @@ class OrganismSerializer(serializers.ModelSerializer):
             "email",
             "phone_number",
             "url",
-            "created_by",
-            "updated_by",
             "timestamp_create",
             "timestamp_update",
         ]
         read_only_fields = [
-            "created_by",
-            "updated_by",
             "timestamp_create",
             "timestamp_update",
             "uuid",
         ]
         depth = 0
+
+
+class JobSerializer(serializers.ModelSerializer):
+    result = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            "id",
+            "uuid",
+            "kind",
+            "params",
+            "status",
+            "progress",
+            "message",
+            "result",
+            "started_at",
+            "finished_at",
+            "timestamp_create",
+            "created_by",
+        ]
+        read_only_fields = [
+            "uuid",
+            "status",
+            "progress",
+            "message",
+            "result",
+            "started_at",
+            "finished_at",
+            "timestamp_create",
+            "created_by",
+        ]
+
+    def get_result(self, job):
+        """Download URL of the result file, served to the job owner"""
+        if not job.result:
+            return None
+        url = reverse("metadata:job_result_api", kwargs={"pk": job.pk})
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
+    def validate_kind(self, value):
+        if value not in JOB_HANDLERS:
+            raise serializers.ValidationError(f"Unknown job kind {value!r}")
+        user = self.context["request"].user
+        if not can_submit(user, value):
+            raise PermissionDenied(f"Not allowed to run {value!r} jobs.")
+        return value
+
+    def validate(self, attrs):
+        try:
+            attrs["params"] = validate_params(
+                attrs["kind"], attrs.get("params") or {}
+            )
+        except serializers.ValidationError as e:
+            raise serializers.ValidationError({"params": e.detail})
+        return attrs
+
+
+class ConformanceResultSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ConformanceResult
+        fields = [
+            "record_type",
+            "record_id",
+            "conforming",
+            "errors",
+            "record_updated_at",
+            "checked_at",
+        ]
+
+
+class AcquisitionFrameworkCloneSerializer(serializers.Serializer):
+    """Options of an acquisition framework copy"""
+
+    label = serializers.CharField(max_length=255, required=False)
+    # " (copy)", " (copy 2)"... by default
+    dataset_suffix = serializers.CharField(
+        max_length=20,
+        required=False,
+        trim_whitespace=False,
+    )
+    date_start = serializers.DateField(required=False)
+    date_end = serializers.DateField(required=False, allow_null=True)
+
+    def validate(self, attrs):
+        date_start = attrs.get("date_start")
+        date_end = attrs.get("date_end")
+        if date_start and date_end and date_end < date_start:
+            raise serializers.ValidationError(
+                {"date_end": "End date must not be before start date"}
+            )
+        return attrs
+
+
+class DeletedRecordSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DeletedRecord
+        fields = ["record_type", "record_id", "uuid", "label", "deleted_at"]
@@ -0,0 +1,285 @@
+"""Signal receivers keeping derived data and caches up to date"""
+
+import logging
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_save,
+)
+from django.dispatch import Signal, receiver
+from django.utils.timezone import now
+from sinp_nomenclatures.models import Nomenclature
+from sinp_organisms.models import Organism, OrganismMember
+
+from . import anonymization, facets, nomenclature_index, outbox, tiles
+from .authentication import invalidate_principals
+from .cache import bump_generation
+from .models import (
+    AcquisitionFramework,
+    ActorRole,
+    ApiToken,
+    Dataset,
+    DatasetNomenclature,
+    Keyword,
+    OutboxEvent,
+    Project,
+)
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# Sent by batch writers, which bypass model signals.
+# Arguments: sender (model), pks, action ("create"/"update"/"delete"),
+# m2m_fields
+bulk_changed = Signal()
+
+
+@receiver(post_save, sender=ActorRole)
+@receiver(post_delete, sender=ActorRole)
+@receiver(post_save, sender=Organism)
+@receiver(post_delete, sender=Organism)
+@receiver(post_delete, sender=User)
+def invalidate_actor_displays(sender, **kwargs):
+    bump_generation(anonymization.CACHE_NAMESPACE)
+
+
+@receiver(post_save, sender=User)
+def invalidate_actor_displays_on_user_save(
+    sender, update_fields=None, **kwargs
+):
+    # Logins only touch last_login, which is never displayed
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    bump_generation(anonymization.CACHE_NAMESPACE)
+
+
+@receiver(post_save, sender=OrganismMember)
+@receiver(post_delete, sender=OrganismMember)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=ApiToken)
+@receiver(post_delete, sender=ApiToken)
+def invalidate_cached_principals(sender, **kwargs):
+    invalidate_principals()
+
+
+@receiver(m2m_changed, sender=OrganismMember.member_level.through)
+def invalidate_cached_principals_on_member_level(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_principals()
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_principals_on_user_save(
+    sender, update_fields=None, **kwargs
+):
+    # Logins only touch last_login
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    invalidate_principals()
+
+
+def _tile_state(dataset):
+    # Footprint, label and the framework deciding its visibility
+    return (dataset.bbox, dataset.label, dataset.acquisition_framework_id)
+
+
+@receiver(post_init, sender=Dataset)
+def remember_dataset_footprint(sender, instance, **kwargs):
+    # Deferred fields are left alone, they would cost a query each
+    if {"bbox", "acquisition_framework_id"} <= instance.__dict__.keys():
+        instance._tile_state = _tile_state(instance)
+
+
+@receiver(post_save, sender=Dataset)
+def invalidate_tiles_on_dataset_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, "_tile_state", None)
+    current = _tile_state(instance)
+    if created or previous is None or previous != current:
+        bump_generation(tiles.CACHE_NAMESPACE)
+    instance._tile_state = current
+
+
+@receiver(post_delete, sender=Dataset)
+def invalidate_tiles(sender, **kwargs):
+    bump_generation(tiles.CACHE_NAMESPACE)
+
+
+@receiver(bulk_changed, sender=Dataset)
+def invalidate_tiles_on_bulk_change(sender, **kwargs):
+    bump_generation(tiles.CACHE_NAMESPACE)
+
+
+# Tiles are cached per user: memberships and actor roles decide which
+# datasets a user sees
+@receiver(post_save, sender=OrganismMember)
+@receiver(post_delete, sender=OrganismMember)
+@receiver(post_save, sender=ActorRole)
+@receiver(post_delete, sender=ActorRole)
+@receiver(post_delete, sender=User)
+def invalidate_tiles_on_scope_change(sender, **kwargs):
+    bump_generation(tiles.CACHE_NAMESPACE)
+
+
+@receiver(post_save, sender=User)
+def invalidate_tiles_on_user_save(sender, update_fields=None, **kwargs):
+    # Logins only touch last_login
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    bump_generation(tiles.CACHE_NAMESPACE)
+
+
+@receiver(m2m_changed, sender=AcquisitionFramework.actors.through)
+def invalidate_tiles_on_actors_change(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_generation(tiles.CACHE_NAMESPACE)
+
+
+def update_nomenclature_index(
+    sender, instance, action, reverse, pk_set, field, **kwargs
+):
+    if action == "post_clear":
+        lookup = "nomenclature" if reverse else "dataset"
+        DatasetNomenclature.objects.filter(
+            field=field, **{lookup: instance.pk}
+        ).delete()
+        return
+    if action not in ("post_add", "post_remove") or not pk_set:
+        return
+    if reverse:
+        pairs = [(pk, instance.pk) for pk in pk_set]
+    else:
+        pairs = [(instance.pk, pk) for pk in pk_set]
+    if action == "post_add":
+        nomenclature_index.add_entries(field, pairs)
+    else:
+        nomenclature_index.remove_entries(field, pairs)
+
+
+for _field in nomenclature_index.FIELDS:
+    m2m_changed.connect(
+        partial(update_nomenclature_index, field=_field),
+        sender=nomenclature_index.get_through(_field),
+        weak=False,
+        dispatch_uid=f"sinp_metadata_nomenclature_index_{_field}",
+    )
+
+
+@receiver(bulk_changed, sender=Dataset)
+def update_nomenclature_index_on_bulk_change(
+    sender, pks, m2m_fields=(), **kwargs
+):
+    nomenclature_index.reindex_datasets(pks, m2m_fields)
+
+
+def invalidate_facets(sender, **kwargs):
+    bump_generation(facets.CACHE_NAMESPACE)
+
+
+# Counted records, their relations and the labels of counted values
+for _model in (AcquisitionFramework, Dataset, Keyword, Nomenclature, Project):
+    for _signal in (post_save, post_delete):
+        _signal.connect(
+            invalidate_facets,
+            sender=_model,
+            dispatch_uid=f"sinp_metadata_facets_{_model.__name__}",
+        )
+for _model in (AcquisitionFramework, Dataset):
+    for _m2m in _model._meta.many_to_many:
+        _through = _m2m.remote_field.through
+        m2m_changed.connect(
+            invalidate_facets,
+            sender=_through,
+            dispatch_uid=f"sinp_metadata_facets_{_through._meta.label}",
+        )
+bulk_changed.connect(invalidate_facets, dispatch_uid="sinp_metadata_facets")
+
+
+def record_saved(sender, instance, created, raw=False, using=None, **kwargs):
+    # Fixtures loading is not a change to push
+    if raw:
+        return
+    action = OutboxEvent.CREATE if created else OutboxEvent.UPDATE
+    outbox.record_events(sender, [instance.pk], action, using)
+
+
+def record_deleted(sender, instance, using=None, **kwargs):
+    outbox.record_events(sender, [instance.pk], OutboxEvent.DELETE, using)
+
+
+def m2m_changed_records(sender, instance, action, reverse, pk_set, field):
+    """Primary keys of the records of ``field``'s model changed by an
+    ``m2m_changed`` signal, None before the change or for other actions"""
+    if reverse and action == "pre_clear":
+        # pk_set is not provided when clearing
+        return list(
+            sender.objects.filter(
+                **{field.m2m_reverse_field_name(): instance.pk}
+            ).values_list(field.m2m_field_name(), flat=True)
+        )
+    if reverse and action in ("post_add", "post_remove"):
+        return list(pk_set)
+    if not reverse and action in ("post_add", "post_remove", "post_clear"):
+        return [instance.pk]
+    return None
+
+
+def record_m2m_changed(
+    sender, instance, action, reverse, pk_set, using, owner, field, **kwargs
+):
+    pks = m2m_changed_records(sender, instance, action, reverse, pk_set, field)
+    if pks is not None:
+        outbox.record_events(owner, pks, OutboxEvent.UPDATE, using)
+
+
+for _model in outbox.RECORD_TYPES:
+    post_save.connect(
+        record_saved,
+        sender=_model,
+        dispatch_uid=f"sinp_metadata_outbox_save_{_model.__name__}",
+    )
+    post_delete.connect(
+        record_deleted,
+        sender=_model,
+        dispatch_uid=f"sinp_metadata_outbox_delete_{_model.__name__}",
+    )
+    for _m2m in _model._meta.many_to_many:
+        _through = _m2m.remote_field.through
+        m2m_changed.connect(
+            partial(record_m2m_changed, owner=_model, field=_m2m),
+            sender=_through,
+            weak=False,
+            dispatch_uid=f"sinp_metadata_outbox_{_through._meta.label}",
+        )
+
+
+@receiver(bulk_changed)
+def record_bulk_changed(sender, pks, action, **kwargs):
+    outbox.record_events(sender, pks, action)
+
+
+def touch_records(
+    sender, instance, action, reverse, pk_set, using, owner, field, **kwargs
+):
+    """M2M changes update the record timestamp, so conformance checks
+    and harvests see the record as changed"""
+    pks = m2m_changed_records(sender, instance, action, reverse, pk_set, field)
+    if pks:
+        owner._base_manager.using(using).filter(pk__in=pks).update(
+            timestamp_update=now()
+        )
+
+
+for _model in (AcquisitionFramework, Dataset):
+    for _m2m in _model._meta.many_to_many:
+        _through = _m2m.remote_field.through
+        m2m_changed.connect(
+            partial(touch_records, owner=_model, field=_m2m),
+            sender=_through,
+            weak=False,
+            dispatch_uid=f"sinp_metadata_touch_{_through._meta.label}",
+        )
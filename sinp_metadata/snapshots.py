@@ -0,0 +1,402 @@
+"""Precompressed catalogue snapshots
+
+The ``create_snapshot`` command (run nightly) exports the whole catalogue
+in one database pass as JSON, NDJSON and SINP XML, each compressed with
+gzip and brotli (when the ``brotli`` package is installed). A snapshot is
+a directory holding these files, a ``SHA256SUMS`` file and a
+``manifest.json``; it is built aside and published atomically, then the
+``latest`` pointer is switched to it.
+
+Snapshot files are served as static artifacts, with ETag and byte range
+support (see :func:`serve_file`).
+
+Settings::
+
+    SINP_METADATA_SNAPSHOT_DIR = "/var/lib/dbchiro/snapshots"
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.utils.timezone import now
+from rest_framework import serializers
+
+from .harvest import METADATA_NAMESPACE, METADATA_PREFIX, SETS, data_to_xml
+from .jobs import CATALOGUE_PERMISSION, register_job
+from .routers import use_replica
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+READ_SIZE = 64 * 1024
+BROTLI_QUALITY = 9
+BASENAME = "catalogue"
+ENCODINGS = {"gz": "application/gzip", "br": "application/x-brotli"}
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def get_snapshot_dir():
+    return Path(
+        getattr(
+            settings,
+            "SINP_METADATA_SNAPSHOT_DIR",
+            os.path.join(settings.MEDIA_ROOT, "metadata", "snapshots"),
+        )
+    )
+
+
+def get_encodings():
+    return ["gz", "br"] if brotli is not None else ["gz"]
+
+
+class GzipSink:
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        # mtime=0 keeps outputs reproducible
+        self.stream = gzip.GzipFile(
+            filename="", mode="wb", fileobj=self.file, mtime=0
+        )
+
+    def write(self, data):
+        self.stream.write(data)
+
+    def close(self):
+        self.stream.close()
+        self.file.close()
+
+
+class BrotliSink:
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def write(self, data):
+        self.file.write(self.compressor.process(data))
+
+    def close(self):
+        self.file.write(self.compressor.finish())
+        self.file.close()
+
+
+SINKS = {"gz": GzipSink, "br": BrotliSink}
+
+
+class FormatWriter:
+    """Write one export format to every compressed output"""
+
+    def __init__(self, directory, format):
+        self.format = format
+        self.names = [f"{BASENAME}.{format}.{enc}" for enc in get_encodings()]
+        self.sinks = [
+            SINKS[name.rsplit(".", 1)[1]](directory / name)
+            for name in self.names
+        ]
+        self.count = 0
+
+    def write(self, text):
+        data = text.encode()
+        for sink in self.sinks:
+            sink.write(data)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class JsonWriter(FormatWriter):
+    def __init__(self, directory):
+        super().__init__(directory, "json")
+        self.section = None
+
+    def record(self, spec, data):
+        if spec != self.section:
+            separator = "{" if self.section is None else "],"
+            self.write(f'{separator}"{spec}s":[')
+            self.section, self.count = spec, 0
+        prefix = "," if self.count else ""
+        self.write(prefix + json.dumps(data, cls=DjangoJSONEncoder))
+        self.count += 1
+
+    def finish(self):
+        self.write("{}" if self.section is None else "]}")
+
+
+class NdjsonWriter(FormatWriter):
+    def __init__(self, directory):
+        super().__init__(directory, "ndjson")
+
+    def record(self, spec, data):
+        line = json.dumps(
+            {"type": spec, "record": data}, cls=DjangoJSONEncoder
+        )
+        self.write(line + "\n")
+
+    def finish(self):
+        pass
+
+
+class XmlWriter(FormatWriter):
+    def __init__(self, directory):
+        super().__init__(directory, "xml")
+        self.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<catalogue xmlns="{METADATA_NAMESPACE}">'
+        )
+
+    def record(self, spec, data):
+        element = data_to_xml(
+            ET.Element(METADATA_PREFIX, {"type": spec}), data
+        )
+        self.write(ET.tostring(element, encoding="unicode"))
+
+    def finish(self):
+        self.write("</catalogue>\n")
+
+
+WRITERS = (JsonWriter, NdjsonWriter, XmlWriter)
+
+
+def iter_records():
+    """Serialized catalogue records, frameworks first
+
+    Yields:
+        tuple: set spec and serialized record
+    """
+    for harvest_set in SETS.values():
+        qs = harvest_set.model.objects.for_api().order_by("pk")
+        context = {}
+        for obj in qs.iterator(chunk_size=CHUNK_SIZE):
+            data = harvest_set.serializer_class(obj, context=context).data
+            yield harvest_set.spec, data
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_snapshot(directory, name, created_at):
+    """Write the snapshot files, checksums and manifest in a directory
+
+    Returns:
+        dict: snapshot manifest
+    """
+    counts = {}
+    writers = [writer(directory) for writer in WRITERS]
+    try:
+        with use_replica(pin_on_write=False):
+            for spec, data in iter_records():
+                for writer in writers:
+                    writer.record(spec, data)
+                counts[spec] = counts.get(spec, 0) + 1
+        for writer in writers:
+            writer.finish()
+    finally:
+        for writer in writers:
+            writer.close()
+
+    files = []
+    for writer in writers:
+        for file_name in writer.names:
+            path = directory / file_name
+            files.append(
+                {
+                    "name": file_name,
+                    "format": writer.format,
+                    "encoding": file_name.rsplit(".", 1)[1],
+                    "size": path.stat().st_size,
+                    "sha256": file_sha256(path),
+                }
+            )
+    (directory / "SHA256SUMS").write_text(
+        "".join(f"{f['sha256']}  {f['name']}\n" for f in files)
+    )
+    manifest = {
+        "name": name,
+        "created_at": created_at.isoformat(),
+        "counts": counts,
+        "files": files,
+    }
+    (directory / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+def get_latest_name():
+    """Name of the published snapshot, None if there is none"""
+    try:
+        return (get_snapshot_dir() / "latest").read_text().strip()
+    except FileNotFoundError:
+        return None
+
+
+def prune_snapshots(keep, protected):
+    """Delete the oldest snapshots, except the ``protected`` names"""
+    root = get_snapshot_dir()
+    snapshots = sorted(
+        p for p in root.iterdir() if p.is_dir() and not p.name.startswith(".")
+    )
+    removable = [p for p in snapshots if p.name not in protected]
+    for old in removable[: max(len(snapshots) - keep, 0)]:
+        shutil.rmtree(old)
+
+
+def create_snapshot(keep=7):
+    """Export the catalogue as a new snapshot and publish it
+
+    The new snapshot and the previous one, which may still be served, are
+    never pruned.
+
+    Args:
+        keep (int): number of snapshots to keep
+
+    Returns:
+        dict: snapshot manifest
+    """
+    root = get_snapshot_dir()
+    root.mkdir(parents=True, exist_ok=True)
+    created_at = now()
+    # Names sort by creation, the suffix tells apart concurrent builds
+    name = f"{created_at.strftime('%Y%m%dT%H%M%S%fZ')}-{uuid4().hex[:8]}"
+    building = root / f".{name}.tmp"
+    building.mkdir()
+    try:
+        manifest = build_snapshot(building, name, created_at)
+        os.rename(building, root / name)
+    finally:
+        # Left over when the build failed
+        shutil.rmtree(building, ignore_errors=True)
+    previous = get_latest_name()
+    pointer = root / f".latest.{name}.tmp"
+    pointer.write_text(name)
+    os.replace(pointer, root / "latest")
+
+    prune_snapshots(keep, {name, previous})
+    logger.info(f"Catalogue snapshot {name} created ({manifest['counts']})")
+    return manifest
+
+
+def get_latest_manifest():
+    """Manifest of the published snapshot, None if there is none"""
+    name = get_latest_name()
+    if name is None:
+        return None
+    try:
+        return json.loads(
+            (get_snapshot_dir() / name / "manifest.json").read_text()
+        )
+    except FileNotFoundError:
+        return None
+
+
+def _read(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(READ_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def serve_file(request, path, etag, content_type):
+    """Serve a static file with ETag, conditional and range support
+
+    Only single ``bytes`` ranges are honoured; other range requests get
+    the whole file.
+    """
+    size = path.stat().st_size
+    if etag in request.headers.get("If-None-Match", ""):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+    match = RANGE_RE.match(request.headers.get("Range", ""))
+    if_range = request.headers.get("If-Range")
+    if match and (if_range is None or if_range == etag):
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        elif last:
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start, end = 0, -1
+        if start > end or start >= size:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+        response = StreamingHttpResponse(
+            _read(path, start, end - start + 1),
+            status=206,
+            content_type=content_type,
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = end - start + 1
+    else:
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Content-Disposition"] = f'attachment; filename="{path.name}"'
+    return response
+
+
+def serve_snapshot_file(request, file_name):
+    """Serve a file of the latest snapshot
+
+    Returns:
+        HttpResponse: None if the file doesn't exist
+    """
+    manifest = get_latest_manifest()
+    if manifest is None:
+        return None
+    files = {f["name"]: f for f in manifest["files"]}
+    if file_name not in files:
+        return None
+    info = files[file_name]
+    path = get_snapshot_dir() / manifest["name"] / file_name
+    try:
+        return serve_file(
+            request, path, f'"{info["sha256"]}"', ENCODINGS[info["encoding"]]
+        )
+    except FileNotFoundError:
+        # Pruned since the manifest was read
+        return None
+
+
+class CreateSnapshotParams(serializers.Serializer):
+    keep = serializers.IntegerField(min_value=1, default=7)
+
+
+@register_job(
+    "create_snapshot",
+    permission=CATALOGUE_PERMISSION,
+    params=CreateSnapshotParams,
+)
+def create_snapshot_job(job):
+    """Create a catalogue snapshot (``params.keep`` optional)"""
+    manifest = create_snapshot(keep=job.params.get("keep", 7))
+    return f"Snapshot {manifest['name']} created"
@@ -0,0 +1,155 @@
+"""Catalogue statistics
+
+Dashboard counts are computed by one grouped query per dimension and
+stored in :class:`~sinp_metadata.models.CatalogueStatistic`, so reading
+them never touches the catalogue tables. Summaries are refreshed on a
+schedule with the ``refresh_statistics`` management command (e.g. from
+cron) or the ``refresh_statistics`` job.
+"""
+
+import logging
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import ExtractYear
+from django.utils.timezone import now
+from rest_framework import serializers
+
+from .jobs import CATALOGUE_PERMISSION, register_job
+from .models import AcquisitionFramework, CatalogueStatistic, Dataset
+from .routers import use_replica
+
+logger = logging.getLogger(__name__)
+
+
+def frameworks_per_year():
+    return (
+        AcquisitionFramework.objects.order_by()
+        .annotate(key=ExtractYear("date_start"))
+        .values("key")
+        .annotate(value=Count("pk"))
+        .values_list("key", "key", "value")
+    )
+
+
+def datasets_per_framework():
+    return (
+        Dataset.objects.order_by()
+        .values("acquisition_framework")
+        .annotate(value=Count("pk"))
+        .values_list(
+            "acquisition_framework",
+            "acquisition_framework__label",
+            "value",
+        )
+    )
+
+
+def datasets_per_organism():
+    return (
+        Dataset.objects.order_by()
+        .filter(acquisition_framework__actors__organism__isnull=False)
+        .annotate(
+            key=F("acquisition_framework__actors__organism"),
+            name=F("acquisition_framework__actors__organism__label"),
+        )
+        .values("key", "name")
+        .annotate(value=Count("pk", distinct=True))
+        .values_list("key", "name", "value")
+    )
+
+
+def datasets_per_territory():
+    return (
+        Dataset.objects.order_by()
+        .filter(territory__isnull=False)
+        .values("territory", "territory__label")
+        .annotate(value=Count("pk"))
+        .values_list("territory", "territory__label", "value")
+    )
+
+
+BUILDERS = {
+    CatalogueStatistic.FRAMEWORKS_PER_YEAR: frameworks_per_year,
+    CatalogueStatistic.DATASETS_PER_FRAMEWORK: datasets_per_framework,
+    CatalogueStatistic.DATASETS_PER_ORGANISM: datasets_per_organism,
+    CatalogueStatistic.DATASETS_PER_TERRITORY: datasets_per_territory,
+}
+
+
+def refresh_statistics(dimensions=None):
+    """Recompute summary rows
+
+    Each dimension is replaced atomically, so readers never see a
+    partial summary.
+
+    Args:
+        dimensions (list, optional): dimensions to refresh, all by default
+
+    Returns:
+        dict: number of rows by dimension
+    """
+    counts = {}
+    refreshed_at = now()
+    for dimension in dimensions or BUILDERS:
+        with use_replica(pin_on_write=False):
+            rows = list(BUILDERS[dimension]())
+        with transaction.atomic():
+            CatalogueStatistic.objects.filter(dimension=dimension).delete()
+            CatalogueStatistic.objects.bulk_create(
+                [
+                    CatalogueStatistic(
+                        dimension=dimension,
+                        key=str(key),
+                        label=str(label or "")[:255],
+                        value=value,
+                        refreshed_at=refreshed_at,
+                    )
+                    for key, label, value in rows
+                    if key is not None
+                ],
+                batch_size=1000,
+            )
+        counts[dimension] = len(rows)
+        logger.info(f"Statistics {dimension} refreshed ({len(rows)} rows)")
+    return counts
+
+
+def get_statistics(dimension):
+    """Stored summary of a dimension
+
+    Returns:
+        dict: refresh date and ``key``/``label``/``value`` rows
+    """
+    rows = list(
+        CatalogueStatistic.objects.filter(dimension=dimension).values(
+            "key", "label", "value", "refreshed_at"
+        )
+    )
+    return {
+        "dimension": dimension,
+        "refreshed_at": rows[0]["refreshed_at"] if rows else None,
+        "results": [
+            {"key": row["key"], "label": row["label"], "value": row["value"]}
+            for row in rows
+        ],
+    }
+
+
+class RefreshStatisticsParams(serializers.Serializer):
+    dimensions = serializers.ListField(
+        child=serializers.ChoiceField(choices=list(BUILDERS)),
+        allow_empty=False,
+        required=False,
+    )
+
+
+@register_job(
+    "refresh_statistics",
+    permission=CATALOGUE_PERMISSION,
+    params=RefreshStatisticsParams,
+)
+def refresh_statistics_job(job):
+    """Refresh catalogue statistics (``params.dimensions`` optional)"""
+    counts = refresh_statistics(job.params.get("dimensions"))
+    return f"{sum(counts.values())} statistics rows refreshed"
@@ -0,0 +1,145 @@
+"""Query budget assertions for tests
+
+Viewsets declare the number of queries each action may run in a
+``query_budgets`` dict (auth and session queries excluded)::
+
+    class DatasetViewset(...):
+        query_budgets = {"list": 8, "retrieve": 8}
+
+Tests check them with :func:`assert_view_budget`, and check that the
+count doesn't grow with the number of rows with
+:func:`assert_constant_queries` (see :mod:`sinp_metadata.tests`)::
+
+    from sinp_metadata.testing import (
+        assert_constant_queries,
+        assert_view_budget,
+    )
+
+    def test_dataset_list(self):
+        assert_constant_queries(
+            lambda: assert_view_budget(DatasetViewset, "list", self.user),
+            lambda: self.create_framework("Other", datasets=10),
+        )
+
+:class:`query_budget` is also available as a context manager or
+decorator for any code. Failures list the executed SQL.
+"""
+
+from contextlib import ContextDecorator
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def format_queries(queries):
+    """Numbered SQL of captured queries"""
+    return "\n".join(
+        f"{i}. {query['sql']}" for i, query in enumerate(queries, start=1)
+    )
+
+
+class query_budget(ContextDecorator):
+    """Fail if the wrapped code runs more than ``max_queries`` queries
+
+    Args:
+        max_queries (int): allowed number of queries
+        using (str): database alias
+        label (str, optional): name of the checked code, for messages
+    """
+
+    def __init__(self, max_queries, using=DEFAULT_DB_ALIAS, label=None):
+        self.max_queries = max_queries
+        self.using = using
+        self.label = label or "Code"
+
+    def __enter__(self):
+        self.context = CaptureQueriesContext(connections[self.using])
+        self.context.__enter__()
+        return self.context
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.context.__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return False
+        count = len(self.context)
+        if count > self.max_queries:
+            raise QueryBudgetExceeded(
+                f"{self.label} ran {count} queries, budget is "
+                f"{self.max_queries}:\n"
+                f"{format_queries(self.context.captured_queries)}"
+            )
+        return False
+
+
+def get_budget(viewset, action):
+    """Query budget declared by a viewset for an action"""
+    budgets = getattr(viewset, "query_budgets", {})
+    if action not in budgets:
+        raise ValueError(f"{viewset.__name__} declares no {action} budget")
+    return budgets[action]
+
+
+def assert_view_budget(
+    viewset,
+    action,
+    user,
+    method="get",
+    data=None,
+    using=DEFAULT_DB_ALIAS,
+    **kwargs,
+):
+    """Call a viewset action and check its declared query budget
+
+    The request is authenticated without session, so only the queries of
+    the view itself are counted.
+
+    Args:
+        viewset: viewset class
+        action (str): viewset action (``list``, ``retrieve``...)
+        user (User): authenticated user
+        method (str): HTTP method mapped to the action
+        data (dict, optional): query parameters or request body
+        **kwargs: URL keyword arguments (``pk``...)
+
+    Returns:
+        tuple: response and captured queries
+    """
+    request = getattr(APIRequestFactory(), method)("/", data)
+    request.user = user
+    force_authenticate(request, user=user)
+    view = viewset.as_view({method: action})
+    label = f"{viewset.__name__}.{action}"
+    with query_budget(get_budget(viewset, action), using, label) as context:
+        response = view(request, **kwargs)
+        if hasattr(response, "render"):
+            response.render()
+    return response, context.captured_queries
+
+
+def assert_constant_queries(call, add_rows, using=DEFAULT_DB_ALIAS):
+    """Fail if adding rows changes the number of queries of a call
+
+    ``call`` runs once first to warm caches.
+
+    Args:
+        call (callable): checked code, called before and after ``add_rows``
+        add_rows (callable): creates more rows returned by ``call``
+        using (str): database alias
+    """
+    call()
+    with CaptureQueriesContext(connections[using]) as before:
+        call()
+    add_rows()
+    with CaptureQueriesContext(connections[using]) as after:
+        call()
+    if len(after) != len(before):
+        raise QueryBudgetExceeded(
+            f"Query count grows with rows: {len(before)} before, "
+            f"{len(after)} after adding rows:\n"
+            f"{format_queries(after.captured_queries)}"
+        )
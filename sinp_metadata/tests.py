@@ -1,3 +1,1485 @@
-# from django.test import TestCase
+import datetime
+import struct
+import tempfile
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection, router
+from django.db.models import ProtectedError
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from guardian.shortcuts import assign_perm
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.response import Response
+from rest_framework.test import (
+    APIClient,
+    APIRequestFactory,
+    force_authenticate,
+)
+from rest_framework.views import APIView
+from rest_framework.viewsets import GenericViewSet
+from sinp_nomenclatures.models import Nomenclature, Type
+from sinp_organisms.models import Organism, OrganismMember
+
+from . import mvt, snapshots
+from .authentication import CachedTokenAuthentication
+from .cloning import clone_acquisition_framework
+from .conformance import check_conformance, stale_records
+from .deletion import delete_records, preview_deletion
+from .harvest import (
+    METADATA_PREFIX,
+    OAI_NAMESPACE,
+    OaiPmh,
+    format_datestamp,
+    get_repository_id,
+)
+from .jobs import submit_job
+from .models import (
+    AcquisitionFramework,
+    ActorRole,
+    ApiToken,
+    ConformanceResult,
+    Dataset,
+    DeletedRecord,
+    Job,
+    Keyword,
+    Project,
+)
+from .permissions import filter_editable, get_editable_pks
+from .routers import ReplicaReadMixin, use_replica
+from .testing import assert_constant_queries, assert_view_budget
+from .throttling import RateLimitMixin
+from .views import (
+    AcquisitionFrameworkViewset,
+    DatasetViewset,
+    JobViewset,
+    OrganismViewset,
+)
+
+
+def create_nomenclature(mnemonic, code):
+    """Nomenclature of a type, created if needed"""
+    today = datetime.date.today()
+    type, _created = Type.objects.get_or_create(
+        mnemonic=mnemonic,
+        defaults={
+            "label": mnemonic,
+            "code": mnemonic,
+            "create_date": today,
+            "update_date": today,
+        },
+    )
+    return Nomenclature.objects.create(type=type, code=code, label=code)
+
+
+class MetadataTestCase(TestCase):
+    """Nomenclatures, organisms and records shared by the tests"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.territory = create_nomenclature("territory", "1")
+        cls.role = create_nomenclature("roleActeur", "1")
+        cls.method = create_nomenclature("CodeCAMPanule", "1")
+
+    @classmethod
+    def create_user(cls, username, **kwargs):
+        return get_user_model().objects.create_user(
+            username, f"{username}@example.org", "password", **kwargs
+        )
+
+    @classmethod
+    def create_organism(cls, label):
+        return Organism.objects.create(
+            label=label,
+            short_label=label,
+            action_scope=cls.territory,
+            status=cls.territory,
+            type=cls.territory,
+        )
+
+    @classmethod
+    def create_framework(cls, label, datasets=2, actors=(), **kwargs):
+        framework = AcquisitionFramework.objects.create(
+            label=label, desc=label, **kwargs
+        )
+        framework.territory.add(cls.territory)
+        framework.actors.add(*actors)
+        for i in range(datasets):
+            cls.create_dataset(
+                framework, f"{label} {i}", created_by=kwargs.get("created_by")
+            )
+        return framework
+
+    @classmethod
+    def create_dataset(cls, framework, label, **kwargs):
+        dataset = Dataset.objects.create(
+            acquisition_framework=framework,
+            label=label,
+            short_label=label,
+            desc=label,
+            validable=True,
+            **kwargs,
+        )
+        dataset.territory.add(cls.territory)
+        return dataset
+
+    @classmethod
+    def organism_actor(cls, organism):
+        return ActorRole.objects.get_or_create(
+            organism=organism, actor_role=cls.role
+        )[0]
+
+    @classmethod
+    def dataset_item(cls, framework, label, **kwargs):
+        """Batch write item of a new dataset"""
+        return {
+            "acquisition_framework": framework.pk,
+            "label": label,
+            "short_label": label,
+            "desc": label,
+            "validable": True,
+            "territory": [cls.territory.pk],
+            "collecting_method": [cls.method.pk],
+            "collecting_protocol": [cls.method.pk],
+            **kwargs,
+        }
+
+    def call(self, viewset, action, user, method="get", data=None, **kwargs):
+        """Response of a viewset action, rendered"""
+        request = getattr(APIRequestFactory(), method)(
+            "/", data, format=None if method == "get" else "json"
+        )
+        request.user = user
+        force_authenticate(request, user=user)
+        response = viewset.as_view({method: action})(request, **kwargs)
+        response.render()
+        return response
+
+
+class QueryBudgetTestCase(MetadataTestCase):
+    """List and retrieve actions run their declared number of queries,
+    whatever the number of rows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = cls.create_user("member")
+        cls.organism = cls.create_organism("Organism")
+        cls.framework = cls.create_framework("Framework")
+
+    @classmethod
+    def create_framework(cls, label, datasets=2):
+        return super().create_framework(
+            label,
+            datasets,
+            actors=[
+                cls.organism_actor(cls.organism),
+                ActorRole.objects.get_or_create(
+                    legal_person=cls.user, actor_role=cls.role
+                )[0],
+            ],
+            created_by=cls.user,
+        )
+
+    def setUp(self):
+        # Content types are cached for the process lifetime
+        ContentType.objects.get_for_models(AcquisitionFramework, Dataset)
+
+    def add_frameworks(self):
+        for i in range(5):
+            self.create_framework(f"Framework {i}")
+
+    def assert_budget(self, viewset, action, **kwargs):
+        # Actor displays are cached: count the cold cache queries
+        cache.clear()
+        response, _queries = assert_view_budget(
+            viewset, action, self.user, **kwargs
+        )
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_acquisition_framework_list(self):
+        assert_constant_queries(
+            lambda: self.assert_budget(AcquisitionFrameworkViewset, "list"),
+            self.add_frameworks,
+        )
+
+    def test_acquisition_framework_retrieve(self):
+        assert_constant_queries(
+            lambda: self.assert_budget(
+                AcquisitionFrameworkViewset, "retrieve", pk=self.framework.pk
+            ),
+            lambda: self.create_framework("Other", datasets=5),
+        )
+
+    def test_dataset_list(self):
+        assert_constant_queries(
+            lambda: self.assert_budget(DatasetViewset, "list"),
+            self.add_frameworks,
+        )
+
+    def test_dataset_retrieve(self):
+        dataset = self.framework.ds_acquisition_framework.first()
+        assert_constant_queries(
+            lambda: self.assert_budget(
+                DatasetViewset, "retrieve", pk=dataset.pk
+            ),
+            lambda: self.create_framework("Other", datasets=5),
+        )
+
+    def test_organism_list(self):
+        assert_constant_queries(
+            lambda: self.assert_budget(OrganismViewset, "list"),
+            lambda: [self.create_organism(f"Organism {i}") for i in range(5)],
+        )
+
+    def test_organism_retrieve(self):
+        assert_constant_queries(
+            lambda: self.assert_budget(
+                OrganismViewset, "retrieve", pk=self.organism.pk
+            ),
+            lambda: self.create_organism("Other"),
+        )
+
+
+class EditRulesTestCase(MetadataTestCase):
+    """Edit rights granted by each rule of :mod:`sinp_metadata.rules`"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.manager_level = create_nomenclature("member_level", "manager")
+        cls.member_level = create_nomenclature("member_level", "member")
+        cls.organism = cls.create_organism("Organism")
+        cls.creator = cls.create_user("creator")
+        cls.manager = cls.create_member("manager", cls.manager_level)
+        cls.member = cls.create_member("member", cls.member_level)
+        cls.granted = cls.create_user("granted")
+        cls.stranger = cls.create_user("stranger")
+
+        cls.organism_framework = cls.create_framework(
+            "Organism", actors=[cls.organism_actor(cls.organism)]
+        )
+        cls.own_framework = cls.create_framework("Own", created_by=cls.creator)
+        cls.other_framework = cls.create_framework("Other")
+        # Own dataset in a framework the creator may not edit
+        cls.own_dataset = cls.create_dataset(
+            cls.other_framework, "Own dataset", created_by=cls.creator
+        )
+
+    @classmethod
+    def create_member(cls, username, level):
+        user = cls.create_user(username)
+        member = OrganismMember.objects.create(
+            organism=cls.organism, member=user
+        )
+        member.member_level.add(level)
+        return user
+
+    def editable(self, user, model):
+        return get_editable_pks(
+            user, model, model.objects.values_list("pk", flat=True)
+        )
+
+    def datasets(self, framework):
+        return set(
+            framework.ds_acquisition_framework.values_list("pk", flat=True)
+        )
+
+    def test_creator_rule(self):
+        self.assertEqual(
+            self.editable(self.creator, AcquisitionFramework),
+            {self.own_framework.pk},
+        )
+        self.assertEqual(
+            self.editable(self.creator, Dataset),
+            self.datasets(self.own_framework) | {self.own_dataset.pk},
+        )
+
+    def test_organism_actor_rule(self):
+        for user in (self.manager, self.member):
+            self.assertEqual(
+                self.editable(user, AcquisitionFramework),
+                {self.organism_framework.pk},
+            )
+            self.assertEqual(
+                self.editable(user, Dataset),
+                self.datasets(self.organism_framework),
+            )
+        self.assertEqual(self.editable(self.stranger, Dataset), set())
+
+    @override_settings(SINP_METADATA_EDIT_MEMBER_LEVELS=["manager"])
+    def test_member_levels(self):
+        self.assertEqual(
+            self.editable(self.manager, AcquisitionFramework),
+            {self.organism_framework.pk},
+        )
+        self.assertEqual(
+            self.editable(self.member, AcquisitionFramework), set()
+        )
+
+    @override_settings(SINP_METADATA_EDIT_ACTOR_ROLES=["other"])
+    def test_actor_roles(self):
+        self.assertEqual(
+            self.editable(self.manager, AcquisitionFramework), set()
+        )
+
+    def test_token_organism_ids(self):
+        # Token users carry their organism ids instead of memberships
+        self.stranger.organism_ids = frozenset([self.organism.pk])
+        self.assertEqual(
+            self.editable(self.stranger, AcquisitionFramework),
+            {self.organism_framework.pk},
+        )
+
+    def test_object_permission_rule(self):
+        dataset = self.other_framework.ds_acquisition_framework.first()
+        assign_perm(
+            "sinp_metadata.can_edit_self_acquisitionframework_organism",
+            self.granted,
+            self.other_framework,
+        )
+        group = Group.objects.create(name="editors")
+        group.user_set.add(self.granted)
+        assign_perm(
+            "sinp_metadata.can_edit_self_dataset_organism", group, dataset
+        )
+        self.assertEqual(
+            self.editable(self.granted, AcquisitionFramework),
+            {self.other_framework.pk},
+        )
+        self.assertEqual(self.editable(self.granted, Dataset), {dataset.pk})
+
+    def test_filter_editable(self):
+        frameworks = AcquisitionFramework.objects.all()
+        editable = filter_editable(frameworks, self.creator)
+        not_editable = filter_editable(frameworks, self.creator, False)
+        self.assertEqual(list(editable), [self.own_framework])
+        self.assertEqual(
+            set(not_editable), set(frameworks) - {self.own_framework}
+        )
+        superuser = get_user_model().objects.create_superuser(
+            "admin", "admin@example.org", "password"
+        )
+        self.assertEqual(filter_editable(frameworks, superuser).count(), 3)
+
+    def test_can_edit_filter(self):
+        for value, expected in (
+            ("true", {self.own_framework.pk}),
+            ("false", set()),
+        ):
+            response = self.call(
+                AcquisitionFrameworkViewset,
+                "list",
+                self.creator,
+                data={"can_edit": value},
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual({af["id"] for af in response.data}, expected)
+            self.assertTrue(
+                all(
+                    af["can_edit"] == (value == "true") for af in response.data
+                )
+            )
+        response = self.call(
+            AcquisitionFrameworkViewset,
+            "list",
+            self.creator,
+            data={"can_edit": "yes"},
+        )
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(SINP_METADATA_EDIT_MEMBER_LEVELS=["manager"])
+    def test_write_foreign_record(self):
+        # The member sees the framework of its organism, without edit rights
+        pk = self.organism_framework.pk
+        dataset = self.organism_framework.ds_acquisition_framework.first()
+        for viewset, action, method, record, data in (
+            (AcquisitionFrameworkViewset, "partial_update", "patch", pk, {}),
+            (AcquisitionFrameworkViewset, "destroy", "delete", pk, None),
+            (AcquisitionFrameworkViewset, "clone", "post", pk, {}),
+            (DatasetViewset, "partial_update", "patch", dataset.pk, {}),
+            (DatasetViewset, "destroy", "delete", dataset.pk, None),
+        ):
+            with self.subTest(viewset=viewset.__name__, action=action):
+                response = self.call(
+                    viewset, "retrieve", self.member, pk=record
+                )
+                self.assertEqual(response.status_code, 200)
+                response = self.call(
+                    viewset, action, self.member, method, data, pk=record
+                )
+                self.assertEqual(response.status_code, 403)
+        response = self.call(
+            AcquisitionFrameworkViewset,
+            "partial_update",
+            self.manager,
+            "patch",
+            {"label": "Renamed"},
+            pk=pk,
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class BulkWriteTestCase(MetadataTestCase):
+    """Batch writes of :mod:`sinp_metadata.bulk`"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = cls.create_user("editor")
+        cls.framework = cls.create_framework("Framework", created_by=cls.user)
+        cls.foreign = cls.create_framework("Foreign")
+        cls.datasets = list(
+            cls.framework.ds_acquisition_framework.order_by("pk")
+        )
+
+    def bulk(self, action, method, items, user=None):
+        return self.call(
+            DatasetViewset, action, user or self.user, method, items
+        )
+
+    def assert_errors(self, response, status_code, expected):
+        """Per index error fields"""
+        self.assertEqual(response.status_code, status_code)
+        errors = {}
+        for error in response.data["errors"]:
+            errors.setdefault(int(error["index"]), set()).update(
+                error["errors"]
+            )
+        self.assertEqual(
+            {index: sorted(fields) for index, fields in errors.items()},
+            expected,
+        )
+
+    def test_create(self):
+        response = self.bulk(
+            "bulk_create",
+            "post",
+            [self.dataset_item(self.framework, f"New {i}") for i in range(3)],
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [result["index"] for result in response.data["results"]],
+            [0, 1, 2],
+        )
+        created = Dataset.objects.filter(label__startswith="New")
+        self.assertEqual(created.count(), 3)
+        self.assertEqual({ds.created_by for ds in created}, {self.user})
+        self.assertEqual(
+            {ds.territory.get() for ds in created}, {self.territory}
+        )
+
+    def test_create_route(self):
+        client = APIClient()
+        client.force_login(self.user)
+        url = reverse("metadata:dataset_create_api")
+        response = client.post(
+            url, self.dataset_item(self.framework, "Single"), format="json"
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(
+            Dataset.objects.get(label="Single").acquisition_framework,
+            self.framework,
+        )
+        response = client.post(
+            url, self.dataset_item(self.foreign, "Foreign"), format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("acquisition_framework", response.data)
+        self.assertTrue(
+            reverse("metadata:acquisition_framework_list_api").endswith(
+                "/list"
+            )
+        )
+
+    def test_create_all_or_nothing(self):
+        response = self.bulk(
+            "bulk_create",
+            "post",
+            [
+                self.dataset_item(self.framework, "New"),
+                self.dataset_item(self.framework, "Framework 0"),
+                self.dataset_item(self.framework, "Bad", territory=[0]),
+                self.dataset_item(self.framework, "New"),
+            ],
+        )
+        self.assert_errors(
+            response,
+            400,
+            {
+                1: ["label", "short_label"],
+                2: ["territory"],
+                3: ["label", "short_label"],
+            },
+        )
+        self.assertFalse(Dataset.objects.filter(label="New").exists())
+
+    @override_settings(SINP_METADATA_BULK_MAX_ITEMS=2)
+    def test_max_items(self):
+        response = self.bulk(
+            "bulk_create",
+            "post",
+            [self.dataset_item(self.framework, f"New {i}") for i in range(3)],
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Dataset.objects.filter(label__startswith="New"))
+
+    def test_foreign_framework(self):
+        response = self.bulk(
+            "bulk_create",
+            "post",
+            [
+                self.dataset_item(self.framework, "New"),
+                self.dataset_item(self.foreign, "Intruder"),
+            ],
+        )
+        self.assert_errors(response, 400, {1: ["acquisition_framework"]})
+        response = self.bulk(
+            "bulk_partial_update",
+            "patch",
+            [
+                {
+                    "id": self.datasets[0].pk,
+                    "acquisition_framework": self.foreign.pk,
+                }
+            ],
+        )
+        self.assert_errors(response, 400, {0: ["acquisition_framework"]})
+        # Keeping the current framework is allowed
+        response = self.bulk(
+            "bulk_partial_update",
+            "patch",
+            [
+                {
+                    "id": self.datasets[0].pk,
+                    "acquisition_framework": self.framework.pk,
+                }
+            ],
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_update(self):
+        first, second = self.datasets
+        territory = create_nomenclature("territory", "2")
+        response = self.bulk(
+            "bulk_partial_update",
+            "patch",
+            [
+                {"id": first.pk, "label": "Renamed"},
+                {"id": second.pk, "territory": [territory.pk]},
+            ],
+        )
+        self.assertEqual(response.status_code, 200)
+        first.refresh_from_db()
+        self.assertEqual(first.label, "Renamed")
+        self.assertEqual(first.updated_by, self.user)
+        self.assertEqual(list(second.territory.all()), [territory])
+
+    def test_update_errors(self):
+        first, second = self.datasets
+        response = self.bulk(
+            "bulk_partial_update",
+            "patch",
+            [
+                {"id": first.pk, "label": "Renamed"},
+                {"id": first.pk, "territory": []},
+                {"id": 0},
+            ],
+        )
+        self.assert_errors(response, 400, {1: ["id"], 2: ["id"]})
+        # Taken by a batch record which keeps it
+        response = self.bulk(
+            "bulk_partial_update",
+            "patch",
+            [
+                {"id": first.pk, "label": second.label},
+                {"id": second.pk, "desc": "Kept label"},
+            ],
+        )
+        self.assert_errors(response, 400, {0: ["label"]})
+        # Rows are updated one by one, so values can't be swapped
+        response = self.bulk(
+            "bulk_partial_update",
+            "patch",
+            [
+                {"id": first.pk, "label": second.label},
+                {"id": second.pk, "label": first.label},
+            ],
+        )
+        self.assert_errors(response, 400, {0: ["label"], 1: ["label"]})
+        response = self.bulk(
+            "bulk_partial_update",
+            "patch",
+            [
+                {"id": first.pk, "label": first.label},
+                {"id": second.pk, "label": "Renamed"},
+            ],
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_editable(self):
+        foreign = self.foreign.ds_acquisition_framework.first()
+        # Reads every record, edits none
+        reader = self.create_user("reader")
+        reader.access_all_data = True
+        for action, method, items in (
+            ("bulk_partial_update", "patch", [{"id": foreign.pk}]),
+            ("bulk_destroy", "delete", [foreign.pk]),
+        ):
+            response = self.bulk(action, method, items)
+            # Not visible
+            self.assert_errors(response, 400, {0: ["id"]})
+            response = self.bulk(
+                action, method, [self.datasets[0].pk, foreign.pk], reader
+            )
+            self.assert_errors(response, 403, {0: ["id"], 1: ["id"]})
+        self.assertTrue(Dataset.objects.filter(pk=foreign.pk).exists())
+
+    def test_destroy(self):
+        pks = [dataset.pk for dataset in self.datasets]
+        response = self.call(
+            DatasetViewset,
+            "bulk_delete_preview",
+            self.user,
+            "post",
+            pks,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["deleted"]["sinp_metadata.Dataset"], 2)
+        self.assertTrue(Dataset.objects.filter(pk__in=pks).exists())
+        response = self.bulk("bulk_destroy", "delete", pks)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"deleted": 2})
+        self.assertFalse(Dataset.objects.filter(pk__in=pks).exists())
+
+
+class DeletionTestCase(MetadataTestCase):
+    """Set-based deletion of :mod:`sinp_metadata.deletion`"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = cls.create_user("editor")
+        cls.organism = cls.create_organism("Organism")
+        cls.keyword = Keyword.objects.create(keyword="Bats")
+        cls.framework = cls.create_framework(
+            "Framework",
+            datasets=3,
+            actors=[cls.organism_actor(cls.organism)],
+            created_by=cls.user,
+            is_metaframework=True,
+        )
+        cls.framework.keywords.add(cls.keyword)
+        cls.child = cls.create_framework(
+            "Child", datasets=1, parent_framework=cls.framework
+        )
+        cls.other = cls.create_framework("Other", datasets=1)
+
+    def test_preview_matches_deletion(self):
+        preview = preview_deletion(AcquisitionFramework, [self.framework.pk])
+        self.assertEqual(
+            preview["deleted"]["sinp_metadata.AcquisitionFramework"], 1
+        )
+        self.assertEqual(preview["deleted"]["sinp_metadata.Dataset"], 3)
+        self.assertEqual(
+            preview["updated"], {"sinp_metadata.AcquisitionFramework": 1}
+        )
+        self.assertEqual(preview["protected"], {})
+        # The preview deletes nothing
+        self.assertTrue(
+            AcquisitionFramework.objects.filter(pk=self.framework.pk).exists()
+        )
+
+        counts = delete_records(
+            AcquisitionFramework, [self.framework.pk], user=self.user
+        )
+        self.assertEqual(counts, preview["deleted"])
+        self.assertFalse(
+            Dataset.objects.filter(
+                acquisition_framework=self.framework.pk
+            ).exists()
+        )
+        self.child.refresh_from_db()
+        self.assertIsNone(self.child.parent_framework)
+        self.assertEqual(self.other.ds_acquisition_framework.count(), 1)
+        self.assertTrue(Keyword.objects.filter(pk=self.keyword.pk).exists())
+
+    def test_tombstones(self):
+        datasets = dict(
+            self.framework.ds_acquisition_framework.values_list("pk", "uuid")
+        )
+        delete_records(
+            AcquisitionFramework, [self.framework.pk], user=self.user
+        )
+        tombstones = DeletedRecord.objects.all()
+        self.assertEqual(
+            {(t.record_type, t.record_id, t.uuid) for t in tombstones},
+            {
+                (
+                    "acquisition_framework",
+                    self.framework.pk,
+                    self.framework.uuid,
+                ),
+                *(("dataset", pk, uuid) for pk, uuid in datasets.items()),
+            },
+        )
+        self.assertEqual({t.deleted_by for t in tombstones}, {self.user})
+
+    def test_protected(self):
+        project = Project.objects.create(label="Project")
+        dataset = self.other.ds_acquisition_framework.get()
+        dataset.project = project
+        dataset.save()
+        self.assertEqual(
+            preview_deletion(Project, [project.pk])["protected"],
+            {"sinp_metadata.Dataset": 1},
+        )
+        with self.assertRaises(ProtectedError):
+            delete_records(Project, [project.pk])
+        self.assertTrue(Project.objects.filter(pk=project.pk).exists())
+        self.assertFalse(DeletedRecord.objects.exists())
+
+    def test_protected_api(self):
+        protected = self.other.ds_acquisition_framework.all()
+        with mock.patch(
+            "sinp_metadata.deletion.get_protected", return_value=[protected]
+        ):
+            response = self.call(
+                AcquisitionFrameworkViewset,
+                "destroy",
+                self.user,
+                "delete",
+                pk=self.framework.pk,
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("protected", response.data)
+        self.assertTrue(
+            AcquisitionFramework.objects.filter(pk=self.framework.pk).exists()
+        )
+
+    def test_destroy_api(self):
+        response = self.call(
+            AcquisitionFrameworkViewset,
+            "delete_preview",
+            self.user,
+            pk=self.framework.pk,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["deleted"]["sinp_metadata.Dataset"], 3)
+        response = self.call(
+            AcquisitionFrameworkViewset,
+            "destroy",
+            self.user,
+            "delete",
+            pk=self.framework.pk,
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertTrue(
+            DeletedRecord.objects.filter(
+                record_type="acquisition_framework",
+                record_id=self.framework.pk,
+            ).exists()
+        )
+
+
+class ConformanceTestCase(MetadataTestCase):
+    """Incremental conformance checks"""
+
+    def test_m2m_change_checked_again(self):
+        framework = self.create_framework("Framework", datasets=0)
+        organism = self.create_organism("Organism")
+        record_type = ConformanceResult.ACQUISITION_FRAMEWORK
+        self.assertEqual(
+            check_conformance([record_type]), {record_type: (1, 1)}
+        )
+        self.assertFalse(stale_records(record_type).exists())
+
+        # The missing main contact is added
+        framework.actors.add(self.organism_actor(organism))
+        self.assertEqual(list(stale_records(record_type)), [framework])
+        check_conformance([record_type])
+        result = ConformanceResult.objects.get(record_id=framework.pk)
+        self.assertNotIn(
+            "main_contact_required",
+            [error["rule"] for error in result.errors],
+        )
+
+
+@override_settings(SINP_METADATA_JOB_MAX_WORKERS=2)
+class JobParamsTestCase(MetadataTestCase):
+    """Per kind validation of submitted job parameters"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = cls.create_user("admin", is_superuser=True)
+
+    def submit(self, kind, params):
+        return self.call(
+            JobViewset,
+            "create",
+            self.admin,
+            method="post",
+            data={"kind": kind, "params": params},
+        )
+
+    def test_valid_params(self):
+        response = self.submit(
+            "check_conformance",
+            {"record_types": [ConformanceResult.DATASET], "workers": 64},
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        job = Job.objects.get(pk=response.data["id"])
+        self.assertEqual(
+            job.params,
+            {
+                "record_types": [ConformanceResult.DATASET],
+                "full": False,
+                "workers": 2,
+            },
+        )
+
+    def test_invalid_params(self):
+        for kind, params, field in (
+            (
+                "check_conformance",
+                {"record_types": ["unknown"]},
+                "record_types",
+            ),
+            ("check_conformance", {"workers": 0}, "workers"),
+            ("export_columnar", {"batch_size": 0}, "batch_size"),
+            ("export_columnar", {"batch_size": "many"}, "batch_size"),
+            ("export_columnar", {"format": "csv"}, "format"),
+            ("refresh_statistics", {"dimensions": ["unknown"]}, "dimensions"),
+        ):
+            with self.subTest(kind=kind, params=params):
+                response = self.submit(kind, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.data["params"])
+        self.assertFalse(Job.objects.exists())
+
+    def test_submit_job(self):
+        with self.assertRaises(ValidationError):
+            submit_job("export_columnar", {"batch_size": -1})
+        job = submit_job("export_acquisition_frameworks", {"unused": 1})
+        self.assertEqual(job.params, {})
+
+
+class ReplicaProbeViewset(ReplicaReadMixin, GenericViewSet):
+    """Reports where metadata reads and writes are routed"""
+
+    permission_classes = []
+    replica_actions = ("list",)
+
+    def route(self):
+        return {"read": router.db_for_read(Keyword)}
+
+    def list(self, request):
+        return Response(self.route())
+
+    def retrieve(self, request, pk):
+        return Response(self.route())
+
+    def create(self, request):
+        write = router.db_for_write(Keyword)
+        return Response({"write": write, **self.route()})
+
+
+@override_settings(
+    DATABASE_ROUTERS=["sinp_metadata.routers.MetadataReplicaRouter"],
+    SINP_METADATA_REPLICA_PIN_SECONDS=10,
+)
+@mock.patch("sinp_metadata.routers.get_replica_alias", return_value="replica")
+class ReplicaRouterTestCase(MetadataTestCase):
+    """Routing of metadata reads to the replica"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = cls.create_user("user")
+        cls.other = cls.create_user("other")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_replica_actions(self, _alias):
+        response = self.call(ReplicaProbeViewset, "list", self.user)
+        self.assertEqual(response.data, {"read": "replica"})
+        response = self.call(ReplicaProbeViewset, "retrieve", self.user, pk=1)
+        self.assertEqual(response.data, {"read": "default"})
+        # Outside a replica block
+        self.assertEqual(router.db_for_read(Keyword), "default")
+
+    def test_write_pins_principal(self, _alias):
+        response = self.call(
+            ReplicaProbeViewset, "create", self.user, method="post"
+        )
+        self.assertEqual(
+            response.data, {"write": "default", "read": "default"}
+        )
+        # Request factories give no session, like token clients
+        response = self.call(ReplicaProbeViewset, "list", self.user)
+        self.assertEqual(response.data, {"read": "default"})
+        response = self.call(ReplicaProbeViewset, "list", self.other)
+        self.assertEqual(response.data, {"read": "replica"})
+        with override_settings(SINP_METADATA_REPLICA_PIN_SECONDS=0):
+            self.call(ReplicaProbeViewset, "create", self.other, method="post")
+        response = self.call(ReplicaProbeViewset, "list", self.other)
+        self.assertEqual(response.data, {"read": "replica"})
+
+    def test_use_replica(self, _alias):
+        with use_replica(pin_on_write=False):
+            self.assertEqual(router.db_for_read(Keyword), "replica")
+            self.assertEqual(router.db_for_write(Keyword), "default")
+            self.assertEqual(router.db_for_read(Keyword), "replica")
+        with use_replica():
+            self.assertEqual(router.db_for_write(Keyword), "default")
+            self.assertEqual(router.db_for_read(Keyword), "default")
+        with use_replica(enabled=False):
+            self.assertEqual(router.db_for_read(Keyword), "default")
+
+
+class HarvestTestCase(MetadataTestCase):
+    """OAI-PMH deleted records and datestamps"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = cls.create_user("admin", is_superuser=True)
+        cls.user = cls.create_user("user")
+        cls.old = cls.create_framework("Old", datasets=0)
+        AcquisitionFramework.objects.filter(pk=cls.old.pk).update(
+            timestamp_update=datetime.datetime(
+                2000, 1, 1, tzinfo=datetime.timezone.utc
+            )
+        )
+        cls.framework = cls.create_framework(
+            "Framework", datasets=1, created_by=cls.user
+        )
+
+    def harvest(self, user, **params):
+        root = ET.fromstring(OaiPmh(params, user, "/oai").response())
+        return root.find(f"{{{OAI_NAMESPACE}}}{params['verb']}")
+
+    def headers(self, user):
+        """Identifiers and statuses of every harvested header"""
+        headers = {}
+        params = {"metadataPrefix": METADATA_PREFIX}
+        while params:
+            element = self.harvest(user, verb="ListIdentifiers", **params)
+            for header in element.iter(f"{{{OAI_NAMESPACE}}}header"):
+                identifier = header.find(f"{{{OAI_NAMESPACE}}}identifier")
+                headers[identifier.text.split(":")[-1]] = header.get("status")
+            token = element.find(f"{{{OAI_NAMESPACE}}}resumptionToken")
+            params = (
+                {"resumptionToken": token.text}
+                if token is not None and token.text
+                else None
+            )
+        return headers
+
+    def test_deleted_records(self):
+        dataset = Dataset.objects.get(acquisition_framework=self.framework)
+        delete_records(Dataset, [dataset.pk], self.admin)
+        expected = {
+            str(self.old.uuid): None,
+            str(self.framework.uuid): None,
+            str(dataset.uuid): "deleted",
+        }
+        self.assertEqual(self.headers(self.admin), expected)
+        with override_settings(SINP_METADATA_OAI_PAGE_SIZE=1):
+            self.assertEqual(self.headers(self.admin), expected)
+        # Tombstones carry no visibility
+        self.assertEqual(
+            self.headers(self.user), {str(self.framework.uuid): None}
+        )
+
+        identifier = f"oai:{get_repository_id()}:dataset:{dataset.uuid}"
+        element = self.harvest(
+            self.admin,
+            verb="GetRecord",
+            identifier=identifier,
+            metadataPrefix=METADATA_PREFIX,
+        )
+        record = element.find(f"{{{OAI_NAMESPACE}}}record")
+        self.assertEqual(
+            record.find(f"{{{OAI_NAMESPACE}}}header").get("status"), "deleted"
+        )
+        self.assertIsNone(record.find(f"{{{OAI_NAMESPACE}}}metadata"))
+
+    def test_identify(self):
+        element = self.harvest(self.admin, verb="Identify")
+        self.assertEqual(
+            element.find(f"{{{OAI_NAMESPACE}}}deletedRecord").text, "transient"
+        )
+        self.assertEqual(
+            element.find(f"{{{OAI_NAMESPACE}}}earliestDatestamp").text,
+            "2000-01-01T00:00:00Z",
+        )
+        # The old framework is out of the user's scope
+        element = self.harvest(self.user, verb="Identify")
+        self.assertEqual(
+            element.find(f"{{{OAI_NAMESPACE}}}earliestDatestamp").text,
+            format_datestamp(self.framework.timestamp_update),
+        )
+
+
+def read_varint(data, pos):
+    """Protobuf varint at a position, and the next position"""
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return result, pos
+
+
+def read_message(data):
+    """Protobuf message fields, as ``(field, value)`` pairs"""
+    fields = []
+    pos = 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        field, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = data[pos : pos + 8], pos + 8
+        elif wire_type == 2:
+            length, pos = read_varint(data, pos)
+            value, pos = data[pos : pos + length], pos + length
+        else:
+            raise ValueError(f"Unexpected wire type {wire_type}")
+        fields.append((field, value))
+    return fields
+
+
+def read_packed(data):
+    values = []
+    pos = 0
+    while pos < len(data):
+        value, pos = read_varint(data, pos)
+        values.append(value)
+    return values
+
+
+def unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def decode_value(data):
+    ((field, value),) = read_message(data)
+    return {
+        1: lambda: value.decode(),
+        3: lambda: struct.unpack("<d", value)[0],
+        6: lambda: unzigzag(value),
+        7: lambda: bool(value),
+    }[field]()
+
+
+def decode_geometry(commands):
+    """Rings of MVT geometry commands, in tile coordinates"""
+    rings = []
+    x = y = 0
+    pos = 0
+    while pos < len(commands):
+        command, count = commands[pos] & 0x7, commands[pos] >> 3
+        pos += 1
+        if command == mvt.CLOSE_PATH:
+            continue
+        if command == mvt.MOVE_TO:
+            rings.append([])
+        for _ in range(count):
+            x += unzigzag(commands[pos])
+            y += unzigzag(commands[pos + 1])
+            pos += 2
+            rings[-1].append((x, y))
+    return rings
+
+
+def decode_tile(data):
+    """Layers of an MVT tile, by name"""
+    layers = {}
+    for _field, layer_data in read_message(data):
+        fields = read_message(layer_data)
+        keys = [value.decode() for field, value in fields if field == 3]
+        values = [decode_value(value) for field, value in fields if field == 4]
+        features = []
+        for field, value in fields:
+            if field != 2:
+                continue
+            feature = dict(read_message(value))
+            tags = read_packed(feature.get(2, b""))
+            features.append(
+                {
+                    "id": feature[1],
+                    "type": feature[3],
+                    "properties": {
+                        keys[k]: values[v]
+                        for k, v in zip(tags[::2], tags[1::2])
+                    },
+                    "rings": decode_geometry(read_packed(feature[4])),
+                }
+            )
+        name = next(value for field, value in fields if field == 1).decode()
+        layers[name] = {
+            "version": next(value for field, value in fields if field == 15),
+            "extent": next(value for field, value in fields if field == 5),
+            "features": features,
+        }
+    return layers
+
+
+class MvtTestCase(SimpleTestCase):
+    """Vector tiles encoder, checked by decoding its tiles"""
+
+    def test_round_trip(self):
+        square = [(0, 0), (0, 100), (100, 100), (100, 0)]
+        hole = [(25, 25), (75, 25), (75, 75), (25, 75)]
+        other = [(200, 200), (300, 200), (300, 300), (200, 300)]
+        tile = mvt.encode_layer(
+            "datasets",
+            [
+                (
+                    1,
+                    [[square[::-1], hole]],
+                    {"label": "Foo", "count": -2, "ratio": 0.5, "none": None},
+                ),
+                (2, [[other], [[(0, 0), (10, 0), (20, 0)]]], {"flag": True}),
+                # Degenerate polygons only, left out
+                (3, [[[(0, 0), (10, 10)]]], {}),
+            ],
+        )
+        layer = decode_tile(tile)["datasets"]
+        self.assertEqual((layer["version"], layer["extent"]), (2, mvt.EXTENT))
+        self.assertEqual(
+            [(f["id"], f["type"], f["properties"]) for f in layer["features"]],
+            [
+                (
+                    1,
+                    mvt.POLYGON,
+                    {"label": "Foo", "count": -2, "ratio": 0.5},
+                ),
+                (2, mvt.POLYGON, {"flag": True}),
+            ],
+        )
+        exterior, interior = layer["features"][0]["rings"]
+        # Exterior rings are wound with a positive area, interior rings
+        # with a negative one
+        self.assertEqual(set(exterior), set(square))
+        self.assertGreater(mvt._ring_area(exterior), 0)
+        self.assertEqual(set(interior), set(hole))
+        self.assertLess(mvt._ring_area(interior), 0)
+        self.assertEqual(layer["features"][1]["rings"], [other])
+
+    def test_empty(self):
+        self.assertEqual(mvt.encode_layer("datasets", []), b"")
+
+    def test_tile_coords(self):
+        self.assertEqual(
+            mvt.to_tile_coords(
+                [(0, 0), (10, 0), (10, 10), (10, 10), (0, 0)],
+                (0, 0, 10, 10),
+                extent=100,
+            ),
+            [(0, 100), (100, 100), (100, 0)],
+        )
+
+
+class CachedTokenAuthenticationTestCase(MetadataTestCase):
+    """Token principals are cached until the user, its memberships or the
+    token change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = cls.create_user("user")
+        cls.organism = cls.create_organism("Organism")
+        cls.level = create_nomenclature("member_level", "1")
+        cls.token, cls.key = ApiToken.objects.create_token(cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def authenticate(self):
+        request = APIRequestFactory().get(
+            "/", HTTP_AUTHORIZATION=f"Token {self.key}"
+        )
+        return CachedTokenAuthentication().authenticate(request)[0]
+
+    def assert_resolved_again(self, change):
+        """The principal is read again after a committed change"""
+        self.authenticate()
+        with self.assertNumQueries(0):
+            self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        with CaptureQueriesContext(connection) as queries:
+            user = self.authenticate()
+        self.assertTrue(queries)
+        return user
+
+    def test_cached(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.organism_ids, frozenset())
+        # Logins only touch last_login
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=["last_login"])
+        with self.assertNumQueries(0):
+            self.authenticate()
+
+    def test_user_save(self):
+        def change():
+            self.user.first_name = "Renamed"
+            self.user.save()
+
+        user = self.assert_resolved_again(change)
+        self.assertEqual(user.first_name, "Renamed")
+
+    def test_membership(self):
+        user = self.assert_resolved_again(
+            lambda: OrganismMember.objects.create(
+                member=self.user, organism=self.organism
+            )
+        )
+        self.assertEqual(user.organism_ids, {self.organism.pk})
+        membership = OrganismMember.objects.get(member=self.user)
+        self.assert_resolved_again(
+            lambda: membership.member_level.add(self.level)
+        )
+        self.assert_resolved_again(
+            lambda: self.level.member_level.remove(membership)
+        )
+        user = self.assert_resolved_again(membership.delete)
+        self.assertEqual(user.organism_ids, frozenset())
+
+    def test_revoked_token(self):
+        def change():
+            self.token.revoked = True
+            self.token.save()
+
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+
+class SnapshotTestCase(MetadataTestCase):
+    """Snapshot files serving and pruning"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        snapshot_dir = override_settings(
+            SINP_METADATA_SNAPSHOT_DIR=directory.name
+        )
+        snapshot_dir.enable()
+        self.addCleanup(snapshot_dir.disable)
+
+    def serve(self, **headers):
+        path = self.root / "catalogue.json.gz"
+        path.write_bytes(b"0123456789")
+        request = RequestFactory().get("/", headers=headers)
+        response = snapshots.serve_file(
+            request, path, '"abc"', "application/gzip"
+        )
+        content = (
+            b"".join(response.streaming_content)
+            if response.streaming
+            else response.content
+        )
+        response.close()
+        return response, content
+
+    def test_serve_file(self):
+        response, content = self.serve()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content, b"0123456789")
+        self.assertEqual(response["ETag"], '"abc"')
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+        response, content = self.serve(if_none_match='"abc"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(content, b"")
+
+    def test_serve_range(self):
+        for header, content_range, expected in (
+            ("bytes=2-5", "bytes 2-5/10", b"2345"),
+            ("bytes=7-", "bytes 7-9/10", b"789"),
+            ("bytes=-3", "bytes 7-9/10", b"789"),
+            ("bytes=8-20", "bytes 8-9/10", b"89"),
+        ):
+            with self.subTest(header=header):
+                response, content = self.serve(range=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response["Content-Range"], content_range)
+                self.assertEqual(
+                    int(response["Content-Length"]), len(expected)
+                )
+                self.assertEqual(content, expected)
+        # Stale If-Range, the whole file is served
+        response, content = self.serve(range="bytes=2-5", if_range='"old"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content, b"0123456789")
+
+    def test_serve_unsatisfiable_range(self):
+        for header in ("bytes=10-", "bytes=5-2"):
+            with self.subTest(header=header):
+                response, _content = self.serve(range=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response["Content-Range"], "bytes */10")
+
+    def test_prune(self):
+        for name in ("a", "b", "c", "d", ".e.tmp"):
+            (self.root / name).mkdir()
+        snapshots.prune_snapshots(2, {"a", "d"})
+        self.assertEqual(
+            sorted(p.name for p in self.root.iterdir()), [".e.tmp", "a", "d"]
+        )
+
+    def test_create_keeps_latest_and_previous(self):
+        (self.root / "00000000T000000000000Z-old").mkdir()
+        previous = snapshots.create_snapshot(keep=1)["name"]
+        latest = snapshots.create_snapshot(keep=1)["name"]
+        self.assertEqual(
+            sorted(p.name for p in self.root.iterdir()),
+            sorted([previous, latest, "latest"]),
+        )
+        self.assertEqual(snapshots.get_latest_manifest()["name"], latest)
+
+
+class ThrottledView(RateLimitMixin, APIView):
+    permission_classes = []
+    throttle_scope = "test"
+
+    def get(self, request):
+        return Response({})
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    },
+    SINP_METADATA_THROTTLE_RATES={"test": "3/min"},
+)
+class ThrottlingTestCase(MetadataTestCase):
+    """Token buckets, with a frozen clock"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = cls.create_user("user")
+        cls.other = cls.create_user("other")
+
+    def setUp(self):
+        cache.clear()
+        self.now = 1000.0
+        patcher = mock.patch(
+            "sinp_metadata.throttling.time.time", side_effect=lambda: self.now
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, user=None):
+        request = APIRequestFactory().get("/")
+        force_authenticate(request, user=user or self.user)
+        response = ThrottledView.as_view()(request)
+        response.render()
+        return response
+
+    def remaining(self, count, user=None):
+        return [
+            (response.status_code, response.get("RateLimit-Remaining"))
+            for response in (self.get(user) for _ in range(count))
+        ]
+
+    def test_burst(self):
+        response = self.get()
+        self.assertEqual(response["RateLimit-Limit"], "3")
+        self.assertEqual(response["RateLimit-Remaining"], "2")
+        self.assertEqual(response["RateLimit-Reset"], "20")
+        self.assertEqual(self.remaining(2), [(200, "1"), (200, "0")])
+        response = self.get()
+        self.assertEqual(response.status_code, 429)
+        # One token every 20 seconds
+        self.assertEqual(response["Retry-After"], "20")
+        self.assertEqual(response["RateLimit-Remaining"], "0")
+        # Buckets are per client
+        self.assertEqual(self.get(self.other).status_code, 200)
+
+    def test_refill(self):
+        self.remaining(3)
+        self.now += 10
+        response = self.get()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "10")
+        self.now += 10
+        self.assertEqual(self.remaining(2), [(200, "0"), (429, "0")])
+        # Refills are capped to the bucket capacity
+        self.now += 3600
+        self.assertEqual(
+            self.remaining(4), [(200, "2"), (200, "1"), (200, "0"), (429, "0")]
+        )
+
+    def test_unlimited(self):
+        with override_settings(SINP_METADATA_THROTTLE_RATES={"test": None}):
+            self.assertEqual(self.remaining(5), [(200, None)] * 5)
+        with override_settings(SINP_METADATA_THROTTLE_EXEMPT_USERS=["user"]):
+            self.assertEqual(self.remaining(5), [(200, None)] * 5)
+            response = self.get(self.other)
+        self.assertEqual(response["RateLimit-Remaining"], "2")
+
+
+class CloningTestCase(MetadataTestCase):
+    """Copies of acquisition frameworks"""
+
+    def test_default_suffix(self):
+        framework = self.create_framework("Framework")
+        labels = []
+        for _ in range(3):
+            clone = clone_acquisition_framework(framework)
+            labels.append(
+                (
+                    clone.label,
+                    sorted(
+                        Dataset.objects.filter(
+                            acquisition_framework=clone
+                        ).values_list("label", flat=True)
+                    ),
+                )
+            )
+        self.assertEqual(
+            labels,
+            [
+                (
+                    f"Framework{suffix}",
+                    [f"Framework 0{suffix}", f"Framework 1{suffix}"],
+                )
+                for suffix in (" (copy)", " (copy 2)", " (copy 3)")
+            ],
+        )
+
+    def test_suffix_conflict(self):
+        framework = self.create_framework("Framework")
+        clone_acquisition_framework(framework, dataset_suffix=" bis")
+        with self.assertRaisesMessage(ValueError, "Datasets already exist"):
+            clone_acquisition_framework(framework, dataset_suffix=" bis")
@@ -0,0 +1,148 @@
+"""Token bucket throttling of the metadata API
+
+Each client (user, or IP address for anonymous requests) has one bucket
+per endpoint class (scope), stored in Django's cache so limits hold
+across every worker. Buckets hold ``N`` tokens, refilled continuously at
+``N`` per period, which allows short bursts while capping the sustained
+rate. Responses carry ``RateLimit-*`` headers.
+
+Settings::
+
+    SINP_METADATA_THROTTLE_RATES = {
+        "light": "300/min",
+        "default": "60/min",
+        "export": "20/hour",
+        # OAI-PMH, a harvest pages through resumption tokens
+        "harvest": "120/min",
+        # Precomputed snapshot files, downloads may be resumed by range
+        "snapshot": "120/hour",
+    }
+
+A ``None`` rate disables throttling of the scope, and users listed by
+username in ``SINP_METADATA_THROTTLE_EXEMPT_USERS`` (service accounts, load
+tests) are never throttled. Bucket updates are not
+atomic (the cache API has no compare-and-set), so concurrent requests of
+a same client may slightly exceed the limit.
+"""
+
+import logging
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+from .cache import KEY_PREFIX
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATES = {
+    "light": "300/min",
+    "default": "60/min",
+    "export": "20/hour",
+    "harvest": "120/min",
+    "snapshot": "120/hour",
+}
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def get_rates():
+    return {
+        **DEFAULT_RATES,
+        **getattr(settings, "SINP_METADATA_THROTTLE_RATES", {}),
+    }
+
+
+def get_exempt_users():
+    return set(getattr(settings, "SINP_METADATA_THROTTLE_EXEMPT_USERS", ()))
+
+
+def parse_rate(rate):
+    """Parse a ``"<requests>/<period>"`` rate
+
+    Returns:
+        tuple: bucket capacity and refill rate (tokens per second), or
+        ``(None, None)`` for an unlimited rate
+    """
+    if rate is None:
+        return None, None
+    count, period = rate.split("/")
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttle requests by client and view scope
+
+    The scope comes from the view ``get_throttle_scope()`` (see
+    :class:`RateLimitMixin`), ``"default"`` otherwise.
+    """
+
+    def get_scope(self, view):
+        get_scope = getattr(view, "get_throttle_scope", None)
+        return get_scope() if get_scope else "default"
+
+    def get_client(self, request):
+        if request.user and request.user.is_authenticated:
+            return f"user:{request.user.pk}"
+        return f"ip:{self.get_ident(request)}"
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view)
+        capacity, refill = parse_rate(get_rates().get(scope))
+        if capacity is None:
+            return True
+        user = request.user
+        if user and user.is_authenticated:
+            if user.get_username() in get_exempt_users():
+                return True
+        key = f"{KEY_PREFIX}:throttle:{scope}:{self.get_client(request)}"
+        now = time.time()
+        tokens, updated_at = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # Expire once the bucket would be full again
+        timeout = math.ceil((capacity - tokens) / refill) + 1
+        cache.set(key, (tokens, now), timeout)
+        self.wait_time = 0 if allowed else (1 - tokens) / refill
+        request.rate_limit = {
+            "limit": capacity,
+            "remaining": int(tokens),
+            "reset": math.ceil((capacity - tokens) / refill),
+        }
+        if not allowed:
+            logger.info(f"Request throttled ({scope}, {key})")
+        return allowed
+
+    def wait(self):
+        return self.wait_time
+
+
+class RateLimitMixin:
+    """View mixin throttling requests with :class:`TokenBucketThrottle`
+
+    ``throttle_scope`` is the endpoint class of the view,
+    ``throttle_scopes`` overrides it per viewset action.
+    """
+
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = "default"
+    throttle_scopes = {}
+
+    def get_throttle_scope(self):
+        action = getattr(self, "action", None)
+        return self.throttle_scopes.get(action, self.throttle_scope)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        rate_limit = getattr(request, "rate_limit", None)
+        if rate_limit:
+            response["RateLimit-Limit"] = rate_limit["limit"]
+            response["RateLimit-Remaining"] = rate_limit["remaining"]
+            response["RateLimit-Reset"] = rate_limit["reset"]
+        return response
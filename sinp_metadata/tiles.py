@@ -0,0 +1,144 @@
+"""Vector tiles (MVT) of dataset footprints
+
+Tiles are built by PostGIS (``ST_AsMVT``) when available, or encoded in
+Python from ``Dataset.bbox`` otherwise. Each tile is cached per
+visibility scope and the cache is invalidated when a footprint changes
+(see :mod:`sinp_metadata.signals`).
+"""
+
+import logging
+
+from django.conf import settings
+from django.contrib.gis.geos import Polygon
+from django.db import connections, router
+
+from .cache import get_or_build
+from .models import Dataset
+from .mvt import EXTENT, encode_layer, to_tile_coords
+from .permissions import filter_visible_datasets, has_all_data_access
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAMESPACE = "tiles"
+LAYER_NAME = "datasets"
+MAX_ZOOM = 22
+BUFFER = 64
+WEB_MERCATOR = 3857
+WORLD_HALF_SIZE = 20037508.342789244
+
+POSTGIS_TILE_SQL = """
+WITH features AS (
+    SELECT ds.id, ds.uuid::text AS uuid, ds.label,
+        ST_AsMVTGeom(
+            ST_Transform(ds.bbox, {srid}), ST_TileEnvelope(%s, %s, %s),
+            {extent}, {buffer}, true
+        ) AS geom
+    FROM {table} ds
+    WHERE ds.bbox && ST_Transform(
+        ST_TileEnvelope(%s, %s, %s, margin => {margin}), %s
+    )
+    AND ds.id IN ({visible})
+)
+SELECT ST_AsMVT(features, '{layer}', {extent}, 'geom', 'id')
+FROM features WHERE geom IS NOT NULL
+"""
+
+
+def tile_bounds(z, x, y):
+    """Web mercator bounds of a tile
+
+    Returns:
+        tuple: minx, miny, maxx, maxy
+    """
+    size = 2 * WORLD_HALF_SIZE / 2**z
+    minx = -WORLD_HALF_SIZE + x * size
+    maxy = WORLD_HALF_SIZE - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def _buffered_envelope(bounds):
+    minx, miny, maxx, maxy = bounds
+    margin = (maxx - minx) * BUFFER / EXTENT
+    return Polygon.from_bbox(
+        (minx - margin, miny - margin, maxx + margin, maxy + margin)
+    )
+
+
+def _polygons(geometry):
+    if geometry.geom_type == "Polygon":
+        return [geometry]
+    if geometry.geom_type in ("MultiPolygon", "GeometryCollection"):
+        return [part for child in geometry for part in _polygons(child)]
+    return []
+
+
+def build_tile_postgis(z, x, y, datasets, using):
+    visible_sql, visible_params = datasets.values("pk").query.sql_with_params()
+    sql = POSTGIS_TILE_SQL.format(
+        srid=WEB_MERCATOR,
+        extent=EXTENT,
+        buffer=BUFFER,
+        margin=BUFFER / EXTENT,
+        table=connections[using].ops.quote_name(Dataset._meta.db_table),
+        visible=visible_sql,
+        layer=LAYER_NAME,
+    )
+    with connections[using].cursor() as cursor:
+        # A constant SRID keeps the bbox GiST index usable
+        cursor.execute(
+            sql,
+            [z, x, y, z, x, y, settings.GEODATA_SRID, *visible_params],
+        )
+        row = cursor.fetchone()
+    return bytes(row[0]) if row and row[0] else b""
+
+
+def build_tile_python(z, x, y, datasets):
+    bounds = tile_bounds(z, x, y)
+    clip = _buffered_envelope(bounds)
+    clip.srid = WEB_MERCATOR
+    lookup = clip.transform(settings.GEODATA_SRID, clone=True)
+    features = []
+    for pk, uuid, label, bbox in datasets.filter(
+        bbox__intersects=lookup
+    ).values_list("pk", "uuid", "label", "bbox"):
+        geometry = bbox.transform(WEB_MERCATOR, clone=True).intersection(clip)
+        polygons = [
+            [to_tile_coords(ring.coords, bounds) for ring in polygon]
+            for polygon in _polygons(geometry)
+        ]
+        properties = {"uuid": str(uuid), "label": label}
+        features.append((pk, polygons, properties))
+    return encode_layer(LAYER_NAME, features)
+
+
+def build_tile(z, x, y, user):
+    """Encode the dataset footprints of a tile visible to a user
+
+    Args:
+        z (int): zoom level
+        x (int): tile column
+        y (int): tile row
+        user: requesting user
+
+    Returns:
+        bytes: MVT tile, empty when no footprint intersects the tile
+    """
+    datasets = filter_visible_datasets(
+        Dataset.objects.filter(bbox__isnull=False), user
+    )
+    using = router.db_for_read(Dataset) or "default"
+    if getattr(connections[using].ops, "postgis", False):
+        return build_tile_postgis(z, x, y, datasets, using)
+    return build_tile_python(z, x, y, datasets)
+
+
+def get_tile(z, x, y, user):
+    """Cached :func:`build_tile`, shared by users seeing every dataset"""
+    scope = "all" if has_all_data_access(user) else user.pk
+    return get_or_build(
+        CACHE_NAMESPACE,
+        (z, x, y, scope),
+        lambda: build_tile(z, x, y, user),
+        timeout=getattr(settings, "SINP_METADATA_TILE_CACHE_TIMEOUT", 3600),
+    )
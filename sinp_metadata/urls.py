@@ -1,6 +1,19 @@
 from django.urls import path
 
-from .views import AcquisitionFrameworkViewset, OrganismViewset
+from .views import (
+    AcquisitionFrameworkViewset,
+    ConformanceResultViewset,
+    DatasetGeoJSONView,
+    DatasetTileView,
+    DatasetViewset,
+    DeletedRecordViewset,
+    JobViewset,
+    KeywordViewset,
+    OaiPmhView,
+    OrganismViewset,
+    SnapshotView,
+    StatisticsView,
+)
 
 app_name = "metadata"
 
@@ -24,22 +37,170 @@ urlpatterns = [
     path(
         "api/v1/metadata/acquisition_framework/",
         AcquisitionFrameworkViewset.as_view({"post": "create"}),
-        name="acquisition_framework_list_api",
+        name="acquisition_framework_create_api",
     ),
     path(
         "api/v1/metadata/acquisition_framework/<int:pk>",
-        AcquisitionFrameworkViewset.as_view({"get": "retrieve"}),
+        AcquisitionFrameworkViewset.as_view(
+            {
+                "get": "retrieve",
+                "put": "update",
+                "patch": "partial_update",
+                "delete": "destroy",
+            }
+        ),
         name="acquisition_framework_detail_api",
     ),
     path(
-        "api/v1/metadata/acquisition_framework/<int:pk>",
-        AcquisitionFrameworkViewset.as_view({"put": "partial-update"}),
-        name="acquisition_framework_list_api",
+        "api/v1/metadata/acquisition_framework/<int:pk>/clone",
+        AcquisitionFrameworkViewset.as_view({"post": "clone"}),
+        name="acquisition_framework_clone_api",
     ),
     path(
-        "api/v1/metadata/acquisition_framework/<int:pk>",
-        AcquisitionFrameworkViewset.as_view({"delete": "destroy"}),
-        name="acquisition_framework_list_api",
+        "api/v1/metadata/acquisition_framework/<int:pk>/delete_preview",
+        AcquisitionFrameworkViewset.as_view({"get": "delete_preview"}),
+        name="acquisition_framework_delete_preview_api",
+    ),
+    path(
+        "api/v1/metadata/acquisition_framework/bulk/delete_preview",
+        AcquisitionFrameworkViewset.as_view({"post": "bulk_delete_preview"}),
+        name="acquisition_framework_bulk_delete_preview_api",
+    ),
+    path(
+        "api/v1/metadata/acquisition_framework/facets",
+        AcquisitionFrameworkViewset.as_view({"get": "facets"}),
+        name="acquisition_framework_facets_api",
+    ),
+    path(
+        "api/v1/metadata/acquisition_framework/bulk",
+        AcquisitionFrameworkViewset.as_view(
+            {
+                "post": "bulk_create",
+                "put": "bulk_update",
+                "patch": "bulk_partial_update",
+                "delete": "bulk_destroy",
+            }
+        ),
+        name="acquisition_framework_bulk_api",
+    ),
+    path(
+        "api/v1/metadata/dataset/list",
+        DatasetViewset.as_view({"get": "list"}),
+        name="dataset_list_api",
+    ),
+    path(
+        "api/v1/metadata/dataset/",
+        DatasetViewset.as_view({"post": "create"}),
+        name="dataset_create_api",
+    ),
+    path(
+        "api/v1/metadata/dataset/<int:pk>",
+        DatasetViewset.as_view(
+            {
+                "get": "retrieve",
+                "put": "update",
+                "patch": "partial_update",
+                "delete": "destroy",
+            }
+        ),
+        name="dataset_detail_api",
+    ),
+    path(
+        "api/v1/metadata/dataset/<int:pk>/delete_preview",
+        DatasetViewset.as_view({"get": "delete_preview"}),
+        name="dataset_delete_preview_api",
+    ),
+    path(
+        "api/v1/metadata/dataset/bulk/delete_preview",
+        DatasetViewset.as_view({"post": "bulk_delete_preview"}),
+        name="dataset_bulk_delete_preview_api",
+    ),
+    path(
+        "api/v1/metadata/dataset/facets",
+        DatasetViewset.as_view({"get": "facets"}),
+        name="dataset_facets_api",
+    ),
+    path(
+        "api/v1/metadata/dataset/geojson",
+        DatasetGeoJSONView.as_view(),
+        name="dataset_geojson_api",
+    ),
+    path(
+        "api/v1/metadata/dataset/bulk",
+        DatasetViewset.as_view(
+            {
+                "post": "bulk_create",
+                "put": "bulk_update",
+                "patch": "bulk_partial_update",
+                "delete": "bulk_destroy",
+            }
+        ),
+        name="dataset_bulk_api",
+    ),
+    path(
+        "api/v1/metadata/keywords/autocomplete",
+        KeywordViewset.as_view({"get": "autocomplete"}),
+        name="keyword_autocomplete_api",
+    ),
+    path(
+        "api/v1/metadata/oai",
+        OaiPmhView.as_view(),
+        name="oai_pmh_api",
+    ),
+    path(
+        "api/v1/metadata/jobs/list",
+        JobViewset.as_view({"get": "list"}),
+        name="job_list_api",
+    ),
+    path(
+        "api/v1/metadata/jobs/",
+        JobViewset.as_view({"post": "create"}),
+        name="job_create_api",
+    ),
+    path(
+        "api/v1/metadata/jobs/<int:pk>",
+        JobViewset.as_view({"get": "retrieve"}),
+        name="job_detail_api",
+    ),
+    path(
+        "api/v1/metadata/jobs/<int:pk>/result",
+        JobViewset.as_view({"get": "download"}),
+        name="job_result_api",
+    ),
+    path(
+        "api/v1/metadata/tiles/<int:z>/<int:x>/<int:y>.mvt",
+        DatasetTileView.as_view(),
+        name="dataset_tile_api",
+    ),
+    path(
+        "api/v1/metadata/statistics/",
+        StatisticsView.as_view(),
+        name="statistics_list_api",
+    ),
+    path(
+        "api/v1/metadata/statistics/<str:dimension>",
+        StatisticsView.as_view(),
+        name="statistics_detail_api",
+    ),
+    path(
+        "api/v1/metadata/snapshots/",
+        SnapshotView.as_view(),
+        name="snapshot_manifest_api",
+    ),
+    path(
+        "api/v1/metadata/snapshots/<str:filename>",
+        SnapshotView.as_view(),
+        name="snapshot_file_api",
+    ),
+    path(
+        "api/v1/metadata/conformance/list",
+        ConformanceResultViewset.as_view({"get": "list"}),
+        name="conformance_list_api",
+    ),
+    path(
+        "api/v1/metadata/deleted/list",
+        DeletedRecordViewset.as_view({"get": "list"}),
+        name="deleted_record_list_api",
     ),
     # Pages
 ]
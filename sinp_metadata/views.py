@@ -1,34 +1,395 @@
 import logging
+import os
 
-from django.contrib.auth.mixins import LoginRequiredMixin
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.viewsets import ModelViewSet
+from django.contrib.gis.gdal import SpatialReference, SRSException
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.viewsets import (
+    GenericViewSet,
+    ModelViewSet,
+    ReadOnlyModelViewSet,
+)
 
-from .models import AcquisitionFramework, Organism
+from . import geojson, snapshots
+from .authentication import LoginOrTokenRequiredMixin
+from .bulk import BulkWriteMixin
+from .cloning import clone_acquisition_framework
+from .deletion import BulkDeleteMixin
+from .facets import ACQUISITION_FRAMEWORK_FACETS, DATASET_FACETS, FacetsMixin
+from .harvest import OaiPmh
+from .keywords import autocomplete
+from .models import (
+    AcquisitionFramework,
+    ConformanceResult,
+    Dataset,
+    DeletedRecord,
+    Job,
+    Keyword,
+    Organism,
+)
+from .nomenclature_index import NomenclatureIndexFilterMixin
+from .outbox import TransactionalWriteMixin
 from .permissions import (
     AcquisitionFrameworkListPermissionsMixin,
+    CanEditRecord,
+    DatasetListPermissionsMixin,
+    EditableFilterMixin,
+    HasAllDataAccess,
     IsOrganismManager,
+    filter_visible_datasets,
 )
-from .serializers import AcquisitionFrameworkSerializer, OrganismSerializer
+from .routers import ReplicaReadMixin, use_replica
+from .serializers import (
+    AcquisitionFrameworkCloneSerializer,
+    AcquisitionFrameworkSerializer,
+    AcquisitionFrameworkWriteSerializer,
+    ConformanceResultSerializer,
+    DatasetSerializer,
+    DatasetWriteSerializer,
+    DeletedRecordSerializer,
+    JobSerializer,
+    Keywords,
+    OrganismSerializer,
+)
+from .statistics import BUILDERS, get_statistics
+from .throttling import RateLimitMixin
+from .tiles import MAX_ZOOM, get_tile
 
 logger = logging.getLogger(__name__)
 
 
-class OrganismViewset(LoginRequiredMixin, ModelViewSet):
+class OrganismViewset(LoginOrTokenRequiredMixin, RateLimitMixin, ModelViewSet):
     serializer_class = OrganismSerializer
     permission_classes = [IsAuthenticated, IsOrganismManager]
+    query_budgets = {"list": 2, "retrieve": 2}
 
     def get_queryset(self):
-        return Organism.objects.all()
+        return Organism.objects.prefetch_related("geographic_area")
 
 
 class AcquisitionFrameworkViewset(
-    LoginRequiredMixin,
+    LoginOrTokenRequiredMixin,
+    RateLimitMixin,
+    ReplicaReadMixin,
     AcquisitionFrameworkListPermissionsMixin,
+    EditableFilterMixin,
+    BulkWriteMixin,
+    BulkDeleteMixin,
+    TransactionalWriteMixin,
+    FacetsMixin,
     ModelViewSet,
 ):
     serializer_class = AcquisitionFrameworkSerializer
+    bulk_serializer_class = AcquisitionFrameworkWriteSerializer
+    facet_fields = ACQUISITION_FRAMEWORK_FACETS
+    replica_actions = ("list", "retrieve", "facets")
+    throttle_scopes = {"retrieve": "light", "facets": "light"}
+    # Actor displays are read from cache, one query when it is cold, and
+    # edit rights take one query per page
+    query_budgets = {"list": 7, "retrieve": 7, "facets": 1}
+    permission_classes = [IsAuthenticated, CanEditRecord]
+    queryset = AcquisitionFramework.objects.all()
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        # Serializer relations are only prefetched for reads
+        if self.action in ("list", "retrieve"):
+            qs = qs.for_api()
+        return qs
+
+    def clone(self, request, *args, **kwargs):
+        """Copy the framework with its datasets and M2M links"""
+        options = AcquisitionFrameworkCloneSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
+        try:
+            clone = clone_acquisition_framework(
+                self.get_object(), user=request.user, **options.validated_data
+            )
+        except ValueError as e:
+            raise ValidationError({"dataset_suffix": [str(e)]})
+        serializer = self.get_serializer(clone)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class DatasetViewset(
+    LoginOrTokenRequiredMixin,
+    RateLimitMixin,
+    ReplicaReadMixin,
+    DatasetListPermissionsMixin,
+    EditableFilterMixin,
+    NomenclatureIndexFilterMixin,
+    BulkWriteMixin,
+    BulkDeleteMixin,
+    TransactionalWriteMixin,
+    FacetsMixin,
+    ModelViewSet,
+):
+    serializer_class = DatasetSerializer
+    bulk_serializer_class = DatasetWriteSerializer
+    facet_fields = DATASET_FACETS
+    replica_actions = ("list", "retrieve", "facets")
+    throttle_scopes = {"retrieve": "light", "facets": "light"}
+    query_budgets = {"list": 8, "retrieve": 8, "facets": 1}
+    permission_classes = [IsAuthenticated, CanEditRecord]
+    queryset = Dataset.objects.all()
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        # Serializer relations are only prefetched for reads
+        if self.action in ("list", "retrieve"):
+            qs = qs.for_api()
+        return qs
+
+
+class JobViewset(LoginOrTokenRequiredMixin, RateLimitMixin, ModelViewSet):
+    """Submit and poll background jobs"""
+
+    serializer_class = JobSerializer
     permission_classes = [
         IsAuthenticated,
     ]
-    queryset = AcquisitionFramework.objects.all()
+
+    def get_queryset(self):
+        qs = Job.objects.all()
+        if getattr(self, "swagger_fake_view", False):
+            return qs.none()
+        if not self.request.user.is_superuser:
+            qs = qs.filter(created_by=self.request.user)
+        return qs
+
+    def perform_create(self, serializer):
+        serializer.save(
+            created_by=self.request.user, updated_by=self.request.user
+        )
+
+    def download(self, request, *args, **kwargs):
+        """Result file of a job, only served to its owner"""
+        job = self.get_object()
+        if not job.result:
+            raise NotFound("This job has no result file.")
+        return FileResponse(
+            job.result.open("rb"),
+            as_attachment=True,
+            filename=os.path.basename(job.result.name),
+        )
+
+
+class KeywordViewset(RateLimitMixin, ReplicaReadMixin, GenericViewSet):
+    serializer_class = Keywords
+    replica_actions = ("autocomplete",)
+    throttle_scope = "light"
+    query_budgets = {"autocomplete": 1}
+    permission_classes = [
+        IsAuthenticated,
+    ]
+    queryset = Keyword.objects.all()
+
+    def autocomplete(self, request, *args, **kwargs):
+        """Keywords starting with ``q``, ignoring case and accents"""
+        query = request.query_params.get("q", "")
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", 10)), 50))
+        except ValueError:
+            limit = 10
+        serializer = self.get_serializer(autocomplete(query, limit), many=True)
+        return Response(serializer.data)
+
+
+class OaiPmhView(RateLimitMixin, APIView):
+    """OAI-PMH harvesting endpoint (frameworks and datasets)"""
+
+    throttle_scope = "harvest"
+    permission_classes = [
+        IsAuthenticated,
+    ]
+
+    def get(self, request, *args, **kwargs):
+        return self.harvest(request, request.query_params)
+
+    def post(self, request, *args, **kwargs):
+        return self.harvest(request, request.data)
+
+    def harvest(self, request, params):
+        with use_replica(pin_on_write=False):
+            content = OaiPmh(
+                params,
+                request.user,
+                request.build_absolute_uri(request.path),
+            ).response()
+        return HttpResponse(content, content_type="text/xml; charset=utf-8")
+
+
+class DatasetTileView(RateLimitMixin, APIView):
+    """Dataset footprints as Mapbox vector tiles"""
+
+    throttle_scope = "light"
+    permission_classes = [
+        IsAuthenticated,
+    ]
+
+    def get(self, request, z, x, y, *args, **kwargs):
+        if z > MAX_ZOOM or x >= 2**z or y >= 2**z:
+            raise NotFound()
+        with use_replica(pin_on_write=False):
+            content = get_tile(z, x, y, request.user)
+        if not content:
+            return HttpResponse(status=204)
+        response = HttpResponse(
+            content, content_type="application/vnd.mapbox-vector-tile"
+        )
+        patch_cache_control(response, private=True, max_age=60)
+        return response
+
+
+class DatasetGeoJSONView(RateLimitMixin, APIView):
+    """Dataset extents as a streamed GeoJSON FeatureCollection
+
+    Query parameters: ``srid`` (output projection, default 4326),
+    ``tolerance`` (simplification tolerance, in ``srid`` units) and
+    ``precision`` (number of decimals).
+    """
+
+    throttle_scope = "export"
+    permission_classes = [
+        IsAuthenticated,
+    ]
+
+    def get_params(self, params):
+        errors = {}
+        try:
+            srid = int(params.get("srid", geojson.DEFAULT_SRID))
+            SpatialReference(srid)
+        except (ValueError, SRSException):
+            errors["srid"] = "Unknown spatial reference"
+        try:
+            tolerance = float(params.get("tolerance", 0))
+            if tolerance < 0:
+                raise ValueError
+        except ValueError:
+            errors["tolerance"] = "Expected a positive number"
+        try:
+            precision = int(params.get("precision", geojson.DEFAULT_PRECISION))
+            if not 0 <= precision <= geojson.MAX_PRECISION:
+                raise ValueError
+        except ValueError:
+            errors[
+                "precision"
+            ] = f"Expected an integer between 0 and {geojson.MAX_PRECISION}"
+        if errors:
+            raise ValidationError(errors)
+        return {"srid": srid, "tolerance": tolerance, "precision": precision}
+
+    def get(self, request, *args, **kwargs):
+        params = self.get_params(request.query_params)
+        queryset = filter_visible_datasets(Dataset.objects.all(), request.user)
+        return StreamingHttpResponse(
+            geojson.stream_feature_collection(queryset, **params),
+            content_type="application/geo+json",
+        )
+
+
+class StatisticsView(RateLimitMixin, APIView):
+    """Precomputed catalogue statistics (see ``refresh_statistics``)
+
+    Statistics cover the whole catalogue, so they are restricted to users
+    reading every record.
+    """
+
+    throttle_scope = "light"
+    permission_classes = [
+        HasAllDataAccess,
+    ]
+
+    def get(self, request, dimension=None, *args, **kwargs):
+        if dimension is None:
+            return Response({"dimensions": list(BUILDERS)})
+        if dimension not in BUILDERS:
+            raise NotFound()
+        with use_replica(pin_on_write=False):
+            return Response(get_statistics(dimension))
+
+
+class ConformanceResultViewset(
+    RateLimitMixin, ReplicaReadMixin, ReadOnlyModelViewSet
+):
+    """SINP conformance results (see ``check_conformance``)
+
+    Filters: ``record_type`` and ``conforming`` (true/false).
+    """
+
+    serializer_class = ConformanceResultSerializer
+    pagination_class = LimitOffsetPagination
+    permission_classes = [
+        IsAdminUser,
+    ]
+
+    def get_queryset(self):
+        qs = ConformanceResult.objects.all()
+        if getattr(self, "swagger_fake_view", False):
+            return qs.none()
+        params = self.request.query_params
+        if params.get("record_type"):
+            qs = qs.filter(record_type=params["record_type"])
+        if params.get("conforming") in ("true", "false"):
+            qs = qs.filter(conforming=params["conforming"] == "true")
+        return qs
+
+
+class DeletedRecordViewset(RateLimitMixin, ReadOnlyModelViewSet):
+    """Tombstones of deleted frameworks and datasets
+
+    Filters: ``record_type`` and ``since`` (ISO 8601 date time).
+    """
+
+    serializer_class = DeletedRecordSerializer
+    pagination_class = LimitOffsetPagination
+    # Tombstones carry no visibility, they are restricted to users
+    # reading every record
+    permission_classes = [
+        HasAllDataAccess,
+    ]
+
+    def get_queryset(self):
+        qs = DeletedRecord.objects.all()
+        if getattr(self, "swagger_fake_view", False):
+            return qs.none()
+        params = self.request.query_params
+        if params.get("record_type"):
+            qs = qs.filter(record_type=params["record_type"])
+        if params.get("since"):
+            since = parse_datetime(params["since"])
+            if since is None:
+                raise ValidationError({"since": ["Invalid date time"]})
+            qs = qs.filter(deleted_at__gte=since)
+        return qs
+
+
+class SnapshotView(RateLimitMixin, APIView):
+    """Nightly catalogue snapshots (see ``create_snapshot``)
+
+    Without file name, returns the manifest of the latest snapshot. Files
+    support ``ETag``/``If-None-Match`` and single byte ``Range`` requests.
+    """
+
+    throttle_scope = "snapshot"
+    permission_classes = [
+        HasAllDataAccess,
+    ]
+
+    def get(self, request, filename=None, *args, **kwargs):
+        if filename is None:
+            manifest = snapshots.get_latest_manifest()
+            if manifest is None:
+                raise NotFound("No snapshot available")
+            return Response(manifest)
+        response = snapshots.serve_snapshot_file(request, filename)
+        if response is None:
+            raise NotFound()
+        return response